@@ -1,62 +1,96 @@
-from flask import Flask, render_template_string, request, jsonify, send_file
+from flask import Flask, Request, render_template_string, request, jsonify, send_file
 from werkzeug.utils import secure_filename
+from werkzeug.exceptions import RequestEntityTooLarge
 import os
-import sys
-import subprocess
 from datetime import datetime
 import json
+import pickle
+import re
 import socket
 import tempfile
 import shutil
 import logging
+import time
+import hashlib
+import importlib
+import importlib.util
+import io
+import threading
+import itertools
+import multiprocessing
+import operator
+import contextvars
+import functools
+from contextlib import contextmanager
+from collections import OrderedDict
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
 # Configure logging for Render
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Auto-install required packages
-def install_package(package):
-    try:
-        __import__(package.split('==')[0] if '==' in package else package)
-        logger.info(f"Package {package} already installed")
-    except ImportError:
-        try:
-            logger.info(f"Installing {package}...")
-            subprocess.check_call([sys.executable, '-m', 'pip', 'install', package, '--no-cache-dir'])
-            logger.info(f"Successfully installed {package}")
-        except subprocess.CalledProcessError as e:
-            logger.error(f"Failed to install {package}: {e}")
-
-# Install required packages
-packages = [
-    'flask',
-    'pandas',
-    'openpyxl', 
-    'reportlab',
-    'matplotlib',
-    'numpy'
+import_started = time.perf_counter()
+
+# Pool workers, and the forkserver they start from, import this module too.
+# Threads and start-up work belong to the serving process only; parent_process()
+# cannot tell, as a forkserver child only learns its parent after importing.
+SERVING_PROCESS = multiprocessing.current_process().name == 'MainProcess' and \
+    not getattr(multiprocessing.current_process(), '_inheriting', False)
+
+# Keep matplotlib off any GUI backend for Render
+os.environ.setdefault('MPLBACKEND', 'Agg')
+
+# Dependencies are installed from requirements.txt at build time. Only check
+# they are present here: importing them is deferred so the app can answer
+# / and /health before pandas, matplotlib and reportlab are loaded.
+for module_name in ('pandas', 'numpy', 'openpyxl', 'reportlab', 'matplotlib'):
+    if importlib.util.find_spec(module_name) is None:
+        logger.error(f"Required module {module_name} is not installed; run pip install -r requirements.txt")
+if importlib.util.find_spec('pyarrow') is None:
+    logger.warning("pyarrow is not installed; the workbook cache will store pickles instead of Parquet "
+                   "and monthly snapshots are disabled")
+
+class LazyModule:
+    """Stand-in for a heavy module that imports it on first attribute access"""
+    
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+    
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+pd = LazyModule('pandas')
+np = LazyModule('numpy')
+hr_kpis = LazyModule('hr_kpis')
+
+# Heavy modules used by the analysis and report paths, imported in the
+# background after start-up so the first real request rarely waits for them
+HEAVY_MODULES = [
+    'numpy', 'pandas', 'openpyxl', 'matplotlib.figure', 'matplotlib.backends.backend_agg',
+    'reportlab.platypus', 'reportlab.graphics.charts.barcharts', 'hr_kpis'
 ]
+heavy_modules_ready = threading.Event()
 
-logger.info("Installing required packages...")
-for package in packages:
-    install_package(package)
-
-try:
-    import pandas as pd
-    import numpy as np
-    import matplotlib
-    matplotlib.use('Agg')  # Use non-GUI backend for Render
-    import matplotlib.pyplot as plt
-    from reportlab.lib.pagesizes import letter, A4
-    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image, PageBreak
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.lib import colors
-    from reportlab.lib.units import inch
-    import io
-    logger.info("All modules imported successfully")
-except ImportError as e:
-    logger.error(f"Error importing required modules: {e}")
-    sys.exit(1)
+def prewarm_heavy_modules():
+    """Import HEAVY_MODULES so first use does not pay for them"""
+    start = time.perf_counter()
+    for module_name in HEAVY_MODULES:
+        try:
+            importlib.import_module(module_name)
+        except ImportError as e:
+            logger.error(f"Error importing {module_name}: {e}")
+    heavy_modules_ready.set()
+    logger.info(f"Heavy modules loaded in {time.perf_counter() - start:.2f}s")
+
+prewarm_thread = None
+if os.environ.get('PREWARM_IMPORTS', '1') == '1' and SERVING_PROCESS:
+    prewarm_thread = threading.Thread(target=prewarm_heavy_modules, name='prewarm', daemon=True)
+    prewarm_thread.start()
 
 app = Flask(__name__)
 app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 50MB for Render
@@ -68,67 +102,1737 @@ TEMP_BASE = '/tmp'
 UPLOAD_DIR = os.path.join(TEMP_BASE, 'uploads')
 OUTPUT_DIR = os.path.join(TEMP_BASE, 'output')
 CHART_DIR = os.path.join(TEMP_BASE, 'charts')
+CACHE_DIR = os.environ.get('CACHE_DIR', os.path.join(TEMP_BASE, 'cache'))
+STATE_DIR = os.path.join(TEMP_BASE, 'state')
+CHART_CACHE_DIR = os.path.join(TEMP_BASE, 'chart_cache')
+# Monthly snapshots must outlive deploys: point SNAPSHOT_DIR at a persistent disk
+SNAPSHOT_DIR = os.environ.get('SNAPSHOT_DIR', os.path.join(TEMP_BASE, 'snapshots'))
+# Registered read plans, and proposals for unknown layouts under pending/
+READ_PLAN_DIR = os.environ.get('READ_PLAN_DIR', os.path.join(TEMP_BASE, 'read_plans'))
 
-# Ensure directories exist
-for directory in [UPLOAD_DIR, OUTPUT_DIR, CHART_DIR]:
-    try:
-        os.makedirs(directory, mode=0o755, exist_ok=True)
-        logger.info(f"Directory {directory} created")
-    except Exception as e:
-        logger.error(f"Failed to create {directory}: {e}")
+# Ensure directories exist (pool workers find them made)
+if SERVING_PROCESS:
+    for directory in [UPLOAD_DIR, OUTPUT_DIR, CHART_DIR, CACHE_DIR, CHART_CACHE_DIR, SNAPSHOT_DIR,
+                      os.path.join(READ_PLAN_DIR, 'pending'),
+                      os.path.join(STATE_DIR, 'uploads'), os.path.join(STATE_DIR, 'jobs'),
+                      os.path.join(STATE_DIR, 'reports'), os.path.join(STATE_DIR, 'pins')]:
+        try:
+            os.makedirs(directory, mode=0o755, exist_ok=True)
+            logger.info(f"Directory {directory} created")
+        except Exception as e:
+            logger.error(f"Failed to create {directory}: {e}")
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_DIR
 app.config['OUTPUT_FOLDER'] = OUTPUT_DIR
 app.config['TEMP_FOLDER'] = CHART_DIR
+app.config['CACHE_FOLDER'] = CACHE_DIR
+app.config['STATE_FOLDER'] = STATE_DIR
+app.config['CHART_CACHE_FOLDER'] = CHART_CACHE_DIR
+app.config['SNAPSHOT_FOLDER'] = SNAPSHOT_DIR
+app.config['READ_PLAN_FOLDER'] = READ_PLAN_DIR
+app.config['WORKBOOK_CACHE_MAX_BYTES'] = int(os.environ.get('WORKBOOK_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+
+# Leading rows of each sheet searched for a header row with a registered read plan
+app.config['READ_PLAN_SCAN_ROWS'] = int(os.environ.get('READ_PLAN_SCAN_ROWS', 10))
+
+# Workbooks parsed concurrently per upload; 1 disables the process pool
+app.config['PARSE_WORKERS'] = int(os.environ.get('PARSE_WORKERS', min(4, os.cpu_count() or 1)))
+
+# Charts rendered concurrently per report; 1 renders inline
+app.config['CHART_WORKERS'] = int(os.environ.get('CHART_WORKERS', min(4, os.cpu_count() or 1)))
+
+# Rendered charts are reused across reports: a small in-process tier backed by disk
+app.config['CHART_CACHE_MEMORY_BYTES'] = int(os.environ.get('CHART_CACHE_MEMORY_BYTES', 32 * 1024 * 1024))
+app.config['CHART_CACHE_DISK_BYTES'] = int(os.environ.get('CHART_CACHE_DISK_BYTES', 128 * 1024 * 1024))
+
+# Bump when create_simple_chart's look changes so cached charts are re-rendered
+CHART_STYLE_VERSION = 1
+
+# 'vector' draws charts as reportlab graphics (sharp in print); 'png' embeds
+# matplotlib rasters. Vector charts fall back to PNG if they cannot be drawn.
+app.config['CHART_FORMAT'] = os.environ.get('CHART_FORMAT', 'vector')
+
+# Workbooks above this size are streamed in row chunks instead of loaded whole
+app.config['STREAMING_THRESHOLD_BYTES'] = int(os.environ.get('STREAMING_THRESHOLD_BYTES', 20 * 1024 * 1024))
+app.config['STREAM_CHUNK_ROWS'] = int(os.environ.get('STREAM_CHUNK_ROWS', 50000))
+
+# Loaded sheets are compacted; text columns with at most this share of
+# distinct values are held as categoricals
+app.config['COMPACT_CATEGORY_RATIO'] = float(os.environ.get('COMPACT_CATEGORY_RATIO', 0.5))
+
+# Parsed sheets one upload request may hold in memory (0 disables). Before
+# parsing a file is estimated at WORKBOOK_MEMORY_FACTOR times its size (sheets
+# peak there before compaction); .xlsx files that would not fit are streamed
+# instead and anything else is refused
+app.config['REQUEST_MEMORY_BUDGET_BYTES'] = int(os.environ.get('REQUEST_MEMORY_BUDGET_BYTES', 512 * 1024 * 1024))
+app.config['WORKBOOK_MEMORY_FACTOR'] = float(os.environ.get('WORKBOOK_MEMORY_FACTOR', 8))
+
+# Uploaded files are hashed while the request body is read and kept in memory
+# up to this size; larger files are spooled to UPLOAD_FOLDER instead
+app.config['UPLOAD_SPOOL_THRESHOLD_BYTES'] = int(os.environ.get('UPLOAD_SPOOL_THRESHOLD_BYTES', 8 * 1024 * 1024))
+app.config['MAX_UPLOAD_FILE_BYTES'] = int(os.environ.get('MAX_UPLOAD_FILE_BYTES', app.config['MAX_CONTENT_LENGTH']))
+
+# Rows sampled per sheet (or chunk) when classifying column types
+app.config['PROFILE_SAMPLE_ROWS'] = int(os.environ.get('PROFILE_SAMPLE_ROWS', 10000))
 
-# Global variables
-uploaded_files = []
-report_data = {}
+# Distinct values tracked per categorical column before counts become approximate
+app.config['TOPK_SKETCH_CAPACITY'] = int(os.environ.get('TOPK_SKETCH_CAPACITY', 256))
 
-def detect_column_type(series, column_name):
-    """Simple column type detection"""
+# Centroids kept per numeric column; below this many values quantiles are exact
+app.config['QUANTILE_SKETCH_CENTROIDS'] = int(os.environ.get('QUANTILE_SKETCH_CENTROIDS', 512))
+
+# Bradford factor (spells squared times days lost) over a rolling window of
+# this many days, banded by the lowest score of each trigger level
+app.config['BRADFORD_WINDOW_DAYS'] = int(os.environ.get('BRADFORD_WINDOW_DAYS', 364))
+app.config['BRADFORD_BANDS'] = [
+    (0, 'No concern'),
+    (51, 'Monitor'),
+    (125, 'Stage 1 review'),
+    (400, 'Stage 2 review'),
+    (650, 'Final review'),
+]
+app.config['BRADFORD_TOP_N'] = int(os.environ.get('BRADFORD_TOP_N', 10))
+
+# Monthly headcount and turnover cover this many months up to the latest
+# hire or termination in the data
+app.config['TURNOVER_MONTHS'] = int(os.environ.get('TURNOVER_MONTHS', 12))
+
+# Sick-leave spells longer than this many calendar days are long-term, per
+# site code or country (from the sick leave workbook's definitions sheets)
+app.config['SICK_LEAVE_SHORT_TERM_DAYS'] = {
+    'default': 14,
+    'SE': 14, 'PAGO': 14, 'PASI': 14, 'PAIN': 14,
+    'NO': 15, 'PARA': 15,
+    'BE': 30, 'PAGE': 30,
+    'CZ': 14, 'PAST': 14,
+    'PT': 30, 'PACA': 30,
+}
+
+# Public holidays excluded from working days, as JSON mapping a site code,
+# country or 'default' to a list of ISO dates
+app.config['PUBLIC_HOLIDAYS'] = {}
+if os.environ.get('PUBLIC_HOLIDAYS_FILE'):
+    with open(os.environ['PUBLIC_HOLIDAYS_FILE']) as holidays_file:
+        app.config['PUBLIC_HOLIDAYS'] = json.load(holidays_file)
+
+# Trend sections cover this many reporting months from the snapshot store
+app.config['TREND_MONTHS'] = int(os.environ.get('TREND_MONTHS', 12))
+# Also archive a raw copy of every cleaned sheet in the snapshot store (a full copy per upload)
+app.config['SNAPSHOT_SHEETS'] = os.environ.get('SNAPSHOT_SHEETS', '0') == '1'
+
+# Report builds run concurrently in a background pool, each in its own workspace
+app.config['REPORT_WORKERS'] = int(os.environ.get('REPORT_WORKERS', min(4, os.cpu_count() or 1)))
+
+# Upload/analysis state and report jobs live in STATE_DIR so every gunicorn
+# worker sees them; entries expire this long after their last use
+app.config['STATE_TTL_SECONDS'] = {
+    'uploads': int(os.environ.get('UPLOAD_STATE_TTL_SECONDS', 4 * 3600)),
+    'jobs': int(os.environ.get('REPORT_JOB_TTL_SECONDS', 3600)),
+    'reports': int(os.environ.get('REPORT_MEMO_TTL_SECONDS', 24 * 3600)),
+}
+
+# A background sweeper keeps uploads, generated PDFs and cached charts within
+# these byte budgets and ages (since last use). Files still referenced by a
+# live upload session or report job are pinned and never evicted.
+app.config['STORAGE_MAX_BYTES'] = {
+    'uploads': int(os.environ.get('UPLOAD_STORAGE_MAX_BYTES', 512 * 1024 * 1024)),
+    'outputs': int(os.environ.get('OUTPUT_STORAGE_MAX_BYTES', 256 * 1024 * 1024)),
+    'charts': app.config['CHART_CACHE_DISK_BYTES'],
+}
+app.config['STORAGE_MAX_AGE_SECONDS'] = {
+    'uploads': int(os.environ.get('UPLOAD_MAX_AGE_SECONDS', 24 * 3600)),
+    'outputs': int(os.environ.get('OUTPUT_MAX_AGE_SECONDS', 24 * 3600)),
+    'charts': int(os.environ.get('CHART_CACHE_MAX_AGE_SECONDS', 7 * 24 * 3600)),
+}
+# Seconds between sweeps; 0 disables the sweeper
+app.config['STORAGE_SWEEP_INTERVAL_SECONDS'] = int(os.environ.get('STORAGE_SWEEP_INTERVAL_SECONDS', 300))
+# Half-written spools, temp files and build workspaces older than this are
+# left over from a crashed worker
+app.config['ORPHAN_MAX_AGE_SECONDS'] = int(os.environ.get('ORPHAN_MAX_AGE_SECONDS', 3600))
+
+# Bump when the PDF layout changes so memoized reports are rebuilt
+REPORT_TEMPLATE_VERSION = 5
+
+# KPIs shown in the trend section: (dataset, kpi, column heading, format)
+TREND_KPIS = [
+    ('turnover', 'headcount', 'Headcount', '{:,.0f}'),
+    ('turnover', 'leavers', 'Leavers', '{:,.0f}'),
+    ('turnover', 'annualized_turnover', 'Turnover (ann.)', '{:.1%}'),
+    ('sick_leave', 'absence_rate', 'Sick rate', '{:.1%}'),
+    ('sick_leave', 'long_term_spells', 'LT sick spells', '{:,.0f}'),
+    ('bradford', 'flagged', 'Bradford flagged', '{:,.0f}'),
+    ('bradford_series', 'score', 'Bradford (export)', '{:.1%}'),
+]
+
+# Bump when clean_sheet, compact_frame or the manifest changes so stale cache entries are ignored
+WORKBOOK_CACHE_VERSION = 3
+workbook_cache_lock = threading.Lock()
+process_pools = {}
+process_pools_lock = threading.Lock()
+chart_cache = OrderedDict()
+chart_cache_bytes = 0
+chart_cache_lock = threading.Lock()
+report_pool = ThreadPoolExecutor(max_workers=app.config['REPORT_WORKERS'], thread_name_prefix='report')
+
+# Upper bounds in seconds of the stage duration histogram buckets
+STAGE_SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+stage_metrics = {}
+stage_metrics_lock = threading.Lock()
+# Spans finished in the current request or job, when something is collecting them
+span_log = contextvars.ContextVar('span_log', default=None)
+
+def process_memory():
+    """(resident, peak resident) memory of this process in bytes"""
+    rss = peak = 0
     try:
-        clean_series = series.dropna()
-        if len(clean_series) == 0:
-            return 'empty'
-        
-        column_name_lower = str(column_name).lower().strip()
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    rss = int(line.split()[1]) * 1024
+                elif line.startswith('VmHWM:'):
+                    peak = int(line.split()[1]) * 1024
+    except OSError:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return rss, peak
+
+def record_span(span):
+    """Add a finished span to its stage's histogram and to the active span log"""
+    with stage_metrics_lock:
+        metric = stage_metrics.setdefault(span['stage'], {
+            'buckets': [0] * len(STAGE_SECONDS_BUCKETS), 'count': 0, 'seconds': 0.0,
+            'rows': 0, 'bytes': 0, 'peak_rss_bytes': 0
+        })
+        for index, bound in enumerate(STAGE_SECONDS_BUCKETS):
+            if span['seconds'] <= bound:
+                metric['buckets'][index] += 1
+        metric['count'] += 1
+        metric['seconds'] += span['seconds']
+        metric['rows'] += span.get('rows') or 0
+        metric['bytes'] += span.get('bytes') or 0
+        metric['peak_rss_bytes'] = max(metric['peak_rss_bytes'], span['peak_rss_bytes'])
+    log = span_log.get()
+    if log is not None:
+        log.append(span)
+
+@contextmanager
+def stage_span(stage, **fields):
+    """Time the enclosed block as one span of stage.
+
+    The block may set span['rows'] and span['bytes']; extra keyword fields
+    (sheet or chart names) only appear in per-request breakdowns. Memory is
+    sampled when the span ends: peak_rss_bytes is the process high-water
+    mark so far, not the span's own peak.
+    """
+    span = {'stage': stage, 'rows': None, 'bytes': None, **fields}
+    start = time.perf_counter()
+    try:
+        yield span
+    finally:
+        span['seconds'] = round(time.perf_counter() - start, 6)
+        span['rss_bytes'], span['peak_rss_bytes'] = process_memory()
+        span['pid'] = os.getpid()
+        record_span(span)
+
+@contextmanager
+def collect_spans():
+    """Gather the spans finished inside the block into a list (nested collectors see them too)"""
+    spans = []
+    token = span_log.set(spans)
+    try:
+        yield spans
+    finally:
+        span_log.reset(token)
+        outer = span_log.get()
+        if outer is not None:
+            outer.extend(spans)
+
+def adopt_spans(spans):
+    """Record spans a pool worker returned; its own metrics are never scraped"""
+    for span in spans:
+        if span['pid'] != os.getpid():
+            record_span(span)
+
+def init_pool_worker(config):
+    """Pool worker initializer: adopt the parent's app config and start with no span log"""
+    app.config.update(config)
+    span_log.set(None)
+
+def timing_breakdown(spans, total_seconds):
+    """Per-stage totals plus the individual spans, for JSON responses"""
+    stages = {}
+    for span in spans:
+        stage = stages.setdefault(span['stage'], {'count': 0, 'seconds': 0.0, 'rows': 0, 'bytes': 0})
+        stage['count'] += 1
+        stage['seconds'] = round(stage['seconds'] + span['seconds'], 6)
+        stage['rows'] += span.get('rows') or 0
+        stage['bytes'] += span.get('bytes') or 0
+    return {'total_seconds': round(total_seconds, 6), 'stages': stages,
+            'peak_rss_bytes': max((span['peak_rss_bytes'] for span in spans), default=process_memory()[1]),
+            'spans': spans}
+
+def with_timing_breakdown(view):
+    """Collect a view's spans; with ?timings=1 add their breakdown to its JSON body"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        with collect_spans() as spans:
+            response = app.make_response(view(*args, **kwargs))
+        if request.args.get('timings') == '1' and response.is_json:
+            body = response.get_json()
+            if isinstance(body, dict):
+                body['timings'] = timing_breakdown(spans, time.perf_counter() - start)
+                response.set_data(app.json.dumps(body))
+        return response
+    return wrapper
+
+def _state_path(kind, key):
+    """Path of a state entry; keys are uuid hex so they are safe file names"""
+    if not re.fullmatch(r'[0-9a-f]{32}', str(key)):
+        return None
+    return os.path.join(app.config['STATE_FOLDER'], kind, f"{key}.pkl")
+
+def save_state(kind, key, value):
+    """Atomically write a state entry shared by all worker processes"""
+    path = _state_path(kind, key)
+    fd, tmp_path = tempfile.mkstemp(prefix='.tmp_', dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def load_state(kind, key):
+    """Read a state entry, or None if it is missing or has expired"""
+    path = _state_path(kind, key)
+    if path is None or not os.path.exists(path):
+        return None
+    
+    try:
+        if time.time() - os.path.getmtime(path) > app.config['STATE_TTL_SECONDS'][kind]:
+            os.remove(path)
+            return None
+        with open(path, 'rb') as f:
+            value = pickle.load(f)
+        # Reading counts as use, so active sessions keep their state alive
+        os.utime(path)
+        return value
+    except (OSError, pickle.UnpicklingError, EOFError) as e:
+        logger.warning(f"Could not read {kind} state {key}: {e}")
+        return None
+
+def evict_expired_state():
+    """Delete state entries that have outlived their TTL"""
+    now = time.time()
+    for kind, ttl in app.config['STATE_TTL_SECONDS'].items():
+        folder = os.path.join(app.config['STATE_FOLDER'], kind)
+        for name in os.listdir(folder):
+            path = os.path.join(folder, name)
+            try:
+                if now - os.path.getmtime(path) > ttl:
+                    os.remove(path)
+            except OSError:
+                continue
+
+# Text date formats tried, in order, when proposing a read plan
+READ_PLAN_DATE_FORMATS = ['%Y-%m-%d', '%d/%m/%Y', '%d.%m.%Y', '%m/%d/%Y', '%Y%m%d', '%d-%m-%Y']
+read_plans_cache = {'stamp': None, 'plans': {}}
+read_plans_lock = threading.Lock()
+
+def header_fingerprint(cells):
+    """Hash of a header row's normalized cells; None for rows too sparse to be a header"""
+    names = ['' if cell is None or (isinstance(cell, float) and cell != cell) else str(cell).strip().lower()
+             for cell in cells]
+    while names and not names[-1]:
+        names.pop()
+    if sum(1 for name in names if name) < 2:
+        return None
+    return hashlib.sha256('\x1f'.join(names).encode('utf-8')).hexdigest()[:16]
+
+def load_read_plans():
+    """Registered read plans by fingerprint, re-read when the plan folder changes"""
+    folder = app.config['READ_PLAN_FOLDER']
+    try:
+        stamp = os.stat(folder).st_mtime_ns
+    except OSError:
+        return {}
+    with read_plans_lock:
+        if read_plans_cache['stamp'] != stamp:
+            plans = {}
+            for name in os.listdir(folder):
+                if not name.endswith('.json'):
+                    continue
+                try:
+                    with open(os.path.join(folder, name)) as f:
+                        plan = json.load(f)
+                    plans[plan['fingerprint']] = plan
+                except (OSError, ValueError, KeyError) as e:
+                    logger.warning(f"Ignoring unreadable read plan {name}: {e}")
+            read_plans_cache.update(stamp=stamp, plans=plans)
+        return read_plans_cache['plans']
+
+def read_plans_stamp():
+    """Short digest of the registered plans, '' when there are none"""
+    plans = load_read_plans()
+    if not plans:
+        return ''
+    return hashlib.sha256(json.dumps(plans, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+def find_read_plan(rows):
+    """(header row offset, plan) for the first of rows whose fingerprint has a plan, else (None, None)"""
+    plans = load_read_plans()
+    if not plans:
+        return None, None
+    for offset, row in enumerate(rows):
+        plan = plans.get(header_fingerprint(row))
+        if plan is not None and plan['header'] == offset:
+            return offset, plan
+    return None, None
+
+def apply_read_plan(df, plan):
+    """Give df's columns the plan's types, recording them in df.attrs for the profiler.
+
+    Numeric columns are converted leniently: cells that are not numbers
+    become NaN, and an Int64 column (from plans proposed before numeric
+    columns defaulted to float64) that holds fractions is kept as float64.
+    Other declared casts raise ValueError or TypeError when the data does
+    not fit them.
+    """
+    types = {}
+    for col, dtype in plan['dtypes'].items():
+        if col not in df:
+            continue
+        if str(df[col].dtype) != dtype:
+            if dtype in ('float64', 'Float64', 'Int64'):
+                values = pd.to_numeric(df[col], errors='coerce')
+                if dtype == 'Int64' and not (values.dropna() % 1 == 0).all():
+                    dtype = 'float64'
+                df[col] = values.astype(dtype)
+            else:
+                df[col] = df[col].astype(dtype)
+        types[col] = 'numeric'
+    for col, date_format in plan['dates'].items():
+        if col in df:
+            if not pd.api.types.is_datetime64_any_dtype(df[col]):
+                df[col] = pd.to_datetime(df[col], format=date_format, errors='coerce')
+            types[col] = 'date'
+    for col in plan['categoricals']:
+        if col in df:
+            if not isinstance(df[col].dtype, pd.CategoricalDtype):
+                df[col] = df[col].astype('category')
+            types[col] = 'categorical'
+    df.attrs['column_types'] = types
+    return df
+
+def guess_header_offset(rows):
+    """Index of the row among rows with the most text cells (the likely header)"""
+    counts = [sum(1 for cell in row if isinstance(cell, str) and cell.strip()) for row in rows]
+    return counts.index(max(counts)) if counts and max(counts) > 0 else 0
+
+def pending_read_plan_path(fingerprint):
+    return os.path.join(app.config['READ_PLAN_FOLDER'], 'pending', f"{fingerprint}.json")
+
+def propose_read_plan(sheet_name, offset, fingerprint, df):
+    """Write a pending read plan for an unknown layout from a sample of it.
+
+    df is (a sample of) the sheet parsed and cleaned from header row offset.
+    The proposal keeps df's non-empty columns with the types profile_columns
+    gives them, and stays under pending/ until registered through
+    /read_plans. Numeric columns are declared float64: a sample that happens
+    to be integral says nothing about next month's file.
+    """
+    path = pending_read_plan_path(fingerprint)
+    types = profile_columns(df)
+    plan = {'fingerprint': fingerprint, 'sheet': sheet_name, 'header': offset,
+            'columns': [col for col, col_type in types.items() if col_type != 'empty'],
+            'dtypes': {}, 'dates': {}, 'categoricals': [], 'proposed': time.time()}
+    for col, col_type in types.items():
+        if col_type == 'numeric':
+            plan['dtypes'][col] = 'float64'
+        elif col_type == 'date':
+            date_format = None
+            values = df[col].dropna()
+            if values.dtype == object:
+                sample = values.astype(str).head(200)
+                date_format = next((candidate for candidate in READ_PLAN_DATE_FORMATS
+                                    if pd.to_datetime(sample, format=candidate, errors='coerce').notna().all()), None)
+            plan['dates'][col] = date_format
+        elif col_type == 'categorical':
+            plan['categoricals'].append(col)
+    
+    fd, tmp_path = tempfile.mkstemp(prefix='.tmp_', dir=os.path.dirname(path))
+    with os.fdopen(fd, 'w') as f:
+        json.dump(plan, f, indent=1, default=str)
+    os.replace(tmp_path, path)
+    logger.info(f"Proposed read plan {fingerprint} for sheet {sheet_name} (header row {offset})")
+
+def frame_rows(rows, header, **kwargs):
+    """Frame rows of sheet cells as pd.read_excel(header=header) frames the sheet.
+
+    This is the parser read_excel itself runs on a sheet's cells, so a
+    sheet read once can be framed from any header row without reading it
+    again. kwargs (e.g. usecols) go to the parser.
+    """
+    from pandas.io.parsers import TextParser
+    
+    if len(rows) <= header:
+        return pd.DataFrame()
+    return TextParser(rows, header=header, skip_blank_lines=False, **kwargs).read()
+
+def read_sheet(excel_file, sheet_name):
+    """Parse one sheet with its registered read plan, or generically.
+
+    The sheet's cells are read once, untyped; the header row is looked up
+    in the first of them and the frame is built from that same read.
+    Returns (df, layout) where layout reports the sheet's header
+    fingerprint and whether a plan was applied ('applied', with df cleaned
+    and typed), did not fit the data ('mismatch') or was proposed.
+    """
+    rows = excel_file.parse(sheet_name, header=None, dtype=object, na_filter=False).values.tolist()
+    scan = rows[:app.config['READ_PLAN_SCAN_ROWS']]
+    offset, plan = find_read_plan(scan)
+    if plan is not None:
+        wanted = set(plan['columns'])
+        df = clean_sheet(frame_rows(rows, offset, usecols=lambda col: str(col).strip() in wanted))
+        try:
+            return apply_read_plan(df, plan), {'fingerprint': plan['fingerprint'], 'plan': 'applied'}
+        except (ValueError, TypeError) as e:
+            # Rather the sheet untyped, from the plan's header row, than no sheet at all
+            logger.warning(f"Sheet {sheet_name} does not fit read plan {plan['fingerprint']}, "
+                           f"reading it without the plan's types: {e}")
+            return frame_rows(rows, offset), {'fingerprint': plan['fingerprint'], 'plan': 'mismatch'}
+    
+    df = frame_rows(rows, 0)
+    
+    # Unknown layout: propose a plan from its likely header row, once
+    offset = guess_header_offset(scan)
+    fingerprint = header_fingerprint(scan[offset]) if scan else None
+    if fingerprint is None:
+        return df, {'fingerprint': None, 'plan': None}
+    if not os.path.exists(pending_read_plan_path(fingerprint)) and fingerprint not in load_read_plans():
+        try:
+            sample_rows = app.config['PROFILE_SAMPLE_ROWS']
+            sample = df.head(sample_rows) if offset == 0 else frame_rows(rows[:offset + 1 + sample_rows], offset)
+            propose_read_plan(sheet_name, offset, fingerprint, clean_sheet(sample.copy()))
+        except Exception as e:
+            logger.warning(f"Could not propose a read plan for sheet {sheet_name}: {e}")
+            return df, {'fingerprint': fingerprint, 'plan': None}
+    return df, {'fingerprint': fingerprint, 'plan': 'proposed'}
+
+def register_read_plan(fingerprint):
+    """Promote a pending read plan so later uploads of its layout use it; False if none is pending"""
+    folder = app.config['READ_PLAN_FOLDER']
+    pending = os.path.join(folder, 'pending', f"{fingerprint}.json")
+    if not re.fullmatch(r'[0-9a-f]{16}', fingerprint) or not os.path.exists(pending):
+        return False
+    os.replace(pending, os.path.join(folder, f"{fingerprint}.json"))
+    logger.info(f"Registered read plan {fingerprint}")
+    return True
+
+def clean_sheet(df):
+    """Strip header whitespace and drop fully empty rows and columns"""
+    df.columns = df.columns.astype(str).str.strip()
+    return df.dropna(how='all').dropna(axis=1, how='all')
+
+def frame_memory(df):
+    """Bytes df holds, including the Python strings in object columns"""
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+def compact_frame(df):
+    """Store a loaded sheet in its smallest faithful dtypes.
+
+    Text columns with few distinct values become categoricals, text columns
+    named like dates that parse completely become datetime64, and integer
+    (or integral float) columns without gaps are downcast to the smallest
+    integer type. Floats with fractions keep float64 so totals do not drift.
+    Columns typed by a read plan keep their declared dtypes. Small integer
+    types are for storage only: analyze_excel_data and hr_kpis upcast
+    numeric columns to float64 before any arithmetic. Returns
+    (df, bytes before, bytes after).
+    """
+    before = frame_memory(df)
+    declared = df.attrs.get('column_types', {})
+    ratio = app.config['COMPACT_CATEGORY_RATIO']
+    for position, col in enumerate(df.columns):
+        if col in declared:
+            continue
+        series = df.iloc[:, position]
+        if series.dtype == object:
+            if pd.api.types.infer_dtype(series, skipna=True) != 'string':
+                continue
+            non_null = int(series.notna().sum())
+            if re.search('date|time|birth|hire', str(col).lower()):
+                parsed = pd.to_datetime(series, errors='coerce')
+                if int(parsed.notna().sum()) == non_null:
+                    df.isetitem(position, parsed)
+                    continue
+            if series.nunique(dropna=True) <= ratio * non_null:
+                df.isetitem(position, series.astype('category'))
+        elif pd.api.types.is_integer_dtype(series) and series.dtype.kind in 'iu':
+            df.isetitem(position, pd.to_numeric(series, downcast='integer'))
+        elif series.dtype.kind == 'f' and series.notna().all():
+            # to_numeric only downcasts floats to integers when every value is whole
+            df.isetitem(position, pd.to_numeric(series, downcast='integer'))
+    return df, before, frame_memory(df)
+
+def load_workbook_sheets(source):
+    """Parse every sheet of a workbook from a single open of the file.
+
+    pd.read_excel(filepath, sheet_name=...) unzips and re-parses the whole
+    workbook on every call, so the workbook is opened once with ExcelFile and
+    each sheet is parsed from that handle, through its read plan when its
+    header layout has one. source is a file path or the workbook's bytes.
+    Returns (sheets, timings) where timings holds the open time, the
+    per-sheet parse times in seconds, layouts and compacted sizes in bytes,
+    and the stage spans, which the caller passes to adopt_spans when this
+    ran in a pool worker.
+    """
+    timings = {'open_seconds': 0.0, 'sheets': {}, 'layouts': {}, 'memory_bytes': {}, 'total_seconds': 0.0}
+    sheets = {}
+    start = time.perf_counter()
+    label = source if isinstance(source, str) else f"{len(source)}-byte upload"
+    size = os.path.getsize(source) if isinstance(source, str) else len(source)
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    
+    with collect_spans() as spans:
+        with stage_span('open_workbook', bytes=size):
+            excel_file = pd.ExcelFile(source)
+        timings['open_seconds'] = round(time.perf_counter() - start, 4)
         
-        # Check for date columns
-        if any(keyword in column_name_lower for keyword in ['date', 'time', 'birth', 'hire']):
+        with excel_file:
+            for sheet_name in excel_file.sheet_names:
+                sheet_start = time.perf_counter()
+                try:
+                    with stage_span('read_sheet', sheet=sheet_name) as span:
+                        df, layout = read_sheet(excel_file, sheet_name)
+                        span.update(rows=len(df), plan=layout['plan'])
+                    with stage_span('clean', sheet=sheet_name) as span:
+                        if layout['plan'] != 'applied':
+                            df = clean_sheet(df)
+                        span['rows'] = len(df)
+                    timings['layouts'][sheet_name] = layout
+                    if not df.empty:
+                        with stage_span('compact', sheet=sheet_name) as span:
+                            df, before, after = compact_frame(df)
+                            span.update(bytes_before=before, bytes_after=after)
+                        timings['memory_bytes'][sheet_name] = after
+                        sheets[sheet_name] = df
+                        logger.info(f"Read sheet {sheet_name}: {len(df)} rows, "
+                                    f"{before / 1024 ** 2:.1f} MB -> {after / 1024 ** 2:.1f} MB in memory")
+                except Exception as e:
+                    logger.warning(f"Could not read sheet {sheet_name}: {e}")
+                timings['sheets'][sheet_name] = round(time.perf_counter() - sheet_start, 4)
+    
+    timings['spans'] = spans
+    timings['total_seconds'] = round(time.perf_counter() - start, 4)
+    logger.info(f"Loaded {label} in {timings['total_seconds']}s "
+                f"(open {timings['open_seconds']}s, {len(timings['sheets'])} sheets)")
+    return sheets, timings
+
+def get_process_pool(name):
+    """Lazily create the named process pool (after any gunicorn fork).
+
+    Pool sizes come from app.config['<NAME>_WORKERS'], e.g. PARSE_WORKERS.
+    Workers start from a forkserver rather than a fork of this process, so
+    locks held by its request, report and sweeper threads (imports, metrics,
+    chart cache, logging) are never copied into them locked; they re-import
+    this module and are handed the current app config.
+    """
+    with process_pools_lock:
+        if name not in process_pools:
+            workers = app.config[f'{name.upper()}_WORKERS']
+            config = {}
+            for key, value in app.config.items():
+                try:
+                    pickle.dumps(value)
+                except Exception:
+                    continue
+                config[key] = value
+            process_pools[name] = ProcessPoolExecutor(max_workers=workers,
+                                                      mp_context=multiprocessing.get_context('forkserver'),
+                                                      initializer=init_pool_worker, initargs=(config,))
+            logger.info(f"Started {name} pool with {workers} workers")
+        return process_pools[name]
+
+def reset_process_pool(name):
+    """Discard a (broken) pool so the next caller starts a fresh one"""
+    with process_pools_lock:
+        pool = process_pools.pop(name, None)
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def parse_workbooks(sources):
+    """Parse several workbooks, in parallel when more than one worker is configured.
+
+    sources are file paths or workbook bytes. Returns a list aligned with
+    sources holding either (sheets, timings) or the exception raised for that
+    file, so one bad workbook never fails the others.
+    """
+    results = []
+    if app.config['PARSE_WORKERS'] <= 1 or len(sources) <= 1:
+        for source in sources:
+            try:
+                results.append(load_workbook_sheets(source))
+            except Exception as e:
+                results.append(e)
+        return results
+    
+    pool = get_process_pool('parse')
+    futures = [pool.submit(load_workbook_sheets, source) for source in sources]
+    for future in futures:
+        try:
+            results.append(future.result())
+        except BrokenProcessPool as e:
+            reset_process_pool('parse')
+            results.append(e)
+        except Exception as e:
+            results.append(e)
+    return results
+
+class UploadSpool:
+    """Destination for one uploaded file that hashes its bytes as they arrive.
+
+    Werkzeug writes each file part here while it reads the request body, so
+    the body is read once: the SHA-256 and size are known when parsing ends,
+    files up to UPLOAD_SPOOL_THRESHOLD_BYTES stay in memory and larger ones
+    roll over to a spool file in UPLOAD_FOLDER. Writing more than
+    MAX_UPLOAD_FILE_BYTES raises RequestEntityTooLarge. Reads, seeks and
+    the rest of the file API go to the underlying buffer or file.
+    """
+    
+    def __init__(self):
+        self._file = io.BytesIO()
+        self._digest = hashlib.sha256()
+        self.size = 0
+        self.path = None
+        self.persisted = False
+    
+    def write(self, data):
+        self.size += len(data)
+        if self.size > app.config['MAX_UPLOAD_FILE_BYTES']:
+            raise RequestEntityTooLarge(f"Each file may be at most {app.config['MAX_UPLOAD_FILE_BYTES']} bytes")
+        self._digest.update(data)
+        if self.path is None and self.size > app.config['UPLOAD_SPOOL_THRESHOLD_BYTES']:
+            fd, self.path = tempfile.mkstemp(prefix='.spool_', suffix='.part', dir=app.config['UPLOAD_FOLDER'])
+            spooled = os.fdopen(fd, 'w+b')
+            spooled.write(self._file.getbuffer())
+            self._file = spooled
+        return self._file.write(data)
+    
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+    
+    def hexdigest(self):
+        return self._digest.hexdigest()
+    
+    def getvalue(self):
+        """The file's bytes; only for spools still held in memory"""
+        return self._file.getvalue()
+    
+    def persist(self, filepath):
+        """Move a spooled file to filepath so it outlives the request"""
+        self._file.flush()
+        os.replace(self.path, filepath)
+        self.path = filepath
+        self.persisted = True
+    
+    def discard(self):
+        """Free the buffer and delete the spool file unless it was persisted"""
+        self._file.close()
+        if self.path and not self.persisted:
             try:
-                pd.to_datetime(clean_series.head(5), errors='raise')
-                return 'date'
-            except:
+                os.remove(self.path)
+            except OSError:
                 pass
+
+class UploadRequest(Request):
+    """Request whose file parts are written to UploadSpools"""
+    
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        spool = UploadSpool()
+        if not hasattr(self, 'upload_spools'):
+            self.upload_spools = []
+        self.upload_spools.append(spool)
+        return spool
+
+app.request_class = UploadRequest
+
+@app.teardown_request
+def discard_upload_spools(exc):
+    for spool in getattr(request, 'upload_spools', []):
+        spool.discard()
+
+def ingest_upload(file):
+    """The UploadSpool holding file, copying the stream only if it is not one"""
+    if isinstance(file.stream, UploadSpool):
+        return file.stream
+    spool = request._get_file_stream(None, file.content_type, file.filename)
+    for chunk in iter(lambda: file.stream.read(1024 * 1024), b''):
+        spool.write(chunk)
+    return spool
+
+def load_cached_workbook(digest):
+    """Return (cleaned sheets, sheet layouts) stored for digest, or (None, {}) on a cache miss"""
+    entry_dir = os.path.join(app.config['CACHE_FOLDER'], digest)
+    manifest_path = os.path.join(entry_dir, 'manifest.json')
+    if not os.path.exists(manifest_path):
+        return None, {}
+    
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if manifest.get('version') != WORKBOOK_CACHE_VERSION:
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            return None, {}
+        
+        sheets = {}
+        for sheet in manifest['sheets']:
+            sheet_path = os.path.join(entry_dir, sheet['file'])
+            if sheet['format'] == 'parquet':
+                sheets[sheet['name']] = pd.read_parquet(sheet_path)
+                # Parquet drops attrs; restore the read plan's declared types
+                sheets[sheet['name']].attrs.update(sheet.get('attrs', {}))
+            else:
+                sheets[sheet['name']] = pd.read_pickle(sheet_path)
+        
+        # Touch the manifest so eviction sees this entry as recently used
+        os.utime(manifest_path)
+        return sheets, manifest['layouts']
+    except Exception as e:
+        logger.warning(f"Discarding unreadable cache entry {digest}: {e}")
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        return None, {}
+
+def store_cached_workbook(digest, sheets, layouts):
+    """Persist cleaned sheets and their layouts under digest, then enforce the cache size budget"""
+    cache_dir = app.config['CACHE_FOLDER']
+    entry_dir = os.path.join(cache_dir, digest)
+    if os.path.exists(entry_dir):
+        return
+    
+    tmp_dir = tempfile.mkdtemp(prefix='.tmp_', dir=cache_dir)
+    try:
+        manifest = {'version': WORKBOOK_CACHE_VERSION, 'sheets': [], 'layouts': layouts}
+        for index, (sheet_name, df) in enumerate(sheets.items()):
+            # Parquet is the fast path; sheets it cannot represent (mixed-type
+            # object columns, duplicate headers) fall back to pickle
+            try:
+                sheet_file = f"{index}.parquet"
+                df.to_parquet(os.path.join(tmp_dir, sheet_file))
+                sheet_format = 'parquet'
+            except Exception:
+                sheet_file = f"{index}.pkl"
+                df.to_pickle(os.path.join(tmp_dir, sheet_file))
+                sheet_format = 'pickle'
+            manifest['sheets'].append({'name': sheet_name, 'file': sheet_file, 'format': sheet_format,
+                                       'attrs': df.attrs})
+        
+        with open(os.path.join(tmp_dir, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f)
         
-        # Check if numeric
-        if pd.api.types.is_numeric_dtype(clean_series):
-            return 'numeric'
+        # Atomic publish: readers never see a half-written entry
+        os.rename(tmp_dir, entry_dir)
+    except OSError as e:
+        # Another worker published the same digest first, or the disk is full
+        logger.warning(f"Could not cache workbook {digest}: {e}")
+        return
+    finally:
+        # Left over only if publishing failed, whatever the error
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    
+    evict_workbook_cache()
+
+def evict_workbook_cache():
+    """Drop least recently used cache entries until the size budget is met"""
+    cache_dir = app.config['CACHE_FOLDER']
+    max_bytes = app.config['WORKBOOK_CACHE_MAX_BYTES']
+    
+    with workbook_cache_lock:
+        entries = []
+        total_bytes = 0
+        for name in os.listdir(cache_dir):
+            entry_dir = os.path.join(cache_dir, name)
+            if name.startswith('.') or not os.path.isdir(entry_dir):
+                continue
+            try:
+                size = sum(entry.stat().st_size for entry in os.scandir(entry_dir))
+                last_used = os.path.getmtime(os.path.join(entry_dir, 'manifest.json'))
+            except OSError:
+                continue
+            entries.append((last_used, size, entry_dir))
+            total_bytes += size
         
-        # Check for categorical data
-        unique_values = len(clean_series.unique())
-        total_values = len(clean_series)
+        for last_used, size, entry_dir in sorted(entries):
+            if total_bytes <= max_bytes:
+                break
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total_bytes -= size
+            logger.info(f"Evicted workbook cache entry {os.path.basename(entry_dir)} ({size} bytes)")
+
+def parquet_safe(frame):
+    """frame with mixed-type text columns as strings, which Parquet can store"""
+    safe = frame
+    for position in range(frame.shape[1]):
+        values = frame.iloc[:, position]
+        if values.dtype != object and not isinstance(values.dtype, pd.CategoricalDtype):
+            continue
+        if pd.api.types.infer_dtype(values, skipna=True) in ('string', 'empty'):
+            continue
+        if safe is frame:
+            safe = frame.copy()
+        safe.isetitem(position, values.astype(str).where(values.notna(), None))
+    return safe
+
+class FrameSpill:
+    """Rows of one table written to disk chunk by chunk.
+    
+    Each chunk becomes its own Parquet part, so only the chunk being
+    written is held in memory while a dataset's rows accumulate. read()
+    concatenates the parts (or just some of their columns) with pandas,
+    which reconciles chunks whose column types differ as an in-memory
+    concat would.
+    """
+    
+    def __init__(self, folder):
+        self.folder = folder
+        self.rows = 0
+        self.parts = []
+    
+    def append(self, frame):
+        if frame.empty:
+            return
+        os.makedirs(self.folder, exist_ok=True)
+        path = os.path.join(self.folder, f"part-{len(self.parts):05d}.parquet")
+        parquet_safe(frame).to_parquet(path, index=False)
+        self.parts.append(path)
+        self.rows += len(frame)
+    
+    def read(self, columns=None):
+        """The spilled rows as a DataFrame (empty when nothing was appended)"""
+        if not self.parts:
+            return pd.DataFrame(columns=columns or [])
+        return pd.concat([pd.read_parquet(path, columns=columns) for path in self.parts], ignore_index=True)
+    
+    def tables(self):
+        """(schema, iterator of the parts as Arrow tables of that schema), reading one part at a time.
+
+        Columns a part lacks are null; a column whose type differs between
+        parts is float64 when all its types are numeric, else text.
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
         
-        if unique_values <= 15 or (unique_values / total_values) < 0.5:
-            return 'categorical'
+        kinds = {}
+        for path in self.parts:
+            for field in pq.read_schema(path):
+                kind = field.type.value_type if pa.types.is_dictionary(field.type) else field.type
+                if not pa.types.is_null(kind):
+                    kinds.setdefault(field.name, set()).add(kind)
+                else:
+                    kinds.setdefault(field.name, set())
+        fields = []
+        for name, types in kinds.items():
+            if len(types) == 1:
+                kind = next(iter(types))
+            elif types and all(pa.types.is_integer(kind) or pa.types.is_floating(kind) for kind in types):
+                kind = pa.float64()
+            else:
+                kind = pa.string()
+            fields.append(pa.field(name, kind))
+        schema = pa.schema(fields)
         
-        return 'text'
+        def conformed():
+            for path in self.parts:
+                table = pq.read_table(path)
+                yield pa.Table.from_arrays(
+                    [table.column(field.name).cast(field.type, safe=False) if field.name in table.column_names
+                     else pa.nulls(len(table), field.type) for field in schema], schema=schema)
+        return schema, conformed()
+
+def store_snapshot(dataset, rows, month):
+    """Write rows as the month partition of dataset in the snapshot store.
+
+    The store is a directory of Parquet files laid out as
+    <dataset>/month=YYYY-MM/data.parquet; an upload for a month replaces the
+    earlier one. rows is a DataFrame or a FrameSpill, whose parts are
+    written one at a time so a partition never has to fit in memory. Each
+    part is sorted by site, so row-group statistics let site filters skip
+    most of a partition. Returns the partition path, or None when snapshots
+    are disabled.
+    """
+    folder = app.config['SNAPSHOT_FOLDER']
+    if not folder or importlib.util.find_spec('pyarrow') is None:
+        return None
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    
+    if isinstance(rows, FrameSpill):
+        schema, tables = rows.tables()
+    else:
+        # Mixed-type id columns cannot be written as Parquet; strings are
+        table = pa.Table.from_pandas(parquet_safe(rows), preserve_index=False)
+        schema, tables = table.schema, [table]
+    
+    partition = os.path.join(folder, dataset, f"month={month}")
+    os.makedirs(partition, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix='.tmp_', suffix='.parquet', dir=partition)
+    os.close(fd)
+    try:
+        with pq.ParquetWriter(tmp_path, schema.remove_metadata()) as writer:
+            for table in tables:
+                if 'site' in table.column_names:
+                    table = table.sort_by('site')
+                writer.write_table(table.replace_schema_metadata(None), row_group_size=64 * 1024)
+        # Atomic publish: readers never see a half-written partition
+        os.replace(tmp_path, os.path.join(partition, 'data.parquet'))
     except Exception:
-        return 'text'
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return partition
+
+@contextmanager
+def snapshot_lock(dataset, month):
+    """Hold an exclusive lock on one snapshot partition, across worker processes.
+
+    For read-modify-write of a partition; the lock file's leading dot keeps
+    it out of dataset reads.
+    """
+    import fcntl
+    
+    partition = os.path.join(app.config['SNAPSHOT_FOLDER'], dataset, f"month={month}")
+    os.makedirs(partition, exist_ok=True)
+    with open(os.path.join(partition, '.lock'), 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def read_snapshots(dataset, months=None, sites=None, columns=None):
+    """Rows of dataset from the snapshot store as a DataFrame.
+
+    months is an inclusive ('YYYY-MM', 'YYYY-MM') range and sites a list of
+    site values; both are pushed down to pyarrow, so only matching month
+    partitions are opened and, within them, only row groups that can hold
+    the sites. Only columns are read (all when None).
+    """
+    import pyarrow as pa
+    import pyarrow.dataset as pads
+    
+    root = os.path.join(app.config['SNAPSHOT_FOLDER'], dataset)
+    if not os.path.isdir(root):
+        return pd.DataFrame(columns=columns or [])
+    
+    partitioning = pads.partitioning(pa.schema([('month', pa.string())]), flavor='hive')
+    source = pads.dataset(root, format='parquet', partitioning=partitioning)
+    predicate = None
+    if months:
+        predicate = (pads.field('month') >= months[0]) & (pads.field('month') <= months[1])
+    if sites:
+        site_predicate = pads.field('site').isin(list(sites))
+        predicate = site_predicate if predicate is None else predicate & site_predicate
+    return source.to_table(columns=columns, filter=predicate).to_pandas()
+
+def sheet_snapshot_key(filename, sheet_name, dataset=None):
+    """Snapshot store name of an uploaded sheet: sheets/<dataset or 'other'>/<workbook>__<sheet>.
+
+    The upload timestamp is dropped from the workbook name, so each month's
+    upload of the same workbook adds a partition to the same table.
+    """
+    stem = re.sub(r'^\d{8}_\d{6}_', '', os.path.splitext(os.path.basename(filename))[0])
+    return os.path.join('sheets', dataset or 'other', secure_filename(f"{stem}__{sheet_name}") or 'sheet')
+
+def sheet_snapshot_frame(df):
+    """A cleaned sheet chunk as stored: string headers, none named like the month partition key"""
+    columns = [str(col).strip() for col in df.columns]
+    df = df.set_axis(['month_value' if col == 'month' else col for col in columns], axis=1)
+    return df.loc[:, ~df.columns.duplicated()]
+
+def snapshot_upload(datasets, kpis, reporting_month=None, sheets=None):
+    """Store an upload's cleaned rows and KPIs; returns {KPI or sheet table: month stored under}.
+
+    datasets maps each recognised dataset to the FrameSpill of its rows.
+    Each KPI and its dataset's rows are filed under reporting_month, or else
+    the month the KPI reports on. sheets maps sheet_snapshot_key names to the
+    FrameSpill of every cleaned sheet, recognised as an HR dataset or not;
+    they are filed under reporting_month, else the month of their dataset's
+    KPI, and skipped when neither gives a period. Only recognised datasets
+    have KPIs to trend. Spills are written to the store part by part.
+    """
+    if not app.config['SNAPSHOT_FOLDER'] or importlib.util.find_spec('pyarrow') is None:
+        return {}
+    
+    records = pd.DataFrame(hr_kpis.kpi_records(kpis, reporting_month))
+    months = records.groupby('dataset')['month'].max().to_dict() if not records.empty else {}
+    kpi_of = lambda dataset: {'absence': 'bradford', 'absence_summary': 'bradford_series',
+                              'turnover_summary': 'turnover'}.get(dataset, dataset)
+    stored = dict(months)
+    with stage_span('store_snapshot') as span:
+        for dataset, rows in datasets.items():
+            if kpi_of(dataset) in months:
+                store_snapshot(dataset, rows, months[kpi_of(dataset)])
+        unfiled = []
+        for name, sheet_spill in (sheets or {}).items():
+            # Names are sheets/<dataset or 'other'>/...
+            month = reporting_month or months.get(kpi_of(name.split(os.sep)[1]))
+            if month is None:
+                unfiled.append(name)
+            elif sheet_spill.rows:
+                store_snapshot(name, sheet_spill, month)
+                stored[name] = month
+        if unfiled:
+            logger.info(f"Not archiving {len(unfiled)} sheets with no reporting month or KPI period")
+        for month, month_records in (records.groupby('month') if not records.empty else []):
+            # One KPI partition per month holds every dataset's figures, so
+            # merge with what earlier uploads for that month stored, under the
+            # partition's lock so concurrent uploads keep each other's rows
+            with snapshot_lock('kpis', month):
+                existing = read_snapshots('kpis', (month, month))
+                if not existing.empty:
+                    existing = existing[~existing['dataset'].isin(month_records['dataset'].unique())]
+                    month_records = pd.concat([existing.drop(columns='month'), month_records], ignore_index=True)
+                store_snapshot('kpis', month_records.drop(columns='month'), month)
+        span['rows'] = len(records)
+    logger.info(f"Stored snapshots for {stored}")
+    return stored
+
+def load_trends(analysis, sites=None):
+    """Trend table data from the snapshot store for the TREND_MONTHS up to the analysis' latest month.
+
+    Without sites the trends are company totals; otherwise one series per
+    site. Returns None when the store holds fewer than two months.
+    """
+    if not app.config['SNAPSHOT_FOLDER'] or importlib.util.find_spec('pyarrow') is None:
+        return None
+    
+    months = list((analysis.get('snapshots') or {}).values())
+    last = max(months) if months else datetime.now().strftime('%Y-%m')
+    first = str(np.datetime64(last, 'M') - (app.config['TREND_MONTHS'] - 1))
+    with stage_span('read_snapshot') as span:
+        records = read_snapshots('kpis', (first, last), list(sites) if sites else [''],
+                                 ['month', 'scope', 'site', 'dataset', 'kpi', 'value'])
+        span['rows'] = len(records)
+    records = records[records['scope'] == ('site' if sites else 'total')]
+    if records['month'].nunique() < 2:
+        return None
+    
+    all_months = sorted(records['month'].unique())
+    series = []
+    for site, site_records in records.groupby('site'):
+        table = site_records.pivot_table(index='month', columns=['dataset', 'kpi'], values='value', aggfunc='last')
+        values = {}
+        for dataset, kpi, _, _ in TREND_KPIS:
+            if (dataset, kpi) in table.columns:
+                column = table[(dataset, kpi)].reindex(all_months)
+                values[f"{dataset}.{kpi}"] = [None if pd.isna(value) else float(value) for value in column]
+        series.append({'site': site or 'All', 'values': values})
+    return {'months': all_months, 'series': series}
+
+# app.config folder key of each area the storage sweeper manages
+STORAGE_FOLDERS = {'uploads': 'UPLOAD_FOLDER', 'outputs': 'OUTPUT_FOLDER', 'charts': 'CHART_CACHE_FOLDER'}
+storage_stats = {'last_sweep': None, 'sweep_seconds': None,
+                 'evicted': {area: {'files': 0, 'bytes': 0} for area in STORAGE_FOLDERS}}
+storage_stats_lock = threading.Lock()
+
+def pin_artifacts(owner_kind, owner_key, paths):
+    """Keep paths from eviction while the owner's state entry is alive"""
+    if paths:
+        save_state('pins', owner_key, {'kind': owner_kind, 'paths': list(paths)})
+
+def pinned_artifacts():
+    """Paths pinned by live state entries; drops pins whose owner expired.
+
+    A pin lives for the owner's TTL from whichever is later, the pin being
+    written or the owner last being used, so a pin written just before its
+    owner is saved already counts.
+    """
+    pinned = set()
+    now = time.time()
+    folder = os.path.join(app.config['STATE_FOLDER'], 'pins')
+    for name in os.listdir(folder):
+        path = os.path.join(folder, name)
+        if name.startswith('.'):
+            continue
+        try:
+            with open(path, 'rb') as f:
+                pin = pickle.load(f)
+            last_used = os.path.getmtime(path)
+            owner_path = _state_path(pin['kind'], name[:-len('.pkl')])
+            if owner_path and os.path.exists(owner_path):
+                last_used = max(last_used, os.path.getmtime(owner_path))
+            if now - last_used <= app.config['STATE_TTL_SECONDS'][pin['kind']]:
+                pinned.update(pin['paths'])
+                continue
+        except (OSError, pickle.UnpicklingError, EOFError, KeyError, TypeError):
+            pass
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    return pinned
+
+def touch_artifact(path):
+    """Mark a file as used for LRU eviction without changing its mtime (and ETag)"""
+    try:
+        os.utime(path, (time.time(), os.path.getmtime(path)))
+    except OSError:
+        pass
+
+def scan_storage_area(area):
+    """(last_used, size, path) of every published file in an area, oldest first"""
+    entries = []
+    for entry in os.scandir(app.config[STORAGE_FOLDERS[area]]):
+        if entry.name.startswith('.') or not entry.is_file():
+            continue
+        try:
+            stat = entry.stat()
+        except OSError:
+            continue
+        entries.append((max(stat.st_atime, stat.st_mtime), stat.st_size, entry.path))
+    return sorted(entries)
+
+def remove_orphans(now):
+    """Delete temp files, spools and build workspaces abandoned by crashed workers"""
+    max_age = app.config['ORPHAN_MAX_AGE_SECONDS']
+    folders = [app.config[key] for key in STORAGE_FOLDERS.values()] + [app.config['TEMP_FOLDER']]
+    for folder in folders:
+        for entry in os.scandir(folder):
+            if not (entry.name.startswith('.') or entry.name.startswith('build_')):
+                continue
+            try:
+                if now - entry.stat().st_mtime <= max_age:
+                    continue
+                if entry.is_dir():
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                else:
+                    os.remove(entry.path)
+                logger.info(f"Removed orphaned {entry.path}")
+            except OSError:
+                continue
+
+def sweep_storage():
+    """One storage pass: expire state, drop orphans, then enforce age and size limits.
+
+    Within each area files are evicted least recently used first while they
+    are older than the area's maximum age or the area is over its byte
+    budget. Pinned files are skipped even when that leaves an area over
+    budget.
+    """
+    start = time.perf_counter()
+    now = time.time()
+    evict_expired_state()
+    remove_orphans(now)
+    pinned = pinned_artifacts()
+    
+    for area in STORAGE_FOLDERS:
+        max_bytes = app.config['STORAGE_MAX_BYTES'][area]
+        max_age = app.config['STORAGE_MAX_AGE_SECONDS'][area]
+        entries = scan_storage_area(area)
+        total_bytes = sum(size for _, size, _ in entries)
+        evicted_files = evicted_bytes = 0
+        for last_used, size, path in entries:
+            if total_bytes <= max_bytes and now - last_used <= max_age:
+                break
+            if path in pinned:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total_bytes -= size
+            evicted_files += 1
+            evicted_bytes += size
+        
+        if evicted_files:
+            logger.info(f"Evicted {evicted_files} {area} files ({evicted_bytes} bytes)")
+        if total_bytes > max_bytes:
+            logger.warning(f"{area} storage is {total_bytes} bytes, over its {max_bytes} byte budget, "
+                           f"with pinned files still in use")
+        with storage_stats_lock:
+            storage_stats['evicted'][area]['files'] += evicted_files
+            storage_stats['evicted'][area]['bytes'] += evicted_bytes
+    
+    with storage_stats_lock:
+        storage_stats['last_sweep'] = now
+        storage_stats['sweep_seconds'] = round(time.perf_counter() - start, 4)
+
+def storage_usage():
+    """Current size, budget, pinned share and eviction totals of each storage area"""
+    pinned = pinned_artifacts()
+    now = time.time()
+    areas = {}
+    for area in STORAGE_FOLDERS:
+        entries = scan_storage_area(area)
+        with storage_stats_lock:
+            evicted = dict(storage_stats['evicted'][area])
+        areas[area] = {
+            'files': len(entries),
+            'bytes': sum(size for _, size, _ in entries),
+            'max_bytes': app.config['STORAGE_MAX_BYTES'][area],
+            'max_age_seconds': app.config['STORAGE_MAX_AGE_SECONDS'][area],
+            'pinned_files': sum(path in pinned for _, _, path in entries),
+            'pinned_bytes': sum(size for _, size, path in entries if path in pinned),
+            'oldest_seconds': round(now - entries[0][0], 1) if entries else None,
+            'evicted_files': evicted['files'],
+            'evicted_bytes': evicted['bytes'],
+        }
+    with storage_stats_lock:
+        return {'areas': areas, 'last_sweep': storage_stats['last_sweep'],
+                'sweep_seconds': storage_stats['sweep_seconds']}
 
-def analyze_excel_data(dataframes):
-    """Analyze Excel data with error handling"""
+def run_storage_sweeper():
+    """Sweep storage every STORAGE_SWEEP_INTERVAL_SECONDS for the life of the process"""
+    while True:
+        try:
+            sweep_storage()
+        except Exception as e:
+            logger.error(f"Storage sweep failed: {e}")
+        time.sleep(app.config['STORAGE_SWEEP_INTERVAL_SECONDS'])
+
+if app.config['STORAGE_SWEEP_INTERVAL_SECONDS'] > 0 and SERVING_PROCESS:
+    threading.Thread(target=run_storage_sweeper, name='storage-sweeper', daemon=True).start()
+
+class TopKSketch:
+    """Mergeable heavy-hitters summary of a categorical column (Misra-Gries).
+
+    Counts stay exact while the column has at most `capacity` distinct values.
+    Beyond that the summary keeps `capacity` counters: every reported count is
+    a lower bound and the true count is at most count + error_bound, where
+    error_bound <= total / (capacity + 1). Sketches built from different
+    chunks, sheets or uploads merge without losing that guarantee.
+    """
+    
+    def __init__(self, capacity=None):
+        self.capacity = capacity or app.config['TOPK_SKETCH_CAPACITY']
+        self.counts = {}
+        self.total = 0
+        self.error_bound = 0
+    
+    @property
+    def exact(self):
+        return self.error_bound == 0
+    
+    def update(self, series):
+        """Add one chunk of values; the chunk is counted in a single vectorized pass"""
+        value_counts = series.value_counts()
+        # Categorical columns also list their unobserved categories
+        value_counts = value_counts[value_counts > 0]
+        for value, count in value_counts.items():
+            key = str(value).strip()
+            self.counts[key] = self.counts.get(key, 0) + int(count)
+        self.total += int(value_counts.sum())
+        self._reduce()
+    
+    def merge(self, other):
+        """Fold another sketch into this one"""
+        for key, count in other.counts.items():
+            self.counts[key] = self.counts.get(key, 0) + count
+        self.total += other.total
+        self.error_bound += other.error_bound
+        self._reduce()
+        return self
+    
+    def _reduce(self):
+        """Subtract the (capacity+1)-th largest count from every counter and drop the non-positive ones"""
+        if len(self.counts) <= self.capacity:
+            return
+        cutoff = sorted(self.counts.values(), reverse=True)[self.capacity]
+        self.counts = {key: count - cutoff for key, count in self.counts.items() if count > cutoff}
+        self.error_bound += cutoff
+    
+    def top(self, n):
+        """The n most frequent values as a {value: count} dict, largest first"""
+        return dict(sorted(self.counts.items(), key=lambda item: item[1], reverse=True)[:n])
+
+class QuantileSketch:
+    """Fixed-size, mergeable summary of a numeric column's distribution.
+
+    Values are held as (mean, weight) centroids sorted by mean. Whenever there
+    are more than `capacity` centroids they are regrouped into at most
+    `capacity` buckets with numpy, so memory is constant per column however
+    many rows are added. Exact min, max, count and sum are tracked alongside;
+    with at most `capacity` values every centroid is a raw value and quantiles
+    are exact. Columns with at most `capacity` distinct values (day and hour
+    counts) also keep exact value counts, so their histograms stay exact.
+    """
+    
+    def __init__(self, capacity=None):
+        self.capacity = capacity or app.config['QUANTILE_SKETCH_CENTROIDS']
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+        self.count = 0
+        self.total = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+        self.distinct = {}
+    
+    def update(self, values):
+        """Add an array of finite values"""
+        values = np.asarray(values, dtype=float)
+        values = values[np.isfinite(values)]
+        if values.size == 0:
+            return
+        self.count += int(values.size)
+        self.total += float(values.sum())
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        if self.distinct is not None:
+            uniques, counts = np.unique(values, return_counts=True)
+            self._count_distinct(zip(uniques.tolist(), counts.tolist()))
+        self._absorb(values, np.ones(values.size))
+    
+    def merge(self, other):
+        """Fold another sketch into this one"""
+        if other.count == 0:
+            return self
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        if self.distinct is not None:
+            self._count_distinct(other.distinct.items() if other.distinct is not None else None)
+        self._absorb(other.means, other.weights)
+        return self
+    
+    def _count_distinct(self, value_counts):
+        """Add (value, count) pairs to the exact counts, dropping them past capacity distinct values"""
+        if value_counts is None:
+            self.distinct = None
+            return
+        for value, count in value_counts:
+            self.distinct[value] = self.distinct.get(value, 0) + count
+        if len(self.distinct) > self.capacity:
+            self.distinct = None
+    
+    def _absorb(self, means, weights):
+        means = np.concatenate([self.means, means])
+        weights = np.concatenate([self.weights, weights])
+        order = np.argsort(means, kind='stable')
+        means, weights = means[order], weights[order]
+        
+        if means.size > self.capacity:
+            # Regroup into capacity buckets along an arcsine scale of the rank,
+            # which keeps buckets small in the tails (P90 and beyond) as t-digest does
+            cumulative = np.cumsum(weights)
+            ranks = (cumulative - weights / 2) / cumulative[-1]
+            groups = ((np.arcsin(2 * ranks - 1) / np.pi + 0.5) * self.capacity).astype(int)
+            groups = np.minimum(groups, self.capacity - 1)
+            group_weights = np.bincount(groups, weights=weights, minlength=self.capacity)
+            group_sums = np.bincount(groups, weights=means * weights, minlength=self.capacity)
+            keep = group_weights > 0
+            means = group_sums[keep] / group_weights[keep]
+            weights = group_weights[keep]
+        
+        self.means, self.weights = means, weights
+    
+    def _cdf_points(self):
+        """Piecewise-linear CDF knots: (rank positions, values) including min and max"""
+        centers = np.cumsum(self.weights) - self.weights / 2
+        positions = np.concatenate([[0.0], centers, [float(self.count)]])
+        values = np.concatenate([[self.min], self.means, [self.max]])
+        return positions, values
+    
+    def quantile(self, q):
+        """Approximate value at quantile q (0..1), interpolated between centroids"""
+        if self.count == 0:
+            return None
+        if self.count == 1:
+            return self.min
+        positions, values = self._cdf_points()
+        return float(np.interp(q * self.count, positions, values))
+    
+    def histogram(self, bins=15):
+        """Approximate (counts, edges) histogram over [min, max]"""
+        if self.count == 0:
+            return [], []
+        low, high = self.min, self.max if self.max > self.min else self.min + 1
+        if self.distinct is not None:
+            # Few distinct values: bin their exact counts
+            counts, edges = np.histogram(list(self.distinct), bins=bins, range=(low, high),
+                                         weights=list(self.distinct.values()))
+        elif self.count <= self.capacity:
+            # Centroids are still the raw values, so the histogram is exact
+            counts, edges = np.histogram(self.means, bins=bins, range=(low, high), weights=self.weights)
+        else:
+            # Each centroid covers the values halfway to its neighbours' means;
+            # its weight is split between bins only where that span crosses an
+            # edge. Centroids sharing a mean (discrete columns) are point masses.
+            edges = np.linspace(low, high, bins + 1)
+            midpoints = (self.means[1:] + self.means[:-1]) / 2
+            span_low = np.concatenate([[self.min], midpoints])
+            span_high = np.concatenate([midpoints, [self.max]])
+            width = span_high - span_low
+            with np.errstate(divide='ignore', invalid='ignore'):
+                share = np.where(width[:, None] > 0,
+                                 np.clip((edges[None, :] - span_low[:, None]) / width[:, None], 0, 1),
+                                 self.means[:, None] < edges[None, :])
+            share[:, -1] = 1
+            # Rounding the cumulative mass keeps the counts summing to count
+            cumulative = np.round(self.weights @ share)
+            counts = np.diff(cumulative)
+        counts = counts.round().astype(int)
+        if counts.sum() != self.count:
+            logger.warning(f"Histogram bins hold {counts.sum()} of {self.count} values")
+        return counts.tolist(), edges.tolist()
+    
+    def summary(self, bins=15):
+        """Plain-dict statistics used for charts, tables and JSON responses"""
+        counts, edges = self.histogram(bins)
+        return {
+            'count': self.count,
+            'min': self.min if self.count else None,
+            'max': self.max if self.count else None,
+            'mean': self.total / self.count if self.count else None,
+            'percentiles': {f"p{int(q * 100)}": self.quantile(q) for q in (0.1, 0.25, 0.5, 0.75, 0.9)},
+            'histogram': {'counts': counts, 'edges': edges}
+        }
+
+def profile_columns(df, sample_rows=None):
+    """Classify every column of df as empty/date/numeric/categorical/text.
+
+    All columns are classified together from one sample of rows: null counts,
+    distinct counts and dtypes are computed frame-wide instead of column by
+    column. Only columns whose name suggests a date get a per-column parse
+    probe. Columns typed by a read plan (df.attrs['column_types']) are taken
+    as declared. Returns a dict of column name to type.
+    """
+    sample_rows = sample_rows or app.config['PROFILE_SAMPLE_ROWS']
+    declared = {col: col_type for col, col_type in df.attrs.get('column_types', {}).items() if col in df.columns}
+    if declared:
+        rest = [col for col in df.columns if col not in declared]
+        return {**declared, **(profile_columns(df[rest], sample_rows) if rest else {})}
+    if df.shape[1] == 0:
+        return {}
+    sample = df if len(df) <= sample_rows else df.sample(n=sample_rows, random_state=0)
+    
+    non_null = sample.notna().sum().to_numpy()
+    unique = sample.nunique(dropna=True).to_numpy()
+    is_numeric = np.array([pd.api.types.is_numeric_dtype(dtype) for dtype in sample.dtypes])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        is_categorical = (unique <= 15) | (unique / non_null < 0.5)
+    
+    types = np.select(
+        [non_null == 0, is_numeric, is_categorical],
+        ['empty', 'numeric', 'categorical'],
+        default='text'
+    ).astype(object)
+    
+    # Check for date columns (name hint plus a parse probe, which wins over numeric)
+    names = df.columns.astype(str).str.lower().str.strip()
+    date_named = names.str.contains('date|time|birth|hire', regex=True)
+    for position in np.flatnonzero(date_named & (non_null > 0)):
+        try:
+            pd.to_datetime(sample.iloc[:, position].dropna().head(5), errors='raise')
+            types[position] = 'date'
+        except Exception:
+            pass
+    
+    return dict(zip(df.columns, types))
+
+def iter_workbook_chunks(source, chunk_rows):
+    """Stream a workbook (a path or file object) as (sheet_name, DataFrame) chunks of at most chunk_rows rows.
+
+    Uses openpyxl's read-only row iterator so only one chunk of cells is held
+    in memory at a time. The first row of each sheet is the header, mirroring
+    pd.read_excel's defaults (blank headers become 'Unnamed: n', duplicates get
+    a '.n' suffix), unless a registered read plan matches a later row: then
+    that row is the header, only the plan's columns are kept and chunks get
+    its types. Chunks are cleaned row-wise; empty columns are left for the
+    analysis step to skip.
+    """
+    from openpyxl import load_workbook
+    
+    workbook = load_workbook(source, read_only=True, data_only=True, keep_links=False)
+    try:
+        for worksheet in workbook.worksheets:
+            rows = worksheet.iter_rows(values_only=True)
+            preview = list(itertools.islice(rows, app.config['READ_PLAN_SCAN_ROWS']))
+            offset, plan = find_read_plan(preview)
+            offset = offset or 0
+            if len(preview) <= offset:
+                continue
+            header_row = preview[offset]
+            rows = itertools.chain(preview[offset + 1:], rows)
+            
+            header = []
+            seen = {}
+            for position, value in enumerate(header_row):
+                name = f"Unnamed: {position}" if value is None else str(value)
+                if name in seen:
+                    seen[name] += 1
+                    name = f"{name}.{seen[name]}"
+                else:
+                    seen[name] = 0
+                header.append(name.strip())
+            width = len(header)
+            
+            # A plan's unused columns are dropped from each row before framing
+            columns = header
+            select = None
+            if plan is not None:
+                keep = [position for position, name in enumerate(header) if name in set(plan['columns'])]
+                columns = [header[position] for position in keep]
+                getter = operator.itemgetter(*keep)
+                select = (lambda row: (getter(row),)) if len(keep) == 1 else getter
+            
+            while True:
+                with stage_span('read_sheet', sheet=worksheet.title, streamed=True) as span:
+                    buffer = [row[:width] + (None,) * (width - len(row)) for row in itertools.islice(rows, chunk_rows)]
+                    records = buffer if select is None else [select(row) for row in buffer]
+                    chunk = pd.DataFrame.from_records(records, columns=columns).dropna(how='all')
+                    if plan is not None:
+                        try:
+                            chunk = apply_read_plan(chunk, plan)
+                        except (ValueError, TypeError) as e:
+                            logger.warning(f"Sheet {worksheet.title} does not fit read plan "
+                                           f"{plan['fingerprint']}, keeping this chunk untyped: {e}")
+                    span['rows'] = len(chunk)
+                if not chunk.empty:
+                    yield worksheet.title, chunk
+                if len(buffer) < chunk_rows:
+                    break
+    finally:
+        workbook.close()
+
+def unit_headcounts(turnover):
+    """Average headcount per site and country from a turnover KPI, for absence rates"""
+    if not turnover:
+        return {}
+    headcounts = {unit['country']: unit['average_headcount'] for unit in turnover['countries']}
+    headcounts.update({unit['site']: unit['average_headcount'] for unit in turnover['sites']})
+    return headcounts
+
+def analyze_excel_data(dataframes, reporting_month=None):
+    """Analyze Excel data with error handling.
+
+    Each value in dataframes is either a dict of sheet name to DataFrame or an
+    iterator of (sheet_name, chunk) pairs from iter_workbook_chunks. Both are
+    consumed chunk by chunk so streamed workbooks never exist in memory whole:
+    the canonical columns of recognised HR datasets are spilled to Parquet
+    under TEMP_FOLDER as they arrive and only loaded, one dataset at a time,
+    for its KPI engine. Those datasets and their KPIs, and with SNAPSHOT_SHEETS
+    every cleaned sheet whether recognised or not, are also kept in the
+    snapshot store, under reporting_month ('YYYY-MM') when given. Aggregated
+    sheets that give no KPI get a note in analysis['notes'] saying why.
+    """
     analysis = {
         'summary': {},
         'data_overview': [],
         'charts_data': {
             'numeric': {},
             'categorical': {},
+            'categorical_bounds': {},
             'dates': {}
         },
+        'sketches': {'numeric': {}, 'categorical': {}},
+        'hr_kpis': {},
+        'notes': {},
+        'snapshots': {},
         'insights': []
     }
+    # Canonical rows of sheets recognised as HR datasets, spilled for the KPI engines,
+    # and every cleaned sheet, spilled for the snapshot store when SNAPSHOT_SHEETS is on
+    datasets = {}
+    sheet_spills = {}
+    keep_sheets = app.config['SNAPSHOT_SHEETS'] and bool(app.config['SNAPSHOT_FOLDER']) and \
+        importlib.util.find_spec('pyarrow') is not None
+    spill_dir = None
+    
+    def spill(spills, key):
+        nonlocal spill_dir
+        if key not in spills:
+            if spill_dir is None:
+                spill_dir = tempfile.mkdtemp(prefix='.spill_', dir=app.config['TEMP_FOLDER'])
+            spills[key] = FrameSpill(os.path.join(spill_dir, key))
+        return spills[key]
+    
+    def merge_sheet(file_summary, sheet_name, state):
+        """Fold one sheet's accumulated chunk state into the analysis"""
+        columns = [col for col in state['columns'] if col in state['non_empty']]
+        if state['rows'] == 0 or not columns:
+            return 0
+        
+        file_summary['sheets'][sheet_name] = {
+            'rows': state['rows'],
+            'columns': len(columns),
+            'column_names': columns,
+            'dataset': state['dataset'][0]
+        }
+        file_summary['total_rows'] += state['rows']
+        file_summary['total_columns'] = max(file_summary['total_columns'], len(columns))
+        
+        for col_clean, sketch in state['numeric'].items():
+            if sketch.count == 0:
+                continue
+            if col_clean in analysis['sketches']['numeric']:
+                analysis['sketches']['numeric'][col_clean].merge(sketch)
+            else:
+                analysis['sketches']['numeric'][col_clean] = sketch
+        
+        for col_clean, sketch in state['categorical'].items():
+            if col_clean in analysis['sketches']['categorical']:
+                analysis['sketches']['categorical'][col_clean].merge(sketch)
+            else:
+                analysis['sketches']['categorical'][col_clean] = sketch
+        return state['rows']
+    
+    def analyze_chunk(state, df):
+        """Accumulate one chunk of a sheet into its running state"""
+        # Duplicate headers cannot be analyzed by name; keep the first of each
+        df = df.loc[:, ~df.columns.duplicated()]
+        state['rows'] += len(df)
+        if not state['columns']:
+            state['columns'] = list(df.columns)
+        state['non_empty'].update(df.columns[df.notna().any()])
+        
+        # Recognised datasets keep just their canonical columns, chunk by chunk
+        if state['dataset'] is None:
+            state['dataset'] = hr_kpis.detect_dataset(df.columns, state['sheet_name'], df, state['filename'])
+        dataset, mapping = state['dataset']
+        if mapping:
+            spill(datasets, dataset).append(hr_kpis.project_dataset(df, mapping, state['sheet_name']))
+        if keep_sheets:
+            key = sheet_snapshot_key(state['filename'], state['sheet_name'], dataset)
+            spill(sheet_spills, key).append(sheet_snapshot_frame(df))
+        
+        # Classify every column not typed by an earlier chunk in one profiling pass
+        untyped = [col for col in df.columns if col not in state['types']]
+        if untyped:
+            with stage_span('profile_columns', columns=len(untyped)) as span:
+                span['rows'] = len(df)
+                profiled = profile_columns(df[untyped])
+            for col, col_type in profiled.items():
+                if col_type != 'empty':
+                    state['types'][col] = col_type
+        
+        # Numeric columns: every row goes into a fixed-size quantile sketch
+        numeric_cols = [col for col in df.columns if state['types'].get(col) == 'numeric']
+        if numeric_cols:
+            # float64 before any arithmetic: compacted columns may be int8
+            numeric_block = df[numeric_cols].apply(pd.to_numeric, errors='coerce').astype('float64')
+            for col in numeric_cols:
+                col_clean = str(col).strip()
+                if col_clean not in state['numeric']:
+                    state['numeric'][col_clean] = QuantileSketch()
+                state['numeric'][col_clean].update(numeric_block[col].dropna().to_numpy())
+        
+        # Categorical columns: per-sheet heavy-hitter sketches, merged across sheets and files
+        for col in df.columns:
+            if state['types'].get(col) != 'categorical':
+                continue
+            try:
+                col_clean = str(col).strip()
+                if col_clean not in state['categorical']:
+                    state['categorical'][col_clean] = TopKSketch()
+                state['categorical'][col_clean].update(df[col])
+            except Exception as e:
+                logger.warning(f"Error analyzing column {col}: {e}")
+                continue
     
     try:
         total_rows = 0
@@ -142,49 +1846,96 @@ def analyze_excel_data(dataframes):
                 'total_columns': 0
             }
             
-            for sheet_name, df in sheets.items():
+            chunks = sheets.items() if isinstance(sheets, dict) else sheets
+            current_sheet = None
+            state = None
+            
+            for sheet_name, df in chunks:
                 if df.empty:
                     continue
-                
-                rows, cols = df.shape
-                total_rows += rows
-                file_summary['sheets'][sheet_name] = {
-                    'rows': rows,
-                    'columns': cols,
-                    'column_names': list(df.columns)
-                }
-                file_summary['total_rows'] += rows
-                file_summary['total_columns'] = max(file_summary['total_columns'], cols)
-                
-                # Analyze columns (limit to first 10 for performance)
-                for col in list(df.columns)[:10]:
-                    try:
-                        col_clean = str(col).strip()
-                        col_type = detect_column_type(df[col], col)
-                        
-                        if col_type == 'numeric':
-                            numeric_data = pd.to_numeric(df[col], errors='coerce').dropna()
-                            if len(numeric_data) > 0:
-                                if col_clean not in analysis['charts_data']['numeric']:
-                                    analysis['charts_data']['numeric'][col_clean] = []
-                                analysis['charts_data']['numeric'][col_clean].extend(numeric_data.head(1000).tolist())
-                        
-                        elif col_type == 'categorical':
-                            value_counts = df[col].value_counts().head(10)  # Limit categories
-                            if col_clean not in analysis['charts_data']['categorical']:
-                                analysis['charts_data']['categorical'][col_clean] = {}
-                            
-                            for value, count in value_counts.items():
-                                if pd.notna(value):
-                                    key = str(value).strip()
-                                    analysis['charts_data']['categorical'][col_clean][key] = \
-                                        analysis['charts_data']['categorical'][col_clean].get(key, 0) + count
-                    except Exception as e:
-                        logger.warning(f"Error analyzing column {col}: {e}")
-                        continue
+                if sheet_name != current_sheet:
+                    if state is not None:
+                        total_rows += merge_sheet(file_summary, current_sheet, state)
+                    current_sheet = sheet_name
+                    state = {'rows': 0, 'columns': [], 'non_empty': set(), 'types': {},
+                             'numeric': {}, 'categorical': {},
+                             'filename': filename, 'sheet_name': sheet_name, 'dataset': None}
+                analyze_chunk(state, df)
+            
+            if state is not None:
+                total_rows += merge_sheet(file_summary, current_sheet, state)
             
             analysis['data_overview'].append(file_summary)
         
+        # Numeric distributions (histogram, percentiles) from the merged sketches
+        for col_clean, sketch in analysis['sketches']['numeric'].items():
+            analysis['charts_data']['numeric'][col_clean] = sketch.summary()
+        
+        # Top categories per column from the merged sketches, with their error bounds
+        for col_clean, sketch in analysis['sketches']['categorical'].items():
+            analysis['charts_data']['categorical'][col_clean] = sketch.top(10)  # Limit categories
+            analysis['charts_data']['categorical_bounds'][col_clean] = {
+                'exact': sketch.exact,
+                'error_bound': sketch.error_bound,
+                'total': sketch.total
+            }
+        
+        # HR KPIs from the rows of each recognised dataset
+        # (as of the end of reporting_month when given, else of the latest data)
+        month_end = None
+        if reporting_month:
+            month_end = np.datetime64(reporting_month, 'M') + 1 - np.timedelta64(1, 'D')
+        engines = {
+            'absence': ('bradford', lambda rows: hr_kpis.bradford_scores(
+                rows, app.config['BRADFORD_WINDOW_DAYS'], app.config['BRADFORD_BANDS'], app.config['BRADFORD_TOP_N'],
+                month_end)),
+            'absence_summary': ('bradford_series', hr_kpis.bradford_series),
+            'turnover': ('turnover', lambda rows: hr_kpis.turnover_by_month(
+                rows, app.config['TURNOVER_MONTHS'], month_end)),
+            'turnover_summary': ('turnover', lambda rows: hr_kpis.turnover_matrix(
+                rows, app.config['TURNOVER_MONTHS'], month_end)),
+            'sick_leave': ('sick_leave', lambda rows: hr_kpis.sick_leave_spells(
+                rows, app.config['PUBLIC_HOLIDAYS'], app.config['SICK_LEAVE_SHORT_TERM_DAYS'],
+                unit_headcounts(analysis['hr_kpis'].get('turnover')))),
+        }
+        snapshot_spills = {}
+        for dataset, (kpi, engine) in engines.items():
+            # Row-level records win over an aggregated matrix of the same KPI
+            if dataset not in datasets or not datasets[dataset].rows or kpi in analysis['hr_kpis']:
+                continue
+            try:
+                with stage_span(kpi) as span:
+                    rows = datasets[dataset].read()
+                    span['rows'] = len(rows)
+                    result = engine(rows)
+                del rows
+                if result:
+                    analysis['hr_kpis'][kpi] = result
+                    snapshot_spills[dataset] = datasets[dataset]
+            except Exception as e:
+                logger.warning(f"Error computing {kpi} KPIs: {e}")
+        
+        # Aggregated sheets that gave no KPI: the report says why its section is missing
+        recognised = {}
+        for file_summary in analysis['data_overview']:
+            for sheet_name, sheet in file_summary['sheets'].items():
+                recognised.setdefault(sheet['dataset'], []).append(sheet_name)
+        if recognised.get('sick_leave_summary') and 'sick_leave' not in analysis['hr_kpis']:
+            analysis['notes']['sick_leave'] = (
+                f"Not available for aggregated input: the sick-leave sheets "
+                f"({', '.join(recognised['sick_leave_summary'])}) hold monthly rates, not the per-employee "
+                f"sick days that spells and absence rates are computed from.")
+        if recognised.get('turnover_summary') and 'turnover' not in analysis['hr_kpis']:
+            analysis['notes']['turnover'] = (
+                f"Not available: no month with a headcount and a year could be read from the monthly "
+                f"turnover matrix sheets ({', '.join(recognised['turnover_summary'])}).")
+        
+        # Keep this upload's cleaned rows, sheets and KPIs for later trend reports
+        try:
+            analysis['snapshots'] = snapshot_upload(snapshot_spills, analysis['hr_kpis'], reporting_month, sheet_spills)
+        except Exception as e:
+            logger.warning(f"Could not store snapshots: {e}")
+        
         # Generate summary
         analysis['summary'] = {
             'total_files': total_files,
@@ -201,6 +1952,35 @@ def analyze_excel_data(dataframes):
             f"📈 Found {len(analysis['charts_data']['numeric'])} numeric columns",
             f"📋 Found {len(analysis['charts_data']['categorical'])} categorical columns"
         ]
+        approximate = [col for col, bounds in analysis['charts_data']['categorical_bounds'].items() if not bounds['exact']]
+        if approximate:
+            insights.append(f"≈ Category counts for {len(approximate)} high-cardinality columns are approximate "
+                            f"(see error bounds)")
+        bradford = analysis['hr_kpis'].get('bradford')
+        if bradford:
+            flagged = sum(band['employees'] for band in bradford['bands'][1:])
+            insights.append(f"🧮 Bradford factor: {bradford['employees_in_window']:,} employees absent in the "
+                            f"{bradford['window_days']} days to {bradford['as_of']}, {flagged:,} above "
+                            f"'{bradford['bands'][0]['label']}'")
+        series = analysis['hr_kpis'].get('bradford_series')
+        if series:
+            highest = max(series['sites'], key=lambda site: site['latest'])
+            figure = f"{highest['latest']:.1%}" if series['percent'] else f"{highest['latest']:,.1f}"
+            insights.append(f"🧮 Bradford by site to {series['last']}: highest at {highest['site']} ({figure}) "
+                            f"across {len(series['sites'])} sites")
+        sick_leave = analysis['hr_kpis'].get('sick_leave')
+        if sick_leave:
+            rate = sick_leave['total']['absence_rate']
+            insights.append(f"🤒 Sick leave {sick_leave['first']} to {sick_leave['last']}: {sick_leave['total']['spells']:,} "
+                            f"spells ({sick_leave['total']['long_term_spells']:,} long-term), "
+                            f"{sick_leave['total']['average_length']:.1f} working days on average"
+                            + (f", {rate:.1%} absence rate" if rate is not None else ""))
+        turnover = analysis['hr_kpis'].get('turnover')
+        if turnover and turnover['total']['annualized_turnover'] is not None:
+            joiners = "" if turnover.get('aggregated') else f"{sum(turnover['total']['joiners']):,} joiners, "
+            insights.append(f"🔁 Turnover {turnover['months'][0]} to {turnover['months'][-1]}: "
+                            f"{joiners}{sum(turnover['total']['leavers']):,} "
+                            f"leavers, {turnover['total']['annualized_turnover']:.1%} annualized")
         
         analysis['insights'] = insights
         return analysis
@@ -210,180 +1990,652 @@ def analyze_excel_data(dataframes):
         return {
             'summary': {'total_files': 0, 'total_rows': 0, 'total_columns': 0, 'numeric_columns': 0, 'categorical_columns': 0, 'date_columns': 0},
             'data_overview': [],
-            'charts_data': {'numeric': {}, 'categorical': {}, 'dates': {}},
+            'charts_data': {'numeric': {}, 'categorical': {}, 'categorical_bounds': {}, 'dates': {}},
+            'sketches': {'numeric': {}, 'categorical': {}},
+            'hr_kpis': {},
+            'notes': {},
+            'snapshots': {},
             'insights': ["Error occurred during analysis"]
         }
+    finally:
+        if spill_dir is not None:
+            shutil.rmtree(spill_dir, ignore_errors=True)
+
+def chart_fingerprint(chart_type, data, title, column_name=""):
+    """Cache key for a rendered chart: hash of its type, data, labels and style"""
+    payload = json.dumps([CHART_STYLE_VERSION, chart_type, data, title, column_name],
+                         sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def get_cached_chart(key):
+    """Look a rendered chart up in memory, then on disk; None on a miss"""
+    with chart_cache_lock:
+        if key in chart_cache:
+            chart_cache.move_to_end(key)
+            return chart_cache[key]
+    
+    path = os.path.join(app.config['CHART_CACHE_FOLDER'], f"{key}.png")
+    try:
+        with open(path, 'rb') as f:
+            png = f.read()
+        os.utime(path)
+    except OSError:
+        return None
+    remember_chart(key, png)
+    return png
+
+def remember_chart(key, png):
+    """Add a chart to the in-memory tier, evicting least recently used entries"""
+    global chart_cache_bytes
+    with chart_cache_lock:
+        if key in chart_cache:
+            chart_cache.move_to_end(key)
+            return
+        chart_cache[key] = png
+        chart_cache_bytes += len(png)
+        while chart_cache_bytes > app.config['CHART_CACHE_MEMORY_BYTES'] and len(chart_cache) > 1:
+            _, evicted = chart_cache.popitem(last=False)
+            chart_cache_bytes -= len(evicted)
 
-def create_simple_chart(chart_type, data, title, filename, column_name=""):
-    """Create simple charts for Render"""
+def store_cached_chart(key, png):
+    """Keep a rendered chart in both tiers and enforce the disk budget"""
+    remember_chart(key, png)
+    folder = app.config['CHART_CACHE_FOLDER']
+    path = os.path.join(folder, f"{key}.png")
+    if os.path.exists(path):
+        return
+    
     try:
-        plt.close('all')
-        plt.style.use('default')
+        fd, tmp_path = tempfile.mkstemp(prefix='.tmp_', dir=folder)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(png)
+        os.replace(tmp_path, path)
         
-        fig, ax = plt.subplots(figsize=(8, 5))
-        fig.patch.set_facecolor('white')
+        entries = []
+        for entry in os.scandir(folder):
+            if entry.name.endswith('.png'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, entry_path in sorted(entries):
+            if total_bytes <= app.config['CHART_CACHE_DISK_BYTES']:
+                break
+            os.remove(entry_path)
+            total_bytes -= size
+    except OSError as e:
+        logger.warning(f"Could not cache chart {key[:12]}: {e}")
+
+def create_simple_chart(chart_type, data, title, column_name=""):
+    """Render a chart to PNG bytes in memory.
+
+    Uses a standalone Figure instead of pyplot, so no global state is shared
+    between concurrent renders. Charts are cached by chart_fingerprint, so a
+    report rebuilt over unchanged data skips rendering. Returns None if the
+    chart could not be drawn.
+    """
+    key = chart_fingerprint(chart_type, data, title, column_name)
+    png = get_cached_chart(key)
+    if png is not None:
+        return png
+    
+    try:
+        from matplotlib.figure import Figure
         
-        if chart_type == 'categorical_bar' and isinstance(data, dict):
-            # Limit to top 8 categories
-            sorted_data = dict(sorted(data.items(), key=lambda x: x[1], reverse=True)[:8])
+        with stage_span('render_chart', chart=title, format='png') as span:
+            fig = Figure(figsize=(8, 5), facecolor='white')
+            ax = fig.subplots()
             
-            bars = ax.bar(range(len(sorted_data)), sorted_data.values(), color='#1976D2', alpha=0.7)
-            ax.set_xticks(range(len(sorted_data)))
-            ax.set_xticklabels(sorted_data.keys(), rotation=45, ha='right')
-            ax.set_ylabel('Count')
-            ax.set_title(title)
+            if chart_type == 'categorical_bar' and isinstance(data, dict):
+                # Limit to top 8 categories
+                sorted_data = dict(sorted(data.items(), key=lambda x: x[1], reverse=True)[:8])
+                
+                ax.bar(range(len(sorted_data)), sorted_data.values(), color='#1976D2', alpha=0.7)
+                ax.set_xticks(range(len(sorted_data)))
+                ax.set_xticklabels(sorted_data.keys(), rotation=45, ha='right')
+                ax.set_ylabel('Count')
+                ax.set_title(title)
+                
+            elif chart_type == 'numeric_histogram' and isinstance(data, dict):
+                # Pre-binned counts from the column's quantile sketch
+                counts, edges = data['histogram']['counts'], data['histogram']['edges']
+                ax.hist(edges[:-1], bins=edges, weights=counts, color='#1976D2', alpha=0.7, edgecolor='white')
+                ax.set_xlabel(column_name)
+                ax.set_ylabel('Frequency')
+                ax.set_title(title)
             
-        elif chart_type == 'numeric_histogram' and isinstance(data, list):
-            # Limit data size
-            if len(data) > 5000:
-                data = data[:5000]
+            fig.tight_layout()
             
-            ax.hist(data, bins=15, color='#1976D2', alpha=0.7, edgecolor='white')
-            ax.set_xlabel(column_name)
-            ax.set_ylabel('Frequency')
-            ax.set_title(title)
-        
-        plt.tight_layout()
-        
-        chart_path = os.path.join(app.config['TEMP_FOLDER'], filename)
-        plt.savefig(chart_path, dpi=100, bbox_inches='tight', facecolor='white')
-        plt.close()
-        
-        if os.path.exists(chart_path):
-            logger.info(f"Chart created: {chart_path}")
-            return chart_path
-        else:
-            logger.warning(f"Chart file not created: {chart_path}")
-            return None
+            buffer = io.BytesIO()
+            fig.savefig(buffer, format='png', dpi=100, bbox_inches='tight', facecolor='white')
+            png = buffer.getvalue()
+            span['bytes'] = len(png)
+        logger.info(f"Chart created: {title}")
+        store_cached_chart(key, png)
+        return png
             
     except Exception as e:
-        logger.error(f"Error creating chart {filename}: {e}")
-        plt.close('all')
+        logger.error(f"Error creating chart {title}: {e}")
         return None
 
+def create_vector_chart(chart_type, data, title, column_name=""):
+    """Draw a chart as a native reportlab Drawing (vector, resolution independent).
+
+    Mirrors create_simple_chart's bar and histogram layouts at the 5x3 inch
+    size used in the report. Raises ValueError for unsupported input so the
+    caller can fall back to the PNG path.
+    """
+    from reportlab.graphics.charts.barcharts import VerticalBarChart
+    from reportlab.graphics.shapes import Drawing, String
+    from reportlab.lib import colors
+    from reportlab.lib.units import inch
+    
+    width, height = 5*inch, 3*inch
+    drawing = Drawing(width, height)
+    chart = VerticalBarChart()
+    chart.x, chart.y = 45, 55
+    chart.width, chart.height = width - 60, height - 85
+    
+    if chart_type == 'categorical_bar' and isinstance(data, dict):
+        # Limit to top 8 categories
+        sorted_data = sorted(data.items(), key=lambda x: x[1], reverse=True)[:8]
+        values = [count for _, count in sorted_data]
+        labels = [str(key)[:18] for key, _ in sorted_data]
+        y_label = 'Count'
+    elif chart_type == 'numeric_histogram' and isinstance(data, dict):
+        values = data['histogram']['counts']
+        labels = [f"{edge:.3g}" for edge in data['histogram']['edges'][:-1]]
+        chart.groupSpacing = 0
+        y_label = 'Frequency'
+    else:
+        raise ValueError(f"Unsupported vector chart: {chart_type}")
+    if not values:
+        raise ValueError(f"No data for chart: {title}")
+    
+    chart.data = [values]
+    chart.bars[0].fillColor = colors.HexColor('#1976D2')
+    chart.bars[0].strokeColor = colors.white
+    chart.valueAxis.valueMin = 0
+    chart.valueAxis.labels.fontName = 'Helvetica'
+    chart.valueAxis.labels.fontSize = 7
+    chart.categoryAxis.categoryNames = labels
+    chart.categoryAxis.labels.angle = 45
+    chart.categoryAxis.labels.boxAnchor = 'ne'
+    chart.categoryAxis.labels.fontName = 'Helvetica'
+    chart.categoryAxis.labels.fontSize = 7
+    drawing.add(chart)
+    
+    drawing.add(String(width / 2, height - 14, title, textAnchor='middle', fontName='Helvetica-Bold', fontSize=11))
+    drawing.add(String(chart.x, chart.y + chart.height + 6, y_label, fontName='Helvetica', fontSize=7))
+    if column_name and chart_type == 'numeric_histogram':
+        drawing.add(String(chart.x + chart.width / 2, 4, str(column_name), textAnchor='middle', fontName='Helvetica', fontSize=8))
+    return drawing
+
+def render_chart_with_spans(spec):
+    """create_simple_chart in a pool worker, returning (png, spans) for adopt_spans"""
+    with collect_spans() as spans:
+        png = create_simple_chart(*spec)
+    return png, spans
+
+def render_charts(specs):
+    """Render (chart_type, data, title, column_name) specs, in parallel when possible.
+
+    Returns PNG bytes (or None for a failed chart) in the same order as specs.
+    """
+    # Serve cache hits here so only real renders pay for a trip to the pool
+    images = [get_cached_chart(chart_fingerprint(*spec)) for spec in specs]
+    misses = [index for index, png in enumerate(images) if png is None]
+    
+    if app.config['CHART_WORKERS'] <= 1 or len(misses) <= 1:
+        for index in misses:
+            images[index] = create_simple_chart(*specs[index])
+        return images
+    
+    pool = get_process_pool('chart')
+    futures = {index: pool.submit(render_chart_with_spans, specs[index]) for index in misses}
+    for index, future in futures.items():
+        try:
+            images[index], spans = future.result()
+            adopt_spans(spans)
+            if images[index]:
+                remember_chart(chart_fingerprint(*specs[index]), images[index])
+        except BrokenProcessPool as e:
+            reset_process_pool('chart')
+            logger.error(f"Error creating chart {specs[index][2]}: {e}")
+        except Exception as e:
+            logger.error(f"Error creating chart {specs[index][2]}: {e}")
+    return images
+
+def data_table_style(*commands):
+    """The report's table style (blue header row, beige body, grid) plus any extra commands"""
+    from reportlab.lib import colors
+    from reportlab.platypus import TableStyle
+    
+    return TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1565C0')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+        *commands
+    ])
+
+def numeric_stats_table(stats):
+    """Count, mean and percentile table for a numeric column summary"""
+    from reportlab.lib.units import inch
+    from reportlab.platypus import Table
+    
+    percentiles = stats['percentiles']
+    rows = [
+        ["Count", "Mean", "P10", "Median", "P90"],
+        [f"{stats['count']:,}"] + [f"{value:,.2f}" for value in
+                                  (stats['mean'], percentiles['p10'], percentiles['p50'], percentiles['p90'])]
+    ]
+    table = Table(rows, colWidths=[1*inch] * 5)
+    table.setStyle(data_table_style())
+    return table
+
+def bradford_section(bradford, styles):
+    """Flowables for the Bradford factor page: threshold bands and top scorers"""
+    from reportlab.lib.units import inch
+    from reportlab.platypus import Paragraph, Table
+    
+    table_style = data_table_style()
+    
+    flowables = [
+        Paragraph("Bradford Factor", styles['Heading2']),
+        Paragraph(f"Spells² × days absent per employee over the {bradford['window_days']} days to "
+                  f"{bradford['as_of']}. {bradford['rows']:,} absence records merged into "
+                  f"{bradford['spells']:,} spells for {bradford['employees']:,} employees.", styles['Normal'])
+    ]
+    
+    band_rows = [["Band", "Score", "Employees"]]
+    for band in bradford['bands']:
+        score_range = f"{band['min']:,}+" if band['max'] is None else f"{band['min']:,} – {band['max']:,}"
+        band_rows.append([band['label'], score_range, f"{band['employees']:,}"])
+    bands_table = Table(band_rows, colWidths=[2*inch, 1.5*inch, 1.5*inch])
+    bands_table.setStyle(table_style)
+    flowables.append(bands_table)
+    
+    if bradford['top']:
+        flowables.append(Paragraph(f"Top {len(bradford['top'])} Employees", styles['Heading3']))
+        top_rows = [["Employee", "Spells", "Days", "Score", "Peak score"]]
+        for row in bradford['top']:
+            top_rows.append([row['employee'], str(row['spells']), f"{row['days']:,.1f}",
+                             f"{row['score']:,.0f}", f"{row['peak_score']:,.0f}"])
+        top_table = Table(top_rows, colWidths=[1.5*inch, 0.8*inch, 0.8*inch, 1*inch, 1.2*inch])
+        top_table.setStyle(table_style)
+        flowables.append(top_table)
+    return flowables
+
+def bradford_series_section(series, styles):
+    """Flowables for the per-site Bradford page built from the aggregated Power BI export"""
+    from reportlab.lib.units import inch
+    from reportlab.platypus import Paragraph, Table
+    
+    def value(number):
+        if number is None:
+            return "–"
+        return f"{number:.1%}" if series['percent'] else f"{number:,.1f}"
+    
+    def change(number):
+        if number is None:
+            return "–"
+        return f"{number * 100:+.1f} pp" if series['percent'] else f"{number:+,.1f}"
+    
+    flowables = [
+        Paragraph("Bradford Factor by Site", styles['Heading2']),
+        Paragraph(f"Each site's Bradford figure from the aggregated export, {series['first']} to {series['last']} "
+                  f"({len(series['periods'])} periods). The export has no employee rows, so employee scores "
+                  f"and threshold bands need the row-level absence workbook.", styles['Normal'])
+    ]
+    
+    rows = [["Site", "Latest period", "Latest", "Previous", "Change", "Low", "High"]]
+    for site in series['sites']:
+        rows.append([site['site'], site['latest_period'], value(site['latest']), value(site['previous']),
+                     change(site['change']), value(site['low']), value(site['high'])])
+    table = Table(rows, colWidths=[0.9*inch, 1.1*inch, 0.8*inch, 0.8*inch, 0.9*inch, 0.7*inch, 0.7*inch])
+    table.setStyle(data_table_style())
+    flowables.append(table)
+    
+    # The most recent periods side by side
+    recent = series['periods'][-8:]
+    flowables.append(Paragraph("Recent Periods", styles['Heading3']))
+    rows = [["Site"] + recent]
+    for site in series['sites']:
+        rows.append([site['site']] + [value(number) for number in site['values'][-len(recent):]])
+    table = Table(rows, colWidths=[0.8*inch] + [0.7*inch] * len(recent))
+    table.setStyle(data_table_style(('FONTSIZE', (0, 0), (-1, -1), 8)))
+    flowables.append(table)
+    return flowables
+
+def turnover_section(turnover, styles):
+    """Flowables for the turnover page: monthly totals and per-unit turnover"""
+    from reportlab.lib.units import inch
+    from reportlab.platypus import Paragraph, Table
+    
+    table_style = data_table_style()
+    
+    def percent(value):
+        return "–" if value is None else f"{value:.1%}"
+    
+    def count(values):
+        """Sum of monthly counts; aggregated matrices record no joiners (None)"""
+        return "–" if None in values else f"{sum(values):,}"
+    
+    total = turnover['total']
+    source = (f"headcount and leavers from {turnover['rows']:,} figures of aggregated monthly turnover "
+              f"matrices (no joiners recorded)" if turnover.get('aggregated') else
+              f"headcount, joiners and leavers from {turnover['rows']:,} employment records")
+    flowables = [
+        Paragraph("Headcount and Turnover", styles['Heading2']),
+        Paragraph(f"Month-end {source}, "
+                  f"{turnover['months'][0]} to {turnover['months'][-1]}. Annualized turnover: "
+                  f"{percent(total['annualized_turnover'])}.", styles['Normal'])
+    ]
+    
+    month_rows = [["Month", "Headcount", "Joiners", "Leavers", "Turnover %"]]
+    for index, month in enumerate(turnover['months']):
+        month_rows.append([month, f"{total['headcount'][index]:,}", count([total['joiners'][index]]),
+                           f"{total['leavers'][index]:,}", percent(total['turnover_rate'][index])])
+    month_table = Table(month_rows, colWidths=[1*inch, 1.2*inch, 1*inch, 1*inch, 1.1*inch])
+    month_table.setStyle(table_style)
+    flowables.append(month_table)
+    
+    units = [('Country', unit['country'], unit) for unit in turnover['countries']] + \
+        [('Site', unit['site'], unit) for unit in turnover['sites']]
+    if units:
+        flowables.append(Paragraph("By Country and Site", styles['Heading3']))
+        unit_rows = [["Level", "Unit", "Avg headcount", "Joiners", "Leavers", "Annualized"]]
+        for level, name, unit in units:
+            unit_rows.append([level, name or "(blank)", f"{unit['average_headcount']:,.0f}", count(unit['joiners']),
+                              count(unit['leavers']), percent(unit['annualized_turnover'])])
+        unit_table = Table(unit_rows, colWidths=[0.8*inch, 1.2*inch, 1.2*inch, 0.9*inch, 0.9*inch, 1*inch])
+        unit_table.setStyle(table_style)
+        flowables.append(unit_table)
+    return flowables
+
+def sick_leave_section(sick_leave, styles):
+    """Flowables for the sick-leave page: spell KPIs by site and by collar"""
+    from reportlab.lib.units import inch
+    from reportlab.platypus import Paragraph, Table
+    
+    table_style = data_table_style()
+    basis = "average headcount" if sick_leave['rate_basis'] == 'headcount' else "employees with sick leave"
+    
+    flowables = [
+        Paragraph("Sick Leave", styles['Heading2']),
+        Paragraph(f"{sick_leave['rows']:,} sick days from {sick_leave['first']} to {sick_leave['last']} merged into "
+                  f"{sick_leave['spells']:,} spells for {sick_leave['employees']:,} employees. Spells run across "
+                  f"weekends and public holidays; absence rate is sick working days over the working days of "
+                  f"{basis}.", styles['Normal'])
+    ]
+    
+    def kpi_table(title, label, groups):
+        header = [label, "Spells", "Avg days", "Short-term", "Long-term", "Days", "Absence rate"]
+        rows = [header]
+        for name, group in groups:
+            rate = group['absence_rate']
+            rows.append([name or "(blank)", f"{group['spells']:,}",
+                         "–" if group['average_length'] is None else f"{group['average_length']:.1f}",
+                         f"{group['short_term_spells']:,}", f"{group['long_term_spells']:,}", f"{group['days']:,.0f}",
+                         "–" if rate is None else f"{rate:.1%}"])
+        table = Table(rows, colWidths=[1*inch, 0.8*inch, 0.8*inch, 0.9*inch, 0.9*inch, 0.8*inch, 1*inch])
+        table.setStyle(table_style)
+        return [Paragraph(title, styles['Heading3']), table]
+    
+    flowables.extend(kpi_table("Total", "Scope", [("All", sick_leave['total'])]))
+    if sick_leave['sites']:
+        label = 'site' if 'site' in sick_leave['sites'][0] else 'country'
+        flowables.extend(kpi_table("By Site", label.title(), [(site[label], site) for site in sick_leave['sites']]))
+    if sick_leave['collars']:
+        flowables.extend(kpi_table("By Collar", "Collar", [(collar['collar'], collar) for collar in sick_leave['collars']]))
+    return flowables
+
+def trend_section(trends, styles):
+    """Flowables for the trend page: one month-by-KPI table per series"""
+    from reportlab.lib.units import inch
+    from reportlab.platypus import Paragraph, Table
+    
+    table_style = data_table_style(('FONTSIZE', (0, 0), (-1, -1), 8))
+    
+    flowables = [
+        Paragraph("Monthly Trends", styles['Heading2']),
+        Paragraph(f"KPIs stored from each month's upload, {trends['months'][0]} to {trends['months'][-1]}. "
+                  f"Sheets that are not a recognised HR dataset have no KPIs to trend.", styles['Normal'])
+    ]
+    for series in trends['series']:
+        kpis = [(f"{dataset}.{kpi}", heading, number_format) for dataset, kpi, heading, number_format in TREND_KPIS
+                if f"{dataset}.{kpi}" in series['values']]
+        if not kpis:
+            continue
+        rows = [["Month"] + [heading for _, heading, _ in kpis]]
+        for index, month in enumerate(trends['months']):
+            cells = []
+            for key, _, number_format in kpis:
+                value = series['values'][key][index]
+                cells.append("–" if value is None else number_format.format(value))
+            rows.append([month] + cells)
+        table = Table(rows, colWidths=[0.8*inch] + [(5.4 / len(kpis))*inch] * len(kpis))
+        table.setStyle(table_style)
+        if len(trends['series']) > 1:
+            flowables.append(Paragraph(series['site'], styles['Heading3']))
+        flowables.append(table)
+    return flowables
+
+def report_cache_key(analysis, report_title, company_name):
+    """Memoization key of a report: its analysis, cover text and template version"""
+    payload = json.dumps([
+        REPORT_TEMPLATE_VERSION,
+        app.config['CHART_FORMAT'],
+        report_title,
+        company_name,
+        {key: analysis.get(key) for key in ('summary', 'data_overview', 'charts_data', 'hr_kpis', 'notes', 'trends',
+                                            'insights')}
+    ], sort_keys=True, default=str)
+    # State keys are 32 hex characters
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
+
+def find_memoized_report(key):
+    """Filename of an already built report for key, if its PDF still exists"""
+    entry = load_state('reports', key)
+    if entry and os.path.exists(os.path.join(app.config['OUTPUT_FOLDER'], entry['pdf_filename'])):
+        return entry['pdf_filename']
+    return None
+
 def generate_pdf_report(analysis, report_title, company_name):
-    """Generate PDF report with error handling"""
+    """Generate PDF report with error handling.
+
+    Reports are memoized on report_cache_key: the same analysis rendered with
+    the same title and company returns the existing PDF. Otherwise each build
+    writes into its own temporary workspace under TEMP_FOLDER and the
+    finished PDF is moved into OUTPUT_FOLDER under a unique name, so
+    concurrent builds never share files and /download never sees a partial
+    PDF. The workspace is removed whether or not the build succeeds.
+    """
     try:
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"HR_Report_{timestamp}.pdf"
-        filepath = os.path.join(app.config['OUTPUT_FOLDER'], filename)
-        
-        logger.info(f"Creating PDF at: {filepath}")
-        
-        doc = SimpleDocTemplate(filepath, pagesize=A4)
-        story = []
-        
-        # Get styles
-        styles = getSampleStyleSheet()
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontSize=20,
-            textColor=colors.HexColor('#1565C0'),
-            spaceAfter=20,
-            alignment=1
-        )
-        
-        # Title
-        story.append(Paragraph(company_name, title_style))
-        story.append(Paragraph(report_title, title_style))
-        story.append(Paragraph(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M')}", styles['Normal']))
-        
-        # Summary table
-        summary_data = [
-            ["Metric", "Value"],
-            ["Files Analyzed", str(analysis['summary']['total_files'])],
-            ["Total Records", f"{analysis['summary']['total_rows']:,}"],
-            ["Numeric Columns", str(analysis['summary']['numeric_columns'])],
-            ["Categorical Columns", str(analysis['summary']['categorical_columns'])]
-        ]
-        
-        summary_table = Table(summary_data, colWidths=[3*inch, 2*inch])
-        summary_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1565C0')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
-        
-        story.append(summary_table)
-        
-        # Insights
-        story.append(Paragraph("Key Insights", styles['Heading2']))
-        for insight in analysis['insights']:
-            story.append(Paragraph(f"• {insight}", styles['Normal']))
-        
-        # Add charts (limit to 3 for performance)
-        chart_count = 0
-        
-        # Categorical charts
-        for col_name, cat_data in list(analysis['charts_data']['categorical'].items())[:2]:
-            if chart_count >= 3:
-                break
-            try:
-                chart_path = create_simple_chart(
-                    'categorical_bar',
-                    cat_data,
-                    f'{col_name} Distribution',
-                    f'cat_{chart_count}.png',
-                    col_name
-                )
-                
-                if chart_path and os.path.exists(chart_path):
-                    story.append(PageBreak())
-                    story.append(Paragraph(f"{col_name} Analysis", styles['Heading2']))
-                    story.append(Image(chart_path, width=5*inch, height=3*inch))
-                    chart_count += 1
-            except Exception as e:
-                logger.error(f"Error adding categorical chart: {e}")
-        
-        # Numeric charts
-        for col_name, num_data in list(analysis['charts_data']['numeric'].items())[:1]:
-            if chart_count >= 3:
-                break
-            try:
-                chart_path = create_simple_chart(
-                    'numeric_histogram',
-                    num_data,
-                    f'{col_name} Distribution',
-                    f'num_{chart_count}.png',
-                    col_name
-                )
-                
-                if chart_path and os.path.exists(chart_path):
-                    story.append(PageBreak())
-                    story.append(Paragraph(f"{col_name} Analysis", styles['Heading2']))
-                    story.append(Image(chart_path, width=5*inch, height=3*inch))
-                    chart_count += 1
-            except Exception as e:
-                logger.error(f"Error adding numeric chart: {e}")
-        
-        # Build PDF
-        doc.build(story)
-        
-        # Clean up chart files
-        try:
-            for file in os.listdir(app.config['TEMP_FOLDER']):
-                if file.endswith('.png'):
-                    os.remove(os.path.join(app.config['TEMP_FOLDER'], file))
-        except:
-            pass
+        key = report_cache_key(analysis, report_title, company_name)
+        pdf_filename = find_memoized_report(key)
+        if pdf_filename:
+            logger.info(f"Reusing memoized report {pdf_filename}")
+            return pdf_filename
         
-        if os.path.exists(filepath):
-            logger.info(f"PDF report created successfully: {filepath}")
-            return filename
-        else:
-            raise Exception("PDF file was not created")
-            
+        with tempfile.TemporaryDirectory(prefix='build_', dir=app.config['TEMP_FOLDER']) as workspace:
+            pdf_filename = _build_pdf_report(workspace, analysis, report_title, company_name)
+        save_state('reports', key, {'pdf_filename': pdf_filename, 'created': time.time()})
+        return pdf_filename
     except Exception as e:
         logger.error(f"Error generating PDF report: {e}")
         import traceback
         traceback.print_exc()
         raise e
 
+def _build_pdf_report(workspace, analysis, report_title, company_name):
+    """Lay out and build the PDF inside workspace, then publish it"""
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib.units import inch
+    from reportlab.platypus import SimpleDocTemplate, Table, Paragraph, Image, PageBreak
+    
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    filename = f"HR_Report_{timestamp}_{uuid.uuid4().hex[:8]}.pdf"
+    filepath = os.path.join(app.config['OUTPUT_FOLDER'], filename)
+    build_path = os.path.join(workspace, filename)
+    
+    logger.info(f"Creating PDF at: {filepath}")
+    
+    doc = SimpleDocTemplate(build_path, pagesize=A4)
+    story = []
+    
+    # Get styles
+    styles = getSampleStyleSheet()
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=20,
+        textColor=colors.HexColor('#1565C0'),
+        spaceAfter=20,
+        alignment=1
+    )
+    
+    # Title
+    story.append(Paragraph(company_name, title_style))
+    story.append(Paragraph(report_title, title_style))
+    story.append(Paragraph(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M')}", styles['Normal']))
+    
+    # Summary table
+    summary_data = [
+        ["Metric", "Value"],
+        ["Files Analyzed", str(analysis['summary']['total_files'])],
+        ["Total Records", f"{analysis['summary']['total_rows']:,}"],
+        ["Numeric Columns", str(analysis['summary']['numeric_columns'])],
+        ["Categorical Columns", str(analysis['summary']['categorical_columns'])]
+    ]
+    
+    summary_table = Table(summary_data, colWidths=[3*inch, 2*inch])
+    summary_table.setStyle(data_table_style(
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('FONTSIZE', (0, 0), (-1, 0), 12)
+    ))
+    
+    story.append(summary_table)
+    
+    # Insights
+    story.append(Paragraph("Key Insights", styles['Heading2']))
+    for insight in analysis['insights']:
+        story.append(Paragraph(f"• {insight}", styles['Normal']))
+    
+    # HR KPI sections for recognised datasets
+    if analysis.get('hr_kpis', {}).get('bradford'):
+        story.append(PageBreak())
+        story.extend(bradford_section(analysis['hr_kpis']['bradford'], styles))
+    if analysis.get('hr_kpis', {}).get('bradford_series'):
+        story.append(PageBreak())
+        story.extend(bradford_series_section(analysis['hr_kpis']['bradford_series'], styles))
+    if analysis.get('trends'):
+        story.append(PageBreak())
+        story.extend(trend_section(analysis['trends'], styles))
+    # Sections that could not be built from aggregated input keep their heading and say why
+    notes = analysis.get('notes') or {}
+    if analysis.get('hr_kpis', {}).get('sick_leave'):
+        story.append(PageBreak())
+        story.extend(sick_leave_section(analysis['hr_kpis']['sick_leave'], styles))
+    elif notes.get('sick_leave'):
+        story.extend([Paragraph("Sick Leave", styles['Heading2']), Paragraph(notes['sick_leave'], styles['Normal'])])
+    if analysis.get('hr_kpis', {}).get('turnover'):
+        story.append(PageBreak())
+        story.extend(turnover_section(analysis['hr_kpis']['turnover'], styles))
+    elif notes.get('turnover'):
+        story.extend([Paragraph("Headcount and Turnover", styles['Heading2']),
+                      Paragraph(notes['turnover'], styles['Normal'])])
+    
+    # Add charts (limit to 3 for performance): 2 categorical, 1 numeric
+    chart_sections = []
+    for col_name, cat_data in list(analysis['charts_data']['categorical'].items())[:2]:
+        chart_sections.append(('categorical_bar', cat_data, col_name))
+    for col_name, num_data in list(analysis['charts_data']['numeric'].items())[:1]:
+        chart_sections.append(('numeric_histogram', num_data, col_name))
+    
+    # Vector charts are drawn directly; anything else (or any vector failure)
+    # is rendered to PNG up front in the chart pool, then all are laid out in order
+    charts = [None] * len(chart_sections)
+    if app.config['CHART_FORMAT'] == 'vector':
+        for index, (chart_type, data, col_name) in enumerate(chart_sections):
+            try:
+                with stage_span('render_chart', chart=f'{col_name} Distribution', format='vector'):
+                    charts[index] = create_vector_chart(chart_type, data, f'{col_name} Distribution', col_name)
+            except Exception as e:
+                logger.warning(f"Vector chart for {col_name} failed, using PNG: {e}")
+    
+    raster = [index for index, chart in enumerate(charts) if chart is None]
+    images = render_charts([(chart_sections[index][0], chart_sections[index][1],
+                             f'{chart_sections[index][2]} Distribution', chart_sections[index][2])
+                            for index in raster])
+    for index, png in zip(raster, images):
+        if png:
+            charts[index] = Image(io.BytesIO(png), width=5*inch, height=3*inch)
+    
+    for (chart_type, data, col_name), chart in zip(chart_sections, charts):
+        if chart is None:
+            continue
+        try:
+            story.append(PageBreak())
+            story.append(Paragraph(f"{col_name} Analysis", styles['Heading2']))
+            story.append(chart)
+            if chart_type == 'numeric_histogram':
+                story.append(numeric_stats_table(data))
+        except Exception as e:
+            logger.error(f"Error adding chart for {col_name}: {e}")
+    
+    # Build PDF
+    with stage_span('build_pdf') as span:
+        doc.build(story)
+        span['bytes'] = os.path.getsize(build_path) if os.path.exists(build_path) else None
+    
+    if os.path.exists(build_path):
+        # Same filesystem, so the move is an atomic rename
+        os.replace(build_path, filepath)
+        logger.info(f"PDF report created successfully: {filepath}")
+        return filename
+    else:
+        raise Exception("PDF file was not created")
+
+def update_report_job(job_id, **fields):
+    """Update a report job's status fields in the shared state store"""
+    job = load_state('jobs', job_id)
+    if job is not None:
+        job.update(fields, updated=time.time())
+        # Pin before publishing so the PDF cannot be swept in between
+        if job.get('pdf_filename'):
+            pin_artifacts('jobs', job_id, [os.path.join(app.config['OUTPUT_FOLDER'], job['pdf_filename'])])
+        save_state('jobs', job_id, job)
+
+def run_report_job(job_id, analysis, report_title, company_name, timings=False):
+    """Build one PDF in the report pool and record the outcome on the job.
+
+    With timings the job also records the build's stage breakdown, which
+    /report_status returns.
+    """
+    update_report_job(job_id, status='running')
+    start = time.perf_counter()
+    with collect_spans() as spans:
+        try:
+            pdf_filename = generate_pdf_report(analysis, report_title, company_name)
+            outcome = {'status': 'done', 'pdf_filename': pdf_filename, 'pdf_url': f'/download/{pdf_filename}'}
+        except Exception as e:
+            outcome = {'status': 'failed', 'error': f'Report generation failed: {str(e)}'}
+    if timings:
+        outcome['timings'] = timing_breakdown(spans, time.perf_counter() - start)
+    update_report_job(job_id, **outcome)
+
+def submit_report_job(analysis, report_title, company_name, timings=False):
+    """Queue a report build and return its job id without waiting for it"""
+    now = time.time()
+    job_id = uuid.uuid4().hex
+    save_state('jobs', job_id, {'job_id': job_id, 'status': 'queued', 'created': now, 'updated': now})
+    report_pool.submit(run_report_job, job_id, analysis, report_title, company_name, timings)
+    return job_id
+
 # HTML Template (simplified)
 HTML_TEMPLATE = '''
 <!DOCTYPE html>
@@ -427,6 +2679,7 @@ HTML_TEMPLATE = '''
         <div class="card upload-area" id="uploadArea">
             <h3>📁 Upload Excel Files</h3>
             <p>Select .xlsx or .xls files</p>
+            <input type="month" id="reportingMonth" class="form-input" title="Reporting month (optional; taken from the data if empty)">
             <input type="file" id="fileInput" multiple accept=".xlsx,.xls" style="display: none;">
             <button class="btn" onclick="document.getElementById('fileInput').click()">Browse Files</button>
             <div id="filesList"></div>
@@ -451,6 +2704,7 @@ HTML_TEMPLATE = '''
     
     <script>
         let uploadedFiles = [];
+        let uploadId = null;
         
         document.getElementById('fileInput').addEventListener('change', handleFileUpload);
         
@@ -462,6 +2716,8 @@ HTML_TEMPLATE = '''
             
             const formData = new FormData();
             files.forEach(file => formData.append('excel_files', file));
+            const reportingMonth = document.getElementById('reportingMonth').value;
+            if (reportingMonth) formData.append('reporting_month', reportingMonth);
             
             fetch('/upload_excel', {
                 method: 'POST',
@@ -470,12 +2726,20 @@ HTML_TEMPLATE = '''
             .then(response => response.json())
             .then(data => {
                 if (data.success) {
+                    uploadId = data.upload_id;
                     uploadedFiles = data.files;
                     updateFilesList();
                     updateStatsGrid(data.summary);
                     document.getElementById('configSection').style.display = 'block';
                     document.getElementById('generateBtn').disabled = false;
                     showStatus(`Successfully uploaded ${files.length} files`, 'success');
+                    const archived = Object.entries(data.snapshots || {}).filter(([name]) => name.startsWith('sheets/'));
+                    const trended = Object.keys(data.snapshots || {}).length - archived.length;
+                    if (archived.length) {
+                        showStatus(`Archived ${archived.length} sheets for ${archived[0][1]}; ` +
+                                   (trended ? `trends cover ${trended} recognised HR KPIs` :
+                                    'no sheet was a recognised HR dataset, so there are no KPIs to trend'), 'info');
+                    }
                 } else {
                     showStatus(`Error: ${data.error}`, 'error');
                 }
@@ -526,6 +2790,7 @@ HTML_TEMPLATE = '''
         
         function clearFiles() {
             uploadedFiles = [];
+            uploadId = null;
             document.getElementById('filesList').innerHTML = '';
             document.getElementById('configSection').style.display = 'none';
             document.getElementById('generateBtn').disabled = true;
@@ -543,14 +2808,34 @@ HTML_TEMPLATE = '''
             fetch('/generate_reports', {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ report_title: reportTitle, company_name: companyName })
+                body: JSON.stringify({ upload_id: uploadId, report_title: reportTitle, company_name: companyName })
             })
             .then(response => response.json())
             .then(data => {
-                document.getElementById('loadingSection').style.display = 'none';
-                document.getElementById('generateBtn').disabled = false;
-                
                 if (data.success) {
+                    pollReportStatus(data.status_url);
+                } else {
+                    finishReport();
+                    showStatus(`Error: ${data.error}`, 'error');
+                }
+            })
+            .catch(error => {
+                finishReport();
+                showStatus(`Error: ${error.message}`, 'error');
+            });
+        }
+        
+        function pollReportStatus(statusUrl) {
+            fetch(statusUrl)
+            .then(response => response.json())
+            .then(data => {
+                if (data.status === 'queued' || data.status === 'running') {
+                    setTimeout(() => pollReportStatus(statusUrl), 1000);
+                    return;
+                }
+                
+                finishReport();
+                if (data.status === 'done') {
                     showStatus('Report generated successfully!', 'success');
                     const downloadDiv = document.createElement('div');
                     downloadDiv.className = 'status status-success';
@@ -564,12 +2849,16 @@ HTML_TEMPLATE = '''
                 }
             })
             .catch(error => {
-                document.getElementById('loadingSection').style.display = 'none';
-                document.getElementById('generateBtn').disabled = false;
+                finishReport();
                 showStatus(`Error: ${error.message}`, 'error');
             });
         }
         
+        function finishReport() {
+            document.getElementById('loadingSection').style.display = 'none';
+            document.getElementById('generateBtn').disabled = false;
+        }
+        
         function showStatus(message, type) {
             const statusDiv = document.createElement('div');
             statusDiv.className = `status status-${type}`;
@@ -587,19 +2876,29 @@ def index():
     return render_template_string(HTML_TEMPLATE)
 
 @app.route('/upload_excel', methods=['POST'])
+@with_timing_breakdown
 def upload_excel():
-    global uploaded_files, report_data
-    
     try:
-        if 'excel_files' not in request.files:
+        # Werkzeug reads, hashes and spools the request body on first access
+        with stage_span('save_upload', bytes=request.content_length):
+            form_files = request.files
+        if 'excel_files' not in form_files:
             return jsonify({'error': 'No files selected'}), 400
         
-        files = request.files.getlist('excel_files')
+        files = form_files.getlist('excel_files')
         if not files:
             return jsonify({'error': 'No files provided'}), 400
         
+        # Optional reporting month these files are for, else taken from the data
+        reporting_month = request.form.get('reporting_month') or None
+        if reporting_month and not re.fullmatch(r'\d{4}-(0[1-9]|1[0-2])', reporting_month):
+            return jsonify({'error': 'reporting_month must be YYYY-MM'}), 400
+        
         uploaded_files = []
         dataframes = {}
+        accepted = []
+        budget = app.config['REQUEST_MEMORY_BUDGET_BYTES']
+        reserved = 0
         
         for file in files:
             if file.filename == '' or not (file.filename.lower().endswith('.xlsx') or file.filename.lower().endswith('.xls')):
@@ -609,82 +2908,200 @@ def upload_excel():
                 filename = secure_filename(file.filename)
                 timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
                 unique_filename = f"{timestamp}_{filename}"
-                filepath = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-                
-                file.save(filepath)
-                logger.info(f"File saved: {filepath}")
                 
-                # Read Excel file
-                excel_file = pd.ExcelFile(filepath)
-                sheets = {}
-                sheet_names = []
+                # The body was hashed and sized as it was read; only files over
+                # the spool threshold were written to disk, and are kept there
+                spool = ingest_upload(file)
+                # Registering a read plan changes how the same bytes are parsed
+                digest = spool.hexdigest()
+                plans_stamp = read_plans_stamp()
+                if plans_stamp:
+                    digest = hashlib.sha256(f"{digest}:{plans_stamp}".encode('utf-8')).hexdigest()
+                filepath = None
+                if spool.path:
+                    filepath = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
+                    spool.persist(filepath)
+                    logger.info(f"File saved: {filepath}")
+                source = filepath or spool.getvalue()
                 
-                for sheet_name in excel_file.sheet_names:
-                    try:
-                        df = pd.read_excel(filepath, sheet_name=sheet_name)
-                        df.columns = df.columns.astype(str).str.strip()
-                        df = df.dropna(how='all').dropna(axis=1, how='all')
-                        
-                        if not df.empty:
-                            sheets[sheet_name] = df
-                            sheet_names.append(sheet_name)
-                            logger.info(f"Read sheet {sheet_name}: {len(df)} rows")
-                    except Exception as e:
-                        logger.warning(f"Could not read sheet {sheet_name}: {e}")
-                
-                if sheets:
-                    dataframes[file.filename] = sheets
-                    file_size = os.path.getsize(filepath)
-                    uploaded_files.append({
-                        'filename': file.filename,
-                        'filepath': filepath,
-                        'sheets': sheet_names,
-                        'size': f"{file_size/1024:.1f} KB" if file_size < 1024*1024 else f"{file_size/(1024*1024):.1f} MB"
-                    })
+                # Very large .xlsx files are streamed through the analysis in row chunks
+                streamable = filename.lower().endswith('.xlsx')
+                stream = spool.size > app.config['STREAMING_THRESHOLD_BYTES'] and streamable
+                sheets = None
+                layouts = {}
+                timings = None
+                memory_bytes = 0
+                if not stream:
+                    # Re-uploads of identical bytes are served from the parsed-workbook cache
+                    cache_start = time.perf_counter()
+                    sheets, layouts = load_cached_workbook(digest)
+                    if sheets is not None:
+                        timings = {'cache_hit': True, 'total_seconds': round(time.perf_counter() - cache_start, 4)}
+                        logger.info(f"Workbook cache hit for {file.filename} ({digest[:12]})")
+                        memory_bytes = sum(frame_memory(df) for df in sheets.values())
+                    else:
+                        memory_bytes = int(spool.size * app.config['WORKBOOK_MEMORY_FACTOR'])
                     
+                    # Whole-file loads share the request's memory budget
+                    if budget and reserved + memory_bytes > budget:
+                        if not streamable:
+                            raise RequestEntityTooLarge(
+                                f"{file.filename} needs about {memory_bytes / 1024 ** 2:.0f} MB in memory, "
+                                f"over the {budget / 1024 ** 2:.0f} MB per-request budget")
+                        logger.info(f"{file.filename} would exceed the request memory budget; streaming it")
+                        stream, sheets, timings, memory_bytes = True, None, None, 0
+                    reserved += memory_bytes
+                
+                if stream:
+                    logger.info(f"Streaming {file.filename} ({spool.size} bytes) in chunks of {app.config['STREAM_CHUNK_ROWS']} rows")
+                    timings = {'streamed': True}
+                accepted.append({'filename': file.filename, 'filepath': filepath, 'source': source, 'size': spool.size,
+                                 'digest': digest, 'sheets': sheets, 'timings': timings, 'stream': stream,
+                                 'memory_bytes': memory_bytes, 'layouts': layouts})
+            except RequestEntityTooLarge:
+                raise
             except Exception as e:
                 logger.error(f"Error processing file {file.filename}: {e}")
                 continue
         
-        if not uploaded_files:
-            return jsonify({'error': 'No valid Excel files processed'}), 400
+        # Parse cache misses in the process pool (single pass over each workbook)
+        misses = [item for item in accepted if item['sheets'] is None and not item['stream']]
+        for item, result in zip(misses, parse_workbooks([item['source'] for item in misses])):
+            if isinstance(result, Exception):
+                logger.error(f"Error processing file {item['filename']}: {result}")
+                continue
+            item['sheets'], item['timings'] = result
+            adopt_spans(item['timings'].pop('spans', []))
+            item['layouts'] = item['timings'].pop('layouts', {})
+            item['timings']['cache_hit'] = False
+            item['memory_bytes'] = sum(item['timings']['memory_bytes'].values())
+            if item['sheets']:
+                try:
+                    store_cached_workbook(item['digest'], item['sheets'], item['layouts'])
+                except Exception as e:
+                    logger.warning(f"Could not cache workbook {item['filename']}: {e}")
+        
+        # Estimates can be off: hold the compacted sheets to the budget too,
+        # streaming the largest .xlsx files instead until they fit
+        loaded = [item for item in accepted if item['sheets']]
+        resident = sum(item['memory_bytes'] for item in loaded)
+        if budget and resident > budget:
+            for item in sorted(loaded, key=lambda item: item['memory_bytes'], reverse=True):
+                if resident <= budget:
+                    break
+                if item['filename'].lower().endswith('.xlsx'):
+                    logger.info(f"{item['filename']} holds {item['memory_bytes']} bytes over the request memory budget; streaming it")
+                    resident -= item['memory_bytes']
+                    item.update(sheets=None, stream=True, memory_bytes=0)
+                    item['timings']['streamed'] = True
+            if resident > budget:
+                raise RequestEntityTooLarge(f"The uploaded workbooks need {resident / 1024 ** 2:.0f} MB in memory, "
+                                            f"over the {budget / 1024 ** 2:.0f} MB per-request budget")
+        
+        # Merge in upload order so results do not depend on worker scheduling
+        for item in accepted:
+            if item['stream']:
+                source = item['source'] if item['filepath'] else io.BytesIO(item['source'])
+                dataframes[item['filename']] = iter_workbook_chunks(source, app.config['STREAM_CHUNK_ROWS'])
+            elif item['sheets']:
+                dataframes[item['filename']] = item['sheets']
         
         # Analyze data
-        report_data = analyze_excel_data(dataframes)
+        analysis = analyze_excel_data(dataframes, reporting_month)
         logger.info("Data analysis completed")
         
-        return jsonify({
+        # Streamed workbooks only know their non-empty sheets once analysis has run
+        analyzed_sheets = {f['filename']: list(f['sheets'].keys()) for f in analysis['data_overview']}
+        for item in accepted:
+            sheet_names = analyzed_sheets.get(item['filename']) if item['stream'] else list((item['sheets'] or {}).keys())
+            if sheet_names:
+                file_size = item['size']
+                uploaded_files.append({
+                    'filename': item['filename'],
+                    'filepath': item['filepath'],
+                    'sheets': sheet_names,
+                    'size': f"{file_size/1024:.1f} KB" if file_size < 1024*1024 else f"{file_size/(1024*1024):.1f} MB",
+                    'timings': item['timings'],
+                    'layouts': item.get('layouts', {})
+                })
+        
+        if not uploaded_files:
+            return jsonify({'error': 'No valid Excel files processed'}), 400
+        
+        # Keep this upload's state where any worker can find it
+        upload_id = uuid.uuid4().hex
+        pin_artifacts('uploads', upload_id, [f['filepath'] for f in uploaded_files if f['filepath']])
+        save_state('uploads', upload_id, {'files': uploaded_files, 'analysis': analysis})
+        
+        # Sheets whose layout has no read plan yet; POST /read_plans/<fingerprint> registers one
+        unknown_layouts = [{'filename': f['filename'], 'sheet': sheet, 'fingerprint': layout['fingerprint']}
+                           for f in uploaded_files for sheet, layout in f['layouts'].items()
+                           if layout['plan'] == 'proposed']
+        
+        response = jsonify({
             'success': True,
+            'upload_id': upload_id,
             'files': uploaded_files,
-            'summary': report_data['summary']
+            'unknown_layouts': unknown_layouts,
+            'snapshots': analysis['snapshots'],
+            'summary': analysis['summary']
         })
+        response.set_cookie('upload_id', upload_id, httponly=True, samesite='Lax')
+        return response
         
+    except RequestEntityTooLarge as e:
+        logger.warning(f"Upload rejected: {e.description}")
+        return jsonify({'error': f'Upload too large: {e.description}'}), 413
     except Exception as e:
         logger.error(f"Upload error: {e}")
         return jsonify({'error': f'Upload failed: {str(e)}'}), 500
 
 @app.route('/generate_reports', methods=['POST'])
+@with_timing_breakdown
 def generate_reports():
-    global report_data
-    
     try:
-        if not report_data:
+        data = request.json
+        sites = data.get('sites')
+        if sites is not None and not (isinstance(sites, list) and all(isinstance(site, str) for site in sites)):
+            return jsonify({'error': 'sites must be a list of site names'}), 400
+        upload_id = data.get('upload_id') or request.cookies.get('upload_id')
+        upload_state = load_state('uploads', upload_id) if upload_id else None
+        if not upload_state:
             return jsonify({'error': 'No data available. Upload files first.'}), 400
         
-        data = request.json
         report_title = data.get('report_title', 'HR Monthly Report')
         company_name = data.get('company_name', 'Company')
         
         logger.info(f"Generating report: {report_title}")
         
-        # Generate PDF
-        pdf_filename = generate_pdf_report(report_data, report_title, company_name)
+        # Trends come from the snapshot store as it is now, for the requested sites
+        analysis = dict(upload_state['analysis'])
+        try:
+            analysis['trends'] = load_trends(analysis, sites)
+        except Exception as e:
+            logger.warning(f"Could not load trends: {e}")
+        
+        # An identical report already exists: hand it back without queueing a build
+        pdf_filename = find_memoized_report(report_cache_key(analysis, report_title, company_name))
+        if pdf_filename:
+            now = time.time()
+            job_id = uuid.uuid4().hex
+            job = {'job_id': job_id, 'status': 'done', 'created': now, 'updated': now,
+                   'pdf_filename': pdf_filename, 'pdf_url': f'/download/{pdf_filename}'}
+            pin_artifacts('jobs', job_id, [os.path.join(app.config['OUTPUT_FOLDER'], pdf_filename)])
+            save_state('jobs', job_id, job)
+            return jsonify({'success': True, **job, 'status_url': f'/report_status/{job_id}'})
+        
+        # Queue the PDF build; the client polls /report_status/<job_id>
+        job_id = submit_report_job(analysis, report_title, company_name,
+                                   timings=request.args.get('timings') == '1')
         
         return jsonify({
             'success': True,
-            'pdf_filename': pdf_filename,
-            'pdf_url': f'/download/{pdf_filename}'
-        })
+            'job_id': job_id,
+            'status': 'queued',
+            'status_url': f'/report_status/{job_id}'
+        }), 202
         
     except Exception as e:
         logger.error(f"Report generation error: {e}")
@@ -692,6 +3109,34 @@ def generate_reports():
         traceback.print_exc()
         return jsonify({'error': f'Report generation failed: {str(e)}'}), 500
 
+@app.route('/read_plans')
+def list_read_plans():
+    """Registered read plans and the pending proposals for unknown layouts"""
+    pending = []
+    pending_dir = os.path.join(app.config['READ_PLAN_FOLDER'], 'pending')
+    for name in sorted(os.listdir(pending_dir)):
+        if name.endswith('.json'):
+            try:
+                with open(os.path.join(pending_dir, name)) as f:
+                    pending.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+    return jsonify({'registered': list(load_read_plans().values()), 'pending': pending})
+
+@app.route('/read_plans/<fingerprint>', methods=['POST'])
+def register_read_plan_route(fingerprint):
+    if not register_read_plan(fingerprint):
+        return jsonify({'error': 'No pending read plan with that fingerprint'}), 404
+    return jsonify({'success': True, 'plan': load_read_plans().get(fingerprint)})
+
+@app.route('/report_status/<job_id>')
+def report_status(job_id):
+    job = load_state('jobs', job_id)
+    if job is None:
+        return jsonify({'error': 'Report job not found'}), 404
+    
+    return jsonify({'success': job['status'] != 'failed', **job})
+
 @app.route('/download/<filename>')
 def download_file(filename):
     try:
@@ -699,7 +3144,11 @@ def download_file(filename):
         filepath = os.path.join(app.config['OUTPUT_FOLDER'], filename)
         
         if os.path.exists(filepath):
-            return send_file(filepath, as_attachment=True, download_name=filename)
+            touch_artifact(filepath)
+            # Report files are immutable once published, so let clients and
+            # proxies revalidate with ETag/Last-Modified and resume with Range
+            return send_file(filepath, as_attachment=True, download_name=filename,
+                             conditional=True, etag=True, max_age=24 * 3600)
         else:
             return jsonify({'error': 'File not found'}), 404
             
@@ -707,9 +3156,66 @@ def download_file(filename):
         logger.error(f"Download error: {e}")
         return jsonify({'error': f'Download failed: {str(e)}'}), 500
 
+@app.route('/storage')
+def storage_status():
+    return jsonify(storage_usage())
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus text exposition of this process's stage histograms and storage usage"""
+    lines = [
+        '# HELP hr_stage_seconds Time spent in each pipeline stage.',
+        '# TYPE hr_stage_seconds histogram',
+    ]
+    with stage_metrics_lock:
+        snapshot = {stage: dict(metric, buckets=list(metric['buckets'])) for stage, metric in stage_metrics.items()}
+    for stage, metric in sorted(snapshot.items()):
+        for bound, count in zip(STAGE_SECONDS_BUCKETS, metric['buckets']):
+            lines.append(f'hr_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}')
+        lines.append(f'hr_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {metric["count"]}')
+        lines.append(f'hr_stage_seconds_sum{{stage="{stage}"}} {metric["seconds"]:.6f}')
+        lines.append(f'hr_stage_seconds_count{{stage="{stage}"}} {metric["count"]}')
+    for name, field, kind, help_text in [
+        ('hr_stage_rows_total', 'rows', 'counter', 'Rows handled by each pipeline stage.'),
+        ('hr_stage_bytes_total', 'bytes', 'counter', 'Bytes handled by each pipeline stage.'),
+        ('hr_stage_peak_rss_bytes', 'peak_rss_bytes', 'gauge', 'Process peak RSS seen at the end of a stage.'),
+    ]:
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+        lines += [f'{name}{{stage="{stage}"}} {metric[field]}' for stage, metric in sorted(snapshot.items())]
+    
+    rss, peak = process_memory()
+    lines += ['# HELP hr_process_resident_memory_bytes Resident memory of this process.',
+              '# TYPE hr_process_resident_memory_bytes gauge',
+              f'hr_process_resident_memory_bytes {rss}',
+              '# HELP hr_process_peak_resident_memory_bytes Peak resident memory of this process.',
+              '# TYPE hr_process_peak_resident_memory_bytes gauge',
+              f'hr_process_peak_resident_memory_bytes {peak}']
+    
+    usage = storage_usage()['areas']
+    lines += ['# HELP hr_storage_bytes Bytes stored in each managed storage area.',
+              '# TYPE hr_storage_bytes gauge']
+    lines += [f'hr_storage_bytes{{area="{area}"}} {stats["bytes"]}' for area, stats in sorted(usage.items())]
+    lines += ['# HELP hr_storage_evicted_bytes_total Bytes evicted from each storage area.',
+              '# TYPE hr_storage_evicted_bytes_total counter']
+    lines += [f'hr_storage_evicted_bytes_total{{area="{area}"}} {stats["evicted_bytes"]}' for area, stats in sorted(usage.items())]
+    
+    return app.response_class('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
 @app.route('/health')
 def health_check():
-    return jsonify({'status': 'healthy', 'timestamp': datetime.now().isoformat()})
+    return jsonify({
+        'status': 'healthy',
+        'timestamp': datetime.now().isoformat(),
+        'warm': heavy_modules_ready.is_set()
+    })
+
+# Module import should stay cheap; anything heavy belongs in HEAVY_MODULES
+import_seconds = time.perf_counter() - import_started
+IMPORT_BUDGET_SECONDS = float(os.environ.get('IMPORT_BUDGET_SECONDS', 1.0))
+if import_seconds > IMPORT_BUDGET_SECONDS:
+    logger.warning(f"Import took {import_seconds:.2f}s, over the {IMPORT_BUDGET_SECONDS:.2f}s budget")
+else:
+    logger.info(f"Imported in {import_seconds:.2f}s")
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
@@ -0,0 +1,449 @@
+"""Benchmarks for the HR Report Generator pipeline.
+
+Run a single benchmark with, for example:
+
+    python benchmark_hr_report.py parallel-parse --rows 20000 --workers 4
+
+or the end-to-end suite over synthetic workbooks of 1k to 1M rows:
+
+    python benchmark_hr_report.py suite --sizes 1000,10000,100000 --output runs.jsonl
+"""
+import argparse
+import json
+import logging
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import HRmontlyreport as hr
+import hr_workbook_generator
+
+pd = hr.pd
+np = hr.np
+
+
+def write_sample_workbooks(directory, count, rows, sheets=3):
+    """Write count workbooks of rows x sheets absence-style data; returns their paths"""
+    rng = np.random.default_rng(42)
+    paths = []
+    for index in range(count):
+        path = os.path.join(directory, f"bundle_{index}.xlsx")
+        with pd.ExcelWriter(path, engine='openpyxl') as writer:
+            for sheet in range(sheets):
+                pd.DataFrame({
+                    'Employee ID': rng.integers(1000, 9999, rows),
+                    'Department': rng.choice(['Production', 'Logistics', 'Quality', 'Finance', 'HR'], rows),
+                    'Country': rng.choice(['SE', 'NO', 'BE', 'PT', 'CZ'], rows),
+                    'Absence Days': rng.integers(1, 30, rows),
+                    'Cost': rng.normal(1500, 400, rows).round(2),
+                }).to_excel(writer, sheet_name=f"Sheet{sheet + 1}", index=False)
+        paths.append(path)
+    return paths
+
+
+def bench_parallel_parse(args):
+    """Compare serial and process-pool parsing of a multi-file upload"""
+    with tempfile.TemporaryDirectory() as directory:
+        paths = write_sample_workbooks(directory, args.files, args.rows)
+
+        hr.app.config['PARSE_WORKERS'] = 1
+        start = time.perf_counter()
+        serial = hr.parse_workbooks(paths)
+        serial_seconds = time.perf_counter() - start
+
+        hr.app.config['PARSE_WORKERS'] = args.workers
+        hr.reset_process_pool('parse')
+        hr.get_process_pool('parse')  # exclude worker start-up from the timing
+        start = time.perf_counter()
+        parallel = hr.parse_workbooks(paths)
+        parallel_seconds = time.perf_counter() - start
+        hr.reset_process_pool('parse')
+
+    assert [list(result[0]) for result in serial] == [list(result[0]) for result in parallel]
+    print(f"{args.files} files x {args.rows} rows")
+    print(f"serial:            {serial_seconds:.3f}s")
+    print(f"{args.workers} workers:         {parallel_seconds:.3f}s")
+    print(f"speedup:           {serial_seconds / parallel_seconds:.2f}x")
+
+
+def legacy_detect_column_type(series, column_name):
+    """Per-column type detection used before profile_columns, kept as the baseline"""
+    try:
+        clean_series = series.dropna()
+        if len(clean_series) == 0:
+            return 'empty'
+        column_name_lower = str(column_name).lower().strip()
+        if any(keyword in column_name_lower for keyword in ['date', 'time', 'birth', 'hire']):
+            try:
+                pd.to_datetime(clean_series.head(5), errors='raise')
+                return 'date'
+            except Exception:
+                pass
+        if pd.api.types.is_numeric_dtype(clean_series):
+            return 'numeric'
+        unique_values = len(clean_series.unique())
+        if unique_values <= 15 or (unique_values / len(clean_series)) < 0.5:
+            return 'categorical'
+        return 'text'
+    except Exception:
+        return 'text'
+
+
+def wide_sheet(rows, columns):
+    """A sheet of mixed numeric, categorical, free-text and date columns"""
+    rng = np.random.default_rng(7)
+    data = {}
+    for index in range(columns):
+        kind = index % 4
+        if kind == 0:
+            data[f"Amount {index}"] = rng.normal(100, 25, rows).round(2)
+        elif kind == 1:
+            data[f"Department {index}"] = rng.choice([f"Dept {n}" for n in range(12)], rows)
+        elif kind == 2:
+            data[f"Comment {index}"] = [f"note {n}" for n in rng.integers(0, rows * 10, rows)]
+        else:
+            data[f"Start Date {index}"] = pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 365, rows), unit='D')
+    return pd.DataFrame(data)
+
+
+def bench_column_profile(args):
+    """Compare per-column detection with the whole-frame profiler on a wide sheet"""
+    df = wide_sheet(args.rows, args.columns)
+
+    start = time.perf_counter()
+    legacy = {col: legacy_detect_column_type(df[col], col) for col in df.columns}
+    legacy_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    profiled = hr.profile_columns(df)
+    profile_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    hr.analyze_excel_data({'wide.xlsx': {'Sheet1': df}})
+    analyze_seconds = time.perf_counter() - start
+
+    mismatches = sum(legacy[col] != profiled[col] for col in df.columns)
+    print(f"{args.rows} rows x {args.columns} columns")
+    print(f"per-column detection: {legacy_seconds:.3f}s")
+    print(f"profile_columns:      {profile_seconds:.3f}s ({legacy_seconds / profile_seconds:.1f}x)")
+    print(f"analyze_excel_data:   {analyze_seconds:.3f}s (all {args.columns} columns)")
+    print(f"type mismatches:      {mismatches}")
+
+
+def bench_chart_render(args):
+    """Compare inline and process-pool rendering of a report's charts"""
+    rng = np.random.default_rng(3)
+    specs = []
+    for index in range(args.charts):
+        if index % 2:
+            sketch = hr.QuantileSketch()
+            sketch.update(rng.lognormal(2, 1, 100000))
+            specs.append(('numeric_histogram', sketch.summary(), f"Amount {index} Distribution", f"Amount {index}"))
+        else:
+            counts = {f"Dept {n}": int(count) for n, count in enumerate(rng.integers(10, 500, 12))}
+            specs.append(('categorical_bar', counts, f"Department {index} Distribution", f"Department {index}"))
+
+    hr.app.config['CHART_WORKERS'] = 1
+    start = time.perf_counter()
+    inline = hr.render_charts(specs)
+    inline_seconds = time.perf_counter() - start
+
+    hr.app.config['CHART_WORKERS'] = args.workers
+    hr.reset_process_pool('chart')
+    hr.render_charts(specs[:2])  # start the workers outside the timing
+    start = time.perf_counter()
+    pooled = hr.render_charts(specs)
+    pooled_seconds = time.perf_counter() - start
+    hr.reset_process_pool('chart')
+
+    assert all(inline) and all(pooled)
+    print(f"{args.charts} charts, {sum(map(len, inline)) / 1024:.0f} KB of PNG")
+    print(f"inline:            {inline_seconds:.3f}s")
+    print(f"{args.workers} workers:         {pooled_seconds:.3f}s")
+    print(f"speedup:           {inline_seconds / pooled_seconds:.2f}x")
+
+
+def bench_chart_format(args):
+    """Compare PDF size and build time of vector and 100-dpi PNG charts"""
+    df = wide_sheet(args.rows, 12)
+    analysis = hr.analyze_excel_data({'wide.xlsx': {'Sheet1': df}})
+
+    with tempfile.TemporaryDirectory() as directory:
+        hr.app.config['OUTPUT_FOLDER'] = directory
+        hr.app.config['TEMP_FOLDER'] = directory
+        hr.app.config['CHART_CACHE_FOLDER'] = directory
+        hr.app.config['CHART_WORKERS'] = 1
+        results = {}
+        for chart_format in ('png', 'vector'):
+            hr.app.config['CHART_FORMAT'] = chart_format
+            timings = []
+            for _ in range(args.repeat):
+                hr.chart_cache.clear()  # measure real renders, not cache hits
+                for name in os.listdir(directory):
+                    if name.endswith('.png'):
+                        os.remove(os.path.join(directory, name))
+                with tempfile.TemporaryDirectory(dir=directory) as workspace:
+                    start = time.perf_counter()
+                    filename = hr._build_pdf_report(workspace, analysis, 'Benchmark', 'Company')
+                    timings.append(time.perf_counter() - start)
+            results[chart_format] = (min(timings), os.path.getsize(os.path.join(directory, filename)))
+
+    for chart_format, (seconds, size) in results.items():
+        print(f"{chart_format:7s} build {seconds:.3f}s  pdf {size / 1024:.1f} KB")
+    # A 5-inch-wide image rendered at 8in x 100dpi holds 800 px: ~160 px per printed inch
+    print("print quality: png ~160 px/inch at report size; vector is resolution independent")
+
+
+def wait_for_response(url, timeout):
+    """Poll url until it answers; returns the body"""
+    deadline = time.perf_counter() + timeout
+    while True:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                return response.read()
+        except (urllib.error.URLError, ConnectionError):
+            if time.perf_counter() > deadline:
+                raise
+            time.sleep(0.01)
+
+
+def bench_startup(args):
+    """Time from launching the app to its first / and /health responses"""
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'HRmontlyreport.py')
+    for prewarm in ('1', '0'):
+        with socket.socket() as probe:
+            probe.bind(('127.0.0.1', 0))
+            port = probe.getsockname()[1]
+        env = dict(os.environ, PORT=str(port), PREWARM_IMPORTS=prewarm)
+        start = time.perf_counter()
+        server = subprocess.Popen([sys.executable, script], env=env,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_for_response(f"http://127.0.0.1:{port}/health", args.timeout)
+            health_seconds = time.perf_counter() - start
+            wait_for_response(f"http://127.0.0.1:{port}/", args.timeout)
+            index_seconds = time.perf_counter() - start
+        finally:
+            server.terminate()
+            server.wait()
+        print(f"prewarm={prewarm}  first /health {health_seconds:.3f}s  first / {index_seconds:.3f}s")
+
+    code = ('import time; start = time.perf_counter(); import HRmontlyreport as hr; '
+            'hr.prewarm_heavy_modules(); print(time.perf_counter() - start)')
+    env = dict(os.environ, PREWARM_IMPORTS='0')
+    output = subprocess.run([sys.executable, '-c', code], env=env, cwd=os.path.dirname(script),
+                            capture_output=True, text=True, check=True).stdout
+    print(f"import with heavy modules loaded eagerly: {float(output.split()[-1]):.3f}s")
+
+
+def current_rss():
+    """Resident set size of this process in bytes"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class PeakRSS:
+    """Samples RSS in a background thread while the block runs; .peak is the maximum"""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = 0
+        self._done = threading.Event()
+
+    def _sample(self):
+        while not self._done.wait(self.interval):
+            self.peak = max(self.peak, current_rss())
+
+    def __enter__(self):
+        self.peak = current_rss()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._done.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss())
+
+
+def timed_stage(stages, name, func, *args):
+    """Run func(*args), recording its seconds and peak RSS under stages[name]"""
+    with PeakRSS() as memory:
+        start = time.perf_counter()
+        result = func(*args)
+        seconds = time.perf_counter() - start
+    stages[name] = {'seconds': round(seconds, 4), 'peak_rss_mb': round(memory.peak / 2**20, 1)}
+    return result
+
+
+def run_pipeline(path, stages):
+    """Push one workbook through ingest, parse, analyze and report as /upload_excel would"""
+    def ingest():
+        spool = hr.UploadSpool()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                spool.write(chunk)
+        # Spooled uploads are renamed into UPLOAD_FOLDER before parsing, as in /upload_excel
+        if spool.path:
+            spool.persist(os.path.join(hr.app.config['UPLOAD_FOLDER'], name))
+        return spool
+
+    name = os.path.basename(path)
+    spool = timed_stage(stages, 'ingest', ingest)
+    try:
+        if spool.size > hr.app.config['STREAMING_THRESHOLD_BYTES']:
+            source = spool.path or hr.io.BytesIO(spool.getvalue())
+            chunks = hr.iter_workbook_chunks(source, hr.app.config['STREAM_CHUNK_ROWS'])
+            analysis = timed_stage(stages, 'parse_analyze', hr.analyze_excel_data, {name: chunks})
+        else:
+            sheets, _ = timed_stage(stages, 'parse', hr.load_workbook_sheets, spool.path or spool.getvalue())
+            analysis = timed_stage(stages, 'analyze', hr.analyze_excel_data, {name: sheets})
+    finally:
+        spool.discard()
+    if not analysis['summary']['total_rows']:
+        raise RuntimeError(f"No rows were analyzed in {path}")
+
+    hr.chart_cache.clear()
+    with tempfile.TemporaryDirectory(dir=hr.app.config['TEMP_FOLDER']) as workspace:
+        timed_stage(stages, 'report', hr._build_pdf_report, workspace, analysis, 'Benchmark', 'Company')
+
+
+def bench_suite_run(args):
+    """Run the pipeline once on one workbook and print its stage metrics as JSON"""
+    with tempfile.TemporaryDirectory() as directory:
+        for key in ('UPLOAD_FOLDER', 'OUTPUT_FOLDER', 'TEMP_FOLDER', 'CHART_CACHE_FOLDER'):
+            hr.app.config[key] = directory
+        stages = {}
+        start = time.perf_counter()
+        run_pipeline(args.path, stages)
+        total_seconds = time.perf_counter() - start
+
+    # ru_maxrss is inherited from the parent across fork and exec, so the
+    # run's peak is taken from the stage samples instead
+    print(json.dumps({
+        'stages': stages,
+        'total_seconds': round(total_seconds, 4),
+        'peak_rss_mb': max(stage['peak_rss_mb'] for stage in stages.values()),
+    }))
+
+
+SUITE_STAGES = ['ingest', 'parse', 'analyze', 'parse_analyze', 'report']
+
+
+def bench_suite(args):
+    """Time each pipeline stage and its peak memory on synthetic workbooks of each size"""
+    os.makedirs(args.data_dir, exist_ok=True)
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            for line in f:
+                run = json.loads(line)
+                baseline[(run['kind'], run['rows'], run['sheets'], run['extra_columns'])] = run
+
+    print(f"{'kind':11s} {'rows':>8s} {'MB':>6s} " + ' '.join(f"{stage:>13s}" for stage in SUITE_STAGES)
+          + f" {'total s':>8s} {'peak MB':>8s}")
+    regressions = []
+    for kind in args.kinds.split(','):
+        for rows in [int(size) for size in args.sizes.split(',')]:
+            path = os.path.join(args.data_dir, f"{kind}_{rows}x{args.sheets}_{args.extra_columns}.xlsx")
+            if not os.path.exists(path):
+                hr_workbook_generator.generate_workbook(path, kind, rows, args.sheets, args.extra_columns)
+
+            # A fresh interpreter per run so peak memory belongs to this size alone;
+            # its snapshots, read plans and workbook cache stay out of the app's
+            env = dict(os.environ, PREWARM_IMPORTS='0', STORAGE_SWEEP_INTERVAL_SECONDS='0',
+                       SNAPSHOT_DIR=os.path.join(args.data_dir, 'snapshots'),
+                       READ_PLAN_DIR=os.path.join(args.data_dir, 'read_plans'),
+                       CACHE_DIR=os.path.join(args.data_dir, 'cache'))
+            output = subprocess.run([sys.executable, os.path.abspath(__file__), 'suite-run', path],
+                                    env=env, capture_output=True, text=True, check=True).stdout
+            run = json.loads(output.splitlines()[-1])
+            run.update(kind=kind, rows=rows, sheets=args.sheets, extra_columns=args.extra_columns,
+                       file_bytes=os.path.getsize(path), timestamp=time.time())
+
+            cells = [f"{run['stages'][stage]['seconds']:13.3f}" if stage in run['stages'] else f"{'-':>13s}"
+                     for stage in SUITE_STAGES]
+            line = (f"{kind:11s} {rows:8d} {run['file_bytes'] / 2**20:6.1f} " + ' '.join(cells)
+                    + f" {run['total_seconds']:8.3f} {run['peak_rss_mb']:8.1f}")
+            previous = baseline.get((kind, rows, args.sheets, args.extra_columns))
+            if previous:
+                time_ratio = run['total_seconds'] / previous['total_seconds']
+                memory_ratio = run['peak_rss_mb'] / previous['peak_rss_mb']
+                line += f"  x{time_ratio:.2f} time x{memory_ratio:.2f} memory"
+                if time_ratio > args.tolerance or memory_ratio > args.tolerance:
+                    line += '  REGRESSION'
+                    regressions.append((kind, rows))
+            print(line, flush=True)
+
+            if args.output:
+                with open(args.output, 'a') as f:
+                    f.write(json.dumps(run) + '\n')
+
+    if regressions:
+        print(f"{len(regressions)} run(s) slower or larger than {args.tolerance}x the baseline")
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    parse_parser = subparsers.add_parser('parallel-parse', help=bench_parallel_parse.__doc__)
+    parse_parser.add_argument('--files', type=int, default=4)
+    parse_parser.add_argument('--rows', type=int, default=20000)
+    parse_parser.add_argument('--workers', type=int, default=4)
+    parse_parser.set_defaults(func=bench_parallel_parse)
+
+    profile_parser = subparsers.add_parser('column-profile', help=bench_column_profile.__doc__)
+    profile_parser.add_argument('--rows', type=int, default=50000)
+    profile_parser.add_argument('--columns', type=int, default=200)
+    profile_parser.set_defaults(func=bench_column_profile)
+
+    chart_parser = subparsers.add_parser('chart-render', help=bench_chart_render.__doc__)
+    chart_parser.add_argument('--charts', type=int, default=12)
+    chart_parser.add_argument('--workers', type=int, default=4)
+    chart_parser.set_defaults(func=bench_chart_render)
+
+    format_parser = subparsers.add_parser('chart-format', help=bench_chart_format.__doc__)
+    format_parser.add_argument('--rows', type=int, default=20000)
+    format_parser.add_argument('--repeat', type=int, default=3)
+    format_parser.set_defaults(func=bench_chart_format)
+
+    startup_parser = subparsers.add_parser('startup', help=bench_startup.__doc__)
+    startup_parser.add_argument('--timeout', type=float, default=60)
+    startup_parser.set_defaults(func=bench_startup)
+
+    suite_parser = subparsers.add_parser('suite', help=bench_suite.__doc__)
+    suite_parser.add_argument('--kinds', default=','.join(hr_workbook_generator.WORKBOOK_KINDS))
+    suite_parser.add_argument('--sizes', default='1000,10000,100000,1000000', help='rows per sheet')
+    suite_parser.add_argument('--sheets', type=int, default=1)
+    suite_parser.add_argument('--extra-columns', type=int, default=0)
+    suite_parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'hr_benchmark_data'),
+                              help='generated workbooks are kept here and reused')
+    suite_parser.add_argument('--output', help='append each run as a JSON line')
+    suite_parser.add_argument('--baseline', help='JSON lines from an earlier --output to compare against')
+    suite_parser.add_argument('--tolerance', type=float, default=1.25,
+                              help='flag runs this many times slower or larger than the baseline')
+    suite_parser.set_defaults(func=bench_suite)
+
+    suite_run_parser = subparsers.add_parser('suite-run', help=bench_suite_run.__doc__)
+    suite_run_parser.add_argument('path')
+    suite_run_parser.set_defaults(func=bench_suite_run)
+
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,781 @@
+"""HR KPI engines for the monthly report.
+
+Uploaded sheets are matched to a known dataset by their headers
+(detect_dataset), projected onto that dataset's canonical columns chunk by
+chunk (project_dataset), and the concatenated rows are handed to the
+dataset's engine, which returns a small picklable summary for the analysis
+state and the PDF. Engines are vectorized over whole columns: no Python
+loops run per row or per employee.
+
+Row-level absence records feed the employee Bradford scores; the weekly
+Power BI export (absence_summary) only holds each site's Bradford figure per
+period, so it gets per-site series instead. The EU turnover workbook is an
+aggregated matrix (turnover_summary) with one row per measure and one column
+per month; it is melted to long rows and read into the same series as
+row-level turnover. Aggregated sick-leave statistics (sick_leave_summary)
+hold only precomputed rates, so they are recognised but not kept: spells
+need day-level rows.
+"""
+import re
+
+import numpy as np
+import pandas as pd
+
+# Canonical columns of each dataset and the header keywords that identify
+# them, most specific first. Keywords match whole words, case-insensitively.
+# A sheet is only treated as the dataset when a marker keyword appears in its
+# name or one of its headers and all required columns are found.
+DATASETS = {
+    # Before absence: sick leave sheets often head their dates 'Absence Date'
+    'sick_leave': {
+        'markers': ('sick', 'sickness', 'illness', 'sickleave'),
+        'required': ('employee', 'date'),
+        'columns': {
+            'employee': ('employee id', 'employee number', 'employee no', 'emp id', 'emp no',
+                         'personnel number', 'person id', 'staff id', 'employee'),
+            'date': ('sick date', 'absence date', 'date of absence', 'sick day', 'date', 'day'),
+            'country': ('country',),
+            'site': ('site', 'plant', 'location', 'unit'),
+            'collar': ('collar', 'bc wc', 'wc bc', 'employee type', 'staff type'),
+        },
+    },
+    'absence': {
+        'markers': ('absence', 'absent', 'bradford'),
+        'required': ('employee', 'start'),
+        'columns': {
+            'employee': ('employee id', 'employee number', 'employee no', 'emp id', 'emp no',
+                         'personnel number', 'person id', 'staff id', 'employee'),
+            'end': ('absence end', 'end date', 'last day', 'end', 'until', 'to date'),
+            'start': ('absence start', 'start date', 'first day', 'absence date', 'start', 'from', 'date'),
+            'days': ('working days', 'days lost', 'days', 'duration'),
+        },
+    },
+    # Pre-aggregated Power BI export: Year, Month, Week, "Absence Bradford <site>"
+    'absence_summary': {
+        'markers': ('bradford',),
+        'required': ('year', 'score'),
+        'columns': {
+            'year': ('year',),
+            'week': ('week',),
+            'month_name': ('month',),
+            'score': ('bradford',),
+            'site': ('site', 'plant', 'location'),
+        },
+    },
+    'turnover': {
+        'markers': ('hire', 'hired', 'termination', 'terminated', 'leaver', 'leaving', 'turnover'),
+        'required': ('hire',),
+        'columns': {
+            'employee': ('employee id', 'employee number', 'employee no', 'emp id', 'emp no',
+                         'personnel number', 'person id', 'staff id', 'employee'),
+            'termination_type': ('termination type', 'leaving reason', 'exit reason', 'termination reason'),
+            'termination': ('termination date', 'leaving date', 'leave date', 'exit date', 'end date',
+                            'termination', 'terminated', 'leaving'),
+            'hire': ('hire date', 'date of hire', 'join date', 'joining date', 'start date', 'hired', 'hire'),
+            'country': ('country',),
+            'site': ('site', 'plant', 'location', 'unit'),
+        },
+    },
+    # Aggregated monthly matrix: a label column of measures ('Total Headcount',
+    # 'Total Variance', ...) and one column per month, found in the first rows
+    'turnover_summary': {
+        'markers': ('turnover',),
+        'layout': 'matrix',
+    },
+    # Monthly sick-leave rates per site: nothing per employee to build spells from
+    'sick_leave_summary': {
+        'markers': ('sick', 'sickness', 'illness', 'sickleave'),
+        'layout': 'summary',
+    },
+}
+
+# Leading rows of a sheet searched for a matrix's month header
+MATRIX_SCAN_ROWS = 10
+MONTH_NAMES = ('january', 'february', 'march', 'april', 'may', 'june', 'july', 'august', 'september',
+               'october', 'november', 'december')
+
+DATE_COLUMNS = ('start', 'end', 'hire', 'termination', 'date')
+NUMERIC_COLUMNS = ('days',)
+
+
+def _matches(keyword, text):
+    return re.search(rf"\b{re.escape(keyword)}\b", text) is not None
+
+
+def _month_of(cell):
+    """1-12 for a month name or its abbreviation ('JAN', 'Sept.'), else None"""
+    if not isinstance(cell, str):
+        return None
+    text = cell.strip().lower().rstrip('.')
+    if len(text) < 3:
+        return None
+    return next((number for number, name in enumerate(MONTH_NAMES, 1) if name.startswith(text)), None)
+
+
+def _matrix_mapping(rows, sheet_name='', filename=''):
+    """Label column, month columns, year and site of a monthly matrix, or None.
+
+    The month header is the first of rows (the headers, then the first cells)
+    naming at least three months, with the label column to its left. The
+    year is the first one in the title, the sheet name or the file name; a
+    sheet whose name or title says 'total' holds the totals (site '').
+    """
+    headers = [str(cell) for cell in rows[0]]
+    for row in rows:
+        months = [(position, _month_of(cell)) for position, cell in enumerate(row)]
+        months = [(position, month) for position, month in months if month is not None]
+        if len({month for _, month in months}) >= 3 and months[0][0] > 0:
+            break
+    else:
+        return None
+    text = [str(cell) for row in rows for cell in row if isinstance(cell, str)] + [str(sheet_name), str(filename)]
+    years = (re.search(r'(?<!\d)(20\d\d)(?!\d)', cell) for cell in text)
+    year = next((int(found.group(1)) for found in years if found), None)
+    title = [str(sheet_name).lower()] + [header.lower() for header in headers]
+    return {
+        'label': headers[months[0][0] - 1],
+        'months': [(headers[position], month) for position, month in months],
+        'year': year,
+        'site': '' if any(re.search(r'\btotals?\b', cell) for cell in title) else str(sheet_name).strip(),
+    }
+
+
+def detect_dataset(columns, sheet_name='', head=None, filename=''):
+    """(dataset, {canonical column: header}) for a sheet, or (None, None).
+
+    Aggregated layouts are also looked for in the first rows of head (the
+    sheet's first chunk), as their headers are often titles: a matrix maps
+    to its label column, month columns, year and site (see
+    _matrix_mapping), a summary to an empty mapping, as it has no rows to
+    keep.
+    """
+    headers = [str(col) for col in columns]
+    lowered = [header.lower() for header in headers]
+    rows = [list(columns)] + (head.head(MATRIX_SCAN_ROWS).values.tolist() if head is not None else [])
+    cells = [str(cell).lower() for row in rows for cell in row if isinstance(cell, str)]
+    for dataset, spec in DATASETS.items():
+        layout = spec.get('layout')
+        context = [str(sheet_name).lower()] + (cells if layout else lowered)
+        if not any(_matches(marker, text) for marker in spec['markers'] for text in context):
+            continue
+        if layout == 'matrix':
+            mapping = _matrix_mapping(rows, sheet_name, filename)
+            if mapping is not None:
+                return dataset, mapping
+            continue
+        if layout == 'summary':
+            # A period axis: a 'Month' column or month names across the top
+            if any(text.strip() in ('month', 'months') for text in cells) or _matrix_mapping(rows) is not None:
+                return dataset, {}
+            continue
+        mapping = {}
+        for canonical, keywords in spec['columns'].items():
+            for keyword in keywords:
+                found = next((header for header, text in zip(headers, lowered)
+                              if header not in mapping.values() and _matches(keyword, text)), None)
+                if found is not None:
+                    mapping[canonical] = found
+                    break
+        if all(canonical in mapping for canonical in spec['required']):
+            return dataset, mapping
+    return None, None
+
+
+def project_dataset(df, mapping, sheet_name=''):
+    """The mapped columns of df under their canonical names and types.
+
+    A matrix becomes one (site, label, year, month, value) row per numeric
+    cell; labels are lower-cased with their whitespace collapsed.
+    """
+    if 'months' in mapping:
+        month_columns = [header for header, _ in mapping['months']]
+        values = df[month_columns].astype(object).apply(pd.to_numeric, errors='coerce').to_numpy(dtype='float64')
+        labels = df[mapping['label']]
+        labels = labels.astype(str).str.strip().str.lower().str.replace(r'\s+', ' ', regex=True).where(labels.notna())
+        labels = np.repeat(labels.to_numpy(dtype=object), len(month_columns))
+        keep = ~np.isnan(values.ravel()) & pd.notna(labels)
+        return pd.DataFrame({
+            'site': np.full(int(keep.sum()), mapping['site'], dtype=object),
+            'label': labels[keep],
+            'year': np.full(int(keep.sum()), np.nan if mapping['year'] is None else float(mapping['year'])),
+            'month': np.tile([month for _, month in mapping['months']], len(df))[keep],
+            'value': values.ravel()[keep],
+        })
+    projected = {}
+    for canonical, header in mapping.items():
+        values = df[header]
+        if canonical in DATE_COLUMNS:
+            values = pd.to_datetime(values, errors='coerce')
+        elif canonical in NUMERIC_COLUMNS:
+            # float64 whatever the loaded dtype, so day totals cannot overflow
+            values = pd.to_numeric(values, errors='coerce').astype('float64')
+        projected[canonical] = values.to_numpy()
+    # Series sheets hold one site, named after the Bradford keyword or by the sheet
+    if 'score' in mapping and 'site' not in mapping:
+        suffix = re.split(r'\bbradford\b', str(mapping['score']), flags=re.IGNORECASE)[-1].strip()
+        projected['site'] = np.full(len(df), suffix or str(sheet_name).strip(), dtype=object)
+    return pd.DataFrame(projected)
+
+
+def unit_codes(frame, columns):
+    """One code per distinct combination of columns (e.g. country, site) in frame.
+
+    Returns (codes per row, DataFrame of each code's column values); with no
+    columns every row is unit 0.
+    """
+    codes = np.zeros(len(frame), dtype='int64')
+    labels = []
+    for column in columns:
+        column_codes, uniques = pd.factorize(frame[column].fillna('').astype(str), sort=True)
+        codes = codes * len(uniques) + column_codes
+        labels.append(uniques)
+    present, codes = np.unique(codes, return_inverse=True)
+    positions = np.unravel_index(present, [len(uniques) for uniques in labels]) if labels else ()
+    unit_index = pd.DataFrame({column: uniques[position] for column, uniques, position in
+                               zip(columns, labels, positions)}, index=range(len(present)))
+    return codes, unit_index
+
+
+def collapse_spells(frame):
+    """Merge absence rows into spells of consecutive working days per employee.
+
+    frame has employee and start columns, optionally end and days. Rows are
+    sorted by employee and start; a row opens a new spell unless it starts
+    no later than the working day after the furthest end of the employee's
+    rows so far (so overlapping or back-to-back rows, including ones either
+    side of a weekend, form one spell). Returns (employee_codes, employee
+    labels, spell_employee, spell_start, spell_end, spell_days) with spells
+    ordered by employee then start.
+    """
+    frame = frame.dropna(subset=['employee', 'start'])
+    codes, labels = pd.factorize(frame['employee'])
+    start = frame['start'].to_numpy().astype('datetime64[D]')
+    end = frame['end'].to_numpy().astype('datetime64[D]') if 'end' in frame else start.copy()
+    end = np.where(np.isnat(end) | (end < start), start, end)
+
+    # Working days per row: the stated figure when there is one, else counted
+    counted = np.maximum(np.busday_count(start, end + np.timedelta64(1, 'D')), 1).astype(float)
+    if 'days' in frame:
+        stated = frame['days'].to_numpy(dtype=float)
+        days = np.where(np.isnan(stated), counted, stated)
+    else:
+        days = counted
+
+    order = np.lexsort((start, codes))
+    codes, start, end, days = codes[order], start[order], end[order], days[order]
+
+    first_of_employee = np.ones(len(codes), dtype=bool)
+    first_of_employee[1:] = codes[1:] != codes[:-1]
+    running_end = pd.Series(end.astype('int64')).groupby(codes).cummax().to_numpy()
+    previous_end = np.empty_like(running_end)
+    previous_end[1:] = running_end[:-1]
+    previous_end[0] = running_end[0]
+    next_working_day = np.busday_offset(previous_end.astype('datetime64[D]'), 1, roll='backward')
+    new_spell = first_of_employee | (start > next_working_day)
+
+    bounds = np.flatnonzero(new_spell)
+    return (codes, labels, codes[bounds], start[bounds],
+            np.maximum.reduceat(end, bounds), np.add.reduceat(days, bounds))
+
+
+def bradford_scores(frame, window_days=364, bands=((0, 'No concern'),), top_n=10, as_of=None):
+    """Bradford factor (spells squared times days) per employee over a rolling window.
+
+    The current score counts spells starting in the window_days up to as_of
+    (default: the last absence day in the data). The peak score is the
+    highest score of any window ending on one of the employee's spell
+    starts, found with a searchsorted window over spells sorted by employee
+    and start. bands is a list of (lowest score, label) in ascending order.
+    Needs row-level absences; see bradford_series for aggregated exports.
+    Returns None when frame has no usable rows.
+    """
+    if frame.empty:
+        return None
+    codes, labels, spell_employee, spell_start, spell_end, spell_days = collapse_spells(frame)
+    if len(spell_employee) == 0:
+        return None
+
+    # Rolling window per spell: offset each employee onto its own stretch of
+    # the day axis so one searchsorted finds every window's first spell
+    day = (spell_start - spell_start.min()).astype('int64')
+    stride = int(day.max()) + window_days + 1
+    key = spell_employee.astype('int64') * stride + day
+    first = np.searchsorted(key, key - (window_days - 1), side='left')
+    position = np.arange(len(key))
+    cumulative_days = np.concatenate([[0.0], np.cumsum(spell_days)])
+    window_spells = position - first + 1
+    window_days_lost = cumulative_days[position + 1] - cumulative_days[first]
+    rolling = window_spells ** 2 * window_days_lost
+
+    employees = len(labels)
+    employee_bounds = np.flatnonzero(np.r_[True, spell_employee[1:] != spell_employee[:-1]])
+    peak = np.zeros(employees)
+    peak[spell_employee[employee_bounds]] = np.maximum.reduceat(rolling, employee_bounds)
+
+    as_of = np.datetime64(as_of, 'D') if as_of is not None else spell_end.max()
+    in_window = (spell_start <= as_of) & (spell_start > as_of - np.timedelta64(window_days, 'D'))
+    current_spells = np.bincount(spell_employee[in_window], minlength=employees)
+    current_days = np.bincount(spell_employee[in_window], weights=spell_days[in_window], minlength=employees)
+    score = current_spells ** 2 * current_days
+
+    lower_bounds = np.array([lower for lower, _ in bands], dtype=float)
+    band_of = np.searchsorted(lower_bounds, score, side='right') - 1
+    band_counts = np.bincount(np.maximum(band_of, 0), minlength=len(bands))
+    band_rows = []
+    for index, (lower, label) in enumerate(bands):
+        upper = bands[index + 1][0] - 1 if index + 1 < len(bands) else None
+        band_rows.append({'label': label, 'min': lower, 'max': upper, 'employees': int(band_counts[index])})
+
+    top = np.argsort(-score, kind='stable')[:top_n]
+    top_rows = [{
+        'employee': str(labels[index]),
+        'spells': int(current_spells[index]),
+        'days': float(current_days[index]),
+        'score': float(score[index]),
+        'peak_score': float(peak[index]),
+    } for index in top if score[index] > 0]
+
+    return {
+        'as_of': str(as_of),
+        'window_days': window_days,
+        'rows': int(len(codes)),
+        'spells': int(len(spell_employee)),
+        'employees': employees,
+        'employees_in_window': int((current_spells > 0).sum()),
+        'mean_score': float(score.mean()),
+        'bands': band_rows,
+        'top': top_rows,
+    }
+
+
+def turnover_by_month(frame, months=12, as_of=None):
+    """Month-end headcount, joiners, leavers and turnover per country and site.
+
+    Every hire is a +1 event in its month and every termination a -1 event
+    in its month. Events are keyed by (unit, month), sorted once, and summed
+    cumulatively, so month-end headcount for every unit and month is read
+    off with one searchsorted instead of filtering the rows per month. The
+    period is the `months` calendar months up to as_of (default: the month
+    of the latest hire or termination). Annualized turnover is the period's
+    leavers over its average month-end headcount, scaled to twelve months;
+    monthly turnover is leavers over month-end headcount, as in the EU
+    turnover workbook. Returns None when frame has no usable rows.
+    """
+    frame = frame.dropna(subset=['hire'])
+    if frame.empty:
+        return None
+    hire = frame['hire'].to_numpy().astype('datetime64[M]').astype('int64')
+    termination = (frame['termination'].to_numpy().astype('datetime64[M]').astype('int64')
+                   if 'termination' in frame else np.full(len(frame), np.iinfo('int64').min))
+    left = (frame['termination'].notna().to_numpy() if 'termination' in frame
+            else np.zeros(len(frame), dtype=bool))
+    # A termination before the hire is a data error; treat the person as never employed
+    valid = ~left | (termination >= hire)
+    hire, termination, left, frame = hire[valid], termination[valid], left[valid], frame[valid]
+
+    unit_columns = [column for column in ('country', 'site') if column in frame]
+    codes, unit_index = unit_codes(frame, unit_columns)
+    unit_count = len(unit_index)
+
+    last = int(np.datetime64(as_of, 'M').astype('int64')) if as_of is not None else \
+        int(max(hire.max(), termination[left].max() if left.any() else hire.max()))
+    period = np.arange(last - months + 1, last + 1)
+
+    # Sweep: events sorted by (unit, month); the running sum at the last
+    # event on or before each (unit, month) is that unit's month-end headcount
+    origin = int(min(hire.min(), period[0]))
+    span = last - origin + 2
+    event_month = np.concatenate([hire, termination[left]])
+    event_unit = np.concatenate([codes, codes[left]])
+    delta = np.concatenate([np.ones(len(hire)), -np.ones(int(left.sum()))])
+    keep = event_month <= last
+    key = event_unit[keep].astype('int64') * span + (event_month[keep] - origin)
+    order = np.argsort(key, kind='stable')
+    key, running = key[order], np.concatenate([[0.0], np.cumsum(delta[keep][order])])
+
+    unit_base = np.arange(unit_count, dtype='int64') * span
+    query = unit_base[:, None] + (period - origin)[None, :]
+    headcount = running[np.searchsorted(key, query, side='right')] - \
+        running[np.searchsorted(key, unit_base, side='left')][:, None]
+
+    def monthly_counts(months_of, units_of, weights=None):
+        in_period = (months_of >= period[0]) & (months_of <= last)
+        flat = units_of[in_period] * months + (months_of[in_period] - period[0])
+        weights = weights[in_period] if weights is not None else None
+        return np.bincount(flat, weights=weights, minlength=unit_count * months).reshape(unit_count, months)
+
+    joiners = monthly_counts(hire, codes)
+    leavers = monthly_counts(termination[left], codes[left])
+    voluntary = None
+    if 'termination_type' in frame:
+        type_codes, types = pd.factorize(frame['termination_type'])
+        is_voluntary = np.array([str(value).lower().startswith('vol') for value in types] + [False])[type_codes]
+        voluntary = monthly_counts(termination[left], codes[left], is_voluntary[left].astype(float))
+
+    def summarize(rows):
+        """Totals for the units at `rows`, summed month by month"""
+        unit_headcount = headcount[rows].sum(axis=0)
+        unit_leavers = leavers[rows].sum(axis=0)
+        average = float(unit_headcount.mean())
+        with np.errstate(divide='ignore', invalid='ignore'):
+            monthly_rate = np.where(unit_headcount > 0, unit_leavers / unit_headcount, np.nan)
+        summary = {
+            'headcount': unit_headcount.astype(int).tolist(),
+            'joiners': joiners[rows].sum(axis=0).astype(int).tolist(),
+            'leavers': unit_leavers.astype(int).tolist(),
+            'turnover_rate': [None if np.isnan(rate) else float(rate) for rate in monthly_rate],
+            'average_headcount': average,
+            'annualized_turnover': float(unit_leavers.sum() / average * 12 / months) if average > 0 else None,
+        }
+        if voluntary is not None:
+            summary['voluntary'] = voluntary[rows].sum(axis=0).astype(int).tolist()
+        return summary
+
+    sites = []
+    for code, unit in unit_index.iterrows():
+        sites.append({**{column: unit[column] for column in unit_columns}, **summarize([code])})
+    countries = []
+    if 'country' in unit_columns:
+        for country, rows in unit_index.groupby('country').indices.items():
+            countries.append({'country': country, **summarize(rows)})
+
+    return {
+        'months': [str(np.datetime64(int(month), 'M')) for month in period],
+        'rows': int(len(frame)),
+        'total': summarize(list(range(unit_count))),
+        'countries': countries,
+        'sites': sites if 'site' in unit_columns else [],
+    }
+
+
+def turnover_matrix(frame, months=12, as_of=None):
+    """turnover_by_month's summary from aggregated monthly turnover matrices.
+
+    frame holds project_dataset's (site, label, year, month, value) rows,
+    site '' for totals sheets. Month-end headcount is the 'Total Headcount'
+    row and leavers the 'Total Variance' (or 'Total Turnover') row, else the
+    per-category rows summed; the first of repeated labels wins, as the
+    workbook repeats its totals excluding temps below them. A sheet that
+    repeats another's cells exactly (the workbook's 'Sheet2') is dropped.
+    The matrices record no joiners (None), and months with no headcount,
+    before the data starts or not yet filled in, count as not reported:
+    their leavers are ignored and average headcount and annualized turnover
+    cover the reported months only. The period is the `months` months up
+    to as_of, else to the latest month every unit reports. Totals come
+    from a totals sheet, else the sites summed. Returns None when no month
+    has a headcount.
+    """
+    frame = frame.dropna(subset=['year']).drop_duplicates(['site', 'label', 'year', 'month'])
+    if frame.empty:
+        return None
+    signature = pd.util.hash_pandas_object(frame[['label', 'year', 'month', 'value']], index=False)
+    signature = signature.groupby(frame['site'].to_numpy(), sort=False).sum()
+    frame = frame[frame['site'].isin(signature.drop_duplicates().index)]
+    absolute = (frame['year'].astype(int) * 12 + frame['month'].astype(int) - 1).rename('period')
+    table = frame.pivot_table(index=['site', 'label'], columns=absolute, values='value', aggfunc='first')
+
+    def measure(rows, totals, pattern):
+        """The first of the total labels present, else the matching category rows summed"""
+        for label in totals:
+            if label in rows.index:
+                return rows.loc[label]
+        labels = rows.index.to_series()
+        parts = rows[labels.str.contains(pattern).to_numpy() & ~labels.str.startswith('total').to_numpy()]
+        return parts.sum(min_count=1)
+
+    units = {}
+    for site, rows in table.groupby(level='site', sort=False):
+        rows = rows.droplevel('site')
+        units[site] = {
+            'headcount': measure(rows, ('total headcount',), r'\bheadcount$'),
+            'leavers': measure(rows, ('total variance', 'total turnover'), r'\btotal turnover$'),
+            'voluntary': measure(rows, (), r'\bvoluntary\b'),
+        }
+    sites = [site for site in units if site != '']
+    if '' not in units:
+        units[''] = {name: pd.concat([units[site][name] for site in sites], axis=1).sum(axis=1)
+                     for name in ('headcount', 'leavers', 'voluntary')}
+
+    # Sheets are filled in month by month: by default the period ends at the
+    # latest month every unit has a headcount for
+    latest = [int(reported.index[reported.to_numpy()].max()) for reported in
+              (unit['headcount'].fillna(0) > 0 for unit in units.values()) if reported.any()]
+    if not latest:
+        return None
+    last = int(np.datetime64(as_of, 'M').astype('int64')) + 1970 * 12 if as_of is not None else min(latest)
+    period = np.arange(last - months + 1, last + 1)
+
+    def summarize(unit):
+        headcount = unit['headcount'].reindex(period).fillna(0).to_numpy()
+        present = headcount > 0
+        leavers = np.where(present, unit['leavers'].reindex(period).fillna(0).to_numpy(), 0)
+        voluntary = np.where(present, unit['voluntary'].reindex(period).fillna(0).to_numpy(), 0)
+        average = float(headcount[present].mean()) if present.any() else 0.0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            monthly_rate = np.where(present, leavers / headcount, np.nan)
+        return {
+            'headcount': headcount.astype(int).tolist(),
+            'joiners': [None] * months,
+            'leavers': leavers.astype(int).tolist(),
+            'turnover_rate': [None if np.isnan(rate) else float(rate) for rate in monthly_rate],
+            'average_headcount': average,
+            'annualized_turnover': float(leavers.sum() / average * 12 / present.sum()) if average > 0 else None,
+            'voluntary': voluntary.astype(int).tolist(),
+        }
+
+    return {
+        'months': [f"{month // 12:04d}-{month % 12 + 1:02d}" for month in period],
+        'rows': int(len(frame)),
+        'aggregated': True,
+        'total': summarize(units['']),
+        'countries': [],
+        'sites': [{'site': site, **summarize(units[site])} for site in sites],
+    }
+
+
+def _lookup(table, unit, default=None):
+    """table's entry for a unit's site, else its country, else default"""
+    for column in ('site', 'country'):
+        if unit.get(column) in table:
+            return table[unit[column]]
+    return table.get('default', default)
+
+
+def sick_leave_spells(frame, holidays=None, short_term_days=None, headcount=None):
+    """Sick-leave spells, short/long-term split and absence rate from day-level rows.
+
+    frame has one row per employee and sick day (employee, date, optionally
+    country, site and collar). Working days come from precomputed masks over
+    the data's date range, one per holiday calendar: the cumulative count of
+    working days gives every date a working-day number, so after sorting by
+    employee and date a gap of more than one working day between rows (a
+    diff of the numbers) starts a new spell, and a cumulative sum of those
+    starts numbers the spells. Weekends and holidays inside a spell do not
+    break it.
+
+    holidays and short_term_days map a site code, country or 'default' to a
+    list of dates and to the longest short-term spell in calendar days.
+    headcount maps a site or country to its average headcount; units
+    without one are rated against the employees with sick leave instead.
+    Returns None when frame has no usable rows.
+    """
+    holidays = holidays or {}
+    short_term_days = short_term_days or {}
+    headcount = headcount or {}
+    frame = frame.dropna(subset=['employee', 'date'])
+    if frame.empty:
+        return None
+
+    unit_columns = [column for column in ('country', 'site') if column in frame]
+    units, unit_index = unit_codes(frame, unit_columns)
+    unit_records = unit_index.to_dict('records') or [{}]
+    unit_count = len(unit_records)
+    employees, _ = pd.factorize(frame['employee'])
+    dates = frame['date'].to_numpy().astype('datetime64[D]')
+
+    # Working-day masks and numbers, one row per distinct holiday calendar
+    first, last = dates.min(), dates.max()
+    calendar_days = np.arange(first, last + np.timedelta64(1, 'D'))
+    calendars, calendar_of_unit = np.unique(
+        [','.join(sorted(map(str, _lookup(holidays, unit, [])))) for unit in unit_records], return_inverse=True)
+    working = np.array([np.is_busday(calendar_days, holidays=[day for day in calendar.split(',') if day])
+                        for calendar in calendars])
+    working_number = np.cumsum(working, axis=1)
+
+    order = np.lexsort((dates, employees))
+    employees, units, dates = employees[order], units[order], dates[order]
+    calendar = calendar_of_unit[units]
+    offset = (dates - first).astype('int64')
+    number = working_number[calendar, offset]
+
+    new_spell = np.ones(len(dates), dtype=bool)
+    new_spell[1:] = (employees[1:] != employees[:-1]) | (np.diff(number) > 1)
+    spell_id = np.cumsum(new_spell) - 1
+    bounds = np.flatnonzero(new_spell)
+
+    spell_unit = units[bounds]
+    spell_calendar = calendar[bounds]
+    start_offset, end_offset = offset[bounds], np.maximum.reduceat(offset, bounds)
+    length = end_offset - start_offset + 1
+    spell_days = (working_number[spell_calendar, end_offset] - working_number[spell_calendar, start_offset] +
+                  working[spell_calendar, start_offset])
+    threshold = np.array([_lookup(short_term_days, unit, 14) for unit in unit_records])[spell_unit]
+    long_term = length > threshold
+
+    # Rated against headcount where known, else the distinct employees with sick leave
+    distinct = np.unique(units.astype('int64') * (employees.max() + 1) + employees) // (employees.max() + 1)
+    sick_employees = np.bincount(distinct, minlength=unit_count)
+    unit_headcount = np.array([_lookup(headcount, unit, None) or sick_employees[index]
+                               for index, unit in enumerate(unit_records)], dtype=float)
+    available = unit_headcount * working[calendar_of_unit].sum(axis=1)
+
+    def totals(group, group_count, available_days=None):
+        """Spell KPIs per group code of each spell"""
+        spells = np.bincount(group, minlength=group_count)
+        days = np.bincount(group, weights=spell_days, minlength=group_count)
+        long_spells = np.bincount(group[long_term], minlength=group_count)
+        long_days = np.bincount(group[long_term], weights=spell_days[long_term], minlength=group_count)
+        rows = []
+        for index in range(group_count):
+            rate = None
+            if available_days is not None and available_days[index] > 0:
+                rate = float(days[index] / available_days[index])
+            rows.append({
+                'spells': int(spells[index]),
+                'days': float(days[index]),
+                'average_length': float(days[index] / spells[index]) if spells[index] else None,
+                'short_term_spells': int(spells[index] - long_spells[index]),
+                'long_term_spells': int(long_spells[index]),
+                'short_term_days': float(days[index] - long_days[index]),
+                'long_term_days': float(long_days[index]),
+                'absence_rate': rate,
+            })
+        return rows
+
+    result = {
+        'first': str(first),
+        'last': str(last),
+        'rows': int(len(dates)),
+        'spells': int(spell_id[-1] + 1),
+        'employees': int(employees.max() + 1),
+        'rate_basis': 'headcount' if any(_lookup(headcount, unit) for unit in unit_records) else 'sick employees',
+        'total': totals(np.zeros(len(bounds), dtype='int64'), 1, [available.sum()])[0],
+        'sites': [],
+        'collars': [],
+    }
+    if unit_columns:
+        result['sites'] = [{**unit, **row} for unit, row in
+                           zip(unit_records, totals(spell_unit, unit_count, available))]
+    if 'collar' in frame:
+        collar_codes, collars = pd.factorize(frame['collar'].fillna('').astype(str).to_numpy()[order][bounds])
+        result['collars'] = [{'collar': collar, **row} for collar, row in
+                             zip(collars, totals(collar_codes, len(collars)))]
+    return result
+
+
+def _month_numbers(values):
+    """Month numbers from month names ('January', 'Jan') or numbers"""
+    text = pd.Series(values).astype(str).str.strip().str[:3].str.title()
+    names = pd.to_datetime(text, format='%b', errors='coerce').dt.month
+    return names.fillna(pd.to_numeric(pd.Series(values), errors='coerce').where(lambda month: month.between(1, 12)))
+
+
+def bradford_series(frame):
+    """Per-site Bradford figures over time from a pre-aggregated export.
+
+    frame holds one score per site and period (year plus ISO week, or
+    month_name). Percentage strings such as '20.7%' are read as fractions.
+    Returns the ordered period labels and, per site, the values aligned to
+    them with the latest, previous and range; None when no row has a
+    period and a score.
+    """
+    if frame.empty:
+        return None
+    year = pd.to_numeric(pd.Series(frame['year']), errors='coerce')
+    start = pd.Series(pd.NaT, index=year.index, dtype='datetime64[ns]')
+    label = pd.Series(None, index=year.index, dtype=object)
+    if 'week' in frame:
+        week = pd.to_numeric(pd.Series(frame['week']), errors='coerce')
+        weekly = year.notna() & week.between(1, 53)
+        iso = year[weekly].astype(int).astype(str) + '-W' + week[weekly].astype(int).astype(str).str.zfill(2)
+        start[weekly] = pd.to_datetime(iso + '-1', format='%G-W%V-%u', errors='coerce')
+        label[weekly] = iso.str.replace('-', ' ')
+    if 'month_name' in frame:
+        month = _month_numbers(frame['month_name'])
+        monthly = start.isna() & year.notna() & month.notna()
+        start[monthly] = pd.to_datetime(pd.DataFrame({'year': year[monthly], 'month': month[monthly], 'day': 1}))
+        label[monthly] = start[monthly].dt.strftime('%Y-%m')
+
+    text = pd.Series(frame['score']).astype(str).str.strip()
+    percent = text.str.endswith('%')
+    score = pd.to_numeric(text.str.rstrip('%'), errors='coerce')
+    score = score.where(~percent, score / 100).round(6)
+    rows = pd.DataFrame({'site': pd.Series(frame['site']).astype(str), 'start': start, 'label': label, 'score': score})
+    rows = rows.dropna(subset=['start', 'score'])
+    if rows.empty:
+        return None
+    rows = rows.sort_values('start', kind='stable').drop_duplicates(['site', 'start'], keep='last')
+
+    periods = rows.drop_duplicates('start')
+    table = rows.pivot(index='site', columns='start', values='score').reindex(columns=periods['start'])
+    labels = periods['label'].tolist()
+    months = periods['start'].dt.strftime('%Y-%m').tolist()
+    sites = []
+    for site, values in zip(table.index, table.to_numpy()):
+        present = np.flatnonzero(~np.isnan(values))
+        latest = float(values[present[-1]])
+        previous = float(values[present[-2]]) if len(present) > 1 else None
+        sites.append({
+            'site': site,
+            'latest_period': labels[present[-1]],
+            'latest_month': months[present[-1]],
+            'latest': latest,
+            'previous': previous,
+            'change': latest - previous if previous is not None else None,
+            'low': float(np.nanmin(values)),
+            'high': float(np.nanmax(values)),
+            'values': [None if np.isnan(value) else float(value) for value in values],
+        })
+    return {
+        'periods': labels,
+        'first': labels[0],
+        'last': labels[-1],
+        'month': months[-1],
+        'rows': len(rows),
+        'percent': bool(percent[rows.index].any()),
+        'average': float(np.mean([site['latest'] for site in sites])),
+        'sites': sites,
+    }
+
+
+def kpi_records(kpis, month=None):
+    """Flatten engine results into (month, dataset, scope, country, site, kpi, value) rows.
+
+    Each KPI is filed under its own reporting month (the last month its data
+    covers) unless month is given. Turnover contributes the reporting month's
+    figures; scope is 'total', 'country' or 'site'.
+    """
+    records = []
+
+    def add(dataset, kpi_month, unit, values):
+        scope = 'site' if unit.get('site') is not None else 'country' if unit.get('country') is not None else 'total'
+        for kpi, value in values.items():
+            if value is None:
+                continue
+            records.append({'month': month or kpi_month, 'dataset': dataset, 'scope': scope,
+                            'country': unit.get('country') or '', 'site': unit.get('site') or '',
+                            'kpi': kpi, 'value': float(value)})
+
+    bradford = kpis.get('bradford')
+    if bradford:
+        add('bradford', bradford['as_of'][:7], {}, {
+            'employees_in_window': bradford['employees_in_window'],
+            'mean_score': bradford['mean_score'],
+            'flagged': sum(band['employees'] for band in bradford['bands'][1:]),
+        })
+    turnover = kpis.get('turnover')
+    if turnover:
+        for unit in [turnover['total']] + turnover['countries'] + turnover['sites']:
+            add('turnover', turnover['months'][-1], unit, {
+                'headcount': unit['headcount'][-1],
+                'joiners': unit['joiners'][-1],
+                'leavers': unit['leavers'][-1],
+                'turnover_rate': unit['turnover_rate'][-1],
+                'annualized_turnover': unit['annualized_turnover'],
+            })
+    series = kpis.get('bradford_series')
+    if series:
+        # Each site's latest figure; the total is their average
+        add('bradford_series', series['month'], {}, {'score': series['average']})
+        for site in series['sites']:
+            add('bradford_series', site['latest_month'], {'site': site['site']}, {'score': site['latest']})
+    sick_leave = kpis.get('sick_leave')
+    if sick_leave:
+        for unit in [sick_leave['total']] + sick_leave['sites']:
+            add('sick_leave', sick_leave['last'][:7], unit, {
+                'spells': unit['spells'],
+                'average_length': unit['average_length'],
+                'long_term_spells': unit['long_term_spells'],
+                'absence_rate': unit['absence_rate'],
+            })
+    return records
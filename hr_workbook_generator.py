@@ -0,0 +1,209 @@
+"""Synthetic HR workbooks shaped like the reports' real inputs.
+
+Generates row-level absence (Bradford), sick leave, EU turnover and
+Power BI extract workbooks, one sheet per site, for benchmarks and demos:
+
+    python hr_workbook_generator.py absence --rows 100000 --sheets 3 -o absence.xlsx
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+# Site code -> (country, location), as used in the monthly HR workbooks
+SITES = {
+    'PAGO': ('SE', 'Gothenburg'),
+    'PASI': ('SE', 'Simrishamn'),
+    'PARA': ('NO', 'Raufoss'),
+    'PAGE': ('BE', 'Ghent'),
+    'PACA': ('PT', 'Carregado'),
+    'PAST': ('CZ', 'Strakonice'),
+    'PAIN': ('SE', 'HQ'),
+}
+DEPARTMENTS = ['Production', 'Logistics', 'Quality', 'Maintenance', 'Engineering', 'Finance', 'HR', 'Sales']
+ABSENCE_REASONS = ['Illness', 'Injury', 'Family', 'Medical appointment', 'Unauthorised', 'Other']
+POWER_BI_MEASURES = ['Headcount', 'Absence %', 'Sick Leave %', 'Turnover %', 'Overtime Hours', 'Bradford Score']
+
+# Excel's row limit, less the header row
+MAX_SHEET_ROWS = 1048575
+
+START_DATE = np.datetime64('2023-01-01')
+END_DATE = np.datetime64('2025-12-31')
+
+
+def _random_dates(rng, start, end, size):
+    """size dates drawn uniformly from [start, end)"""
+    return start + rng.integers(0, (end - start).astype('int64'), size).astype('timedelta64[D]')
+
+
+def _employee_ids(rng, site_index, employees, rows):
+    """rows employee ids drawn from a site's pool of `employees` people"""
+    return 100000 * (site_index + 1) + rng.integers(0, max(employees, 1), rows)
+
+
+def absence_frame(rows, rng, site, site_index=0):
+    """Absence spells, one row each, as used for Bradford factor reporting"""
+    days = np.minimum(rng.geometric(0.35, rows), 60)
+    start = np.busday_offset(_random_dates(rng, START_DATE, END_DATE, rows), 0, roll='forward')
+    end = start + (days - 1).astype('timedelta64[D]')
+    return pd.DataFrame({
+        'Employee ID': _employee_ids(rng, site_index, rows // 6, rows),
+        'Site': site,
+        'Department': rng.choice(DEPARTMENTS, rows),
+        'Absence Start': start,
+        'Absence End': end,
+        'Days': np.busday_count(start, end + np.timedelta64(1, 'D')),
+        'Reason': rng.choice(ABSENCE_REASONS, rows, p=[0.55, 0.1, 0.12, 0.13, 0.03, 0.07]),
+    })
+
+
+def sick_leave_frame(rows, rng, site, site_index=0):
+    """Sick leave as one row per working day off, so spells span several rows"""
+    # Mostly short spells with a long-term tail, cut to exactly `rows` days
+    lengths = np.where(rng.random(rows // 3 + 1) < 0.9, rng.geometric(0.3, rows // 3 + 1),
+                       rng.integers(15, 120, rows // 3 + 1))
+    lengths = lengths[:np.searchsorted(np.cumsum(lengths), rows) + 1]
+    spells = len(lengths)
+    spell_start = np.busday_offset(_random_dates(rng, START_DATE, END_DATE, spells), 0, roll='forward')
+    spell_of_row = np.repeat(np.arange(spells), lengths)[:rows]
+    day_in_spell = np.arange(len(spell_of_row)) - np.repeat(np.cumsum(lengths) - lengths, lengths)[:rows]
+    employees = _employee_ids(rng, site_index, max(spells // 4, 1), spells)
+    collar = rng.choice(['BC', 'WC'], spells, p=[0.7, 0.3])
+    departments = rng.choice(DEPARTMENTS, spells)
+    return pd.DataFrame({
+        'Employee ID': employees[spell_of_row],
+        'Site': site,
+        'Department': departments[spell_of_row],
+        'Collar': collar[spell_of_row],
+        'Sick Date': np.busday_offset(spell_start[spell_of_row], day_in_spell, roll='forward'),
+        'Hours': rng.choice([8.0, 8.0, 8.0, 4.0, 6.0], rows),
+        'Certified': np.where(day_in_spell >= 7, 'Yes', 'No'),
+    })
+
+
+def turnover_frame(rows, rng, site, site_index=0):
+    """Employment records with hire and (for leavers) termination dates"""
+    hire = _random_dates(rng, np.datetime64('2010-01-01'), END_DATE, rows)
+    tenure = rng.exponential(6 * 365, rows).astype('int64').astype('timedelta64[D]')
+    termination = hire + tenure
+    left = termination <= END_DATE
+    voluntary = rng.random(rows) < 0.7
+    return pd.DataFrame({
+        'Employee ID': 100000 * (site_index + 1) + np.arange(rows),
+        'Country': SITES[site][0],
+        'Site': site,
+        'Labour Type': rng.choice(['Direct', 'Indirect'], rows, p=[0.65, 0.35]),
+        'Hire Date': hire,
+        'Termination Date': pd.Series(termination).where(left),
+        'Termination Type': np.where(left, np.where(voluntary, 'Voluntary', 'Involuntary'), None),
+    })
+
+
+def power_bi_frame(rows, rng, site, site_index=0):
+    """Long-format KPI extract: one measure value per site, period and measure"""
+    quarters = np.array([f"{year % 100}Q{quarter}" for year in range(2019, 2026) for quarter in range(1, 5)])
+    sort_order = np.array([year * 100 + 3 * quarter - 2 for year in range(2019, 2026) for quarter in range(1, 5)])
+    period = rng.integers(0, len(quarters), rows)
+    measure = rng.integers(0, len(POWER_BI_MEASURES), rows)
+    scale = np.array([400, 0.08, 0.05, 0.12, 2500, 90])[measure]
+    return pd.DataFrame({
+        'Site': site,
+        'Measure': np.array(POWER_BI_MEASURES)[measure],
+        'Period': quarters[period],
+        'Value': (scale * rng.gamma(8, 1 / 8, rows)).round(3),
+        'SortOrder': sort_order[period],
+    })
+
+
+WORKBOOK_KINDS = {
+    'absence': absence_frame,
+    'sick_leave': sick_leave_frame,
+    'turnover': turnover_frame,
+    'power_bi': power_bi_frame,
+}
+
+
+def add_extra_columns(df, count, rng):
+    """Widen df with count filler columns cycling numeric, code, note and date"""
+    rows = len(df)
+    for index in range(count):
+        kind = index % 4
+        if kind == 0:
+            df[f"Extra Amount {index}"] = rng.normal(100, 25, rows).round(2)
+        elif kind == 1:
+            df[f"Extra Code {index}"] = rng.choice([f"C{n:02d}" for n in range(12)], rows)
+        elif kind == 2:
+            df[f"Extra Note {index}"] = np.char.add('note ', rng.integers(0, rows * 10 + 1, rows).astype(str))
+        else:
+            df[f"Extra Date {index}"] = START_DATE + rng.integers(0, 1000, rows).astype('timedelta64[D]')
+    return df
+
+
+def sample_frames(kind, rows, sheets=1, extra_columns=0, seed=0):
+    """{sheet name: DataFrame} for a workbook of `sheets` sheets of `rows` rows each"""
+    if kind not in WORKBOOK_KINDS:
+        raise ValueError(f"Unknown workbook kind {kind!r}; expected one of {', '.join(WORKBOOK_KINDS)}")
+    if rows > MAX_SHEET_ROWS:
+        raise ValueError(f"A sheet holds at most {MAX_SHEET_ROWS} rows")
+
+    rng = np.random.default_rng(seed)
+    site_codes = list(SITES)
+    frames = {}
+    for index in range(sheets):
+        site = site_codes[index % len(site_codes)]
+        name = site if index < len(site_codes) else f"{site} {index // len(site_codes) + 1}"
+        df = WORKBOOK_KINDS[kind](rows, rng, site, index % len(site_codes))
+        frames[name] = add_extra_columns(df, extra_columns, rng)
+    return frames
+
+
+def write_workbook(path, frames):
+    """Write {sheet name: DataFrame} to an .xlsx with openpyxl's write-only mode.
+
+    Write-only mode streams rows to the file instead of building the whole
+    worksheet in memory, which keeps million-row sheets feasible.
+    """
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    for sheet_name, df in frames.items():
+        worksheet = workbook.create_sheet(sheet_name)
+        worksheet.append(list(df.columns))
+        columns = []
+        for column in df.columns:
+            values = df[column]
+            if pd.api.types.is_datetime64_any_dtype(values):
+                values = values.dt.to_pydatetime()
+                values = [None if value is pd.NaT else value for value in values]
+            else:
+                values = values.astype(object).where(values.notna(), None).tolist()
+            columns.append(values)
+        for row in zip(*columns):
+            worksheet.append(row)
+    workbook.save(path)
+    return path
+
+
+def generate_workbook(path, kind, rows, sheets=1, extra_columns=0, seed=0):
+    """Generate and write one synthetic workbook; returns path"""
+    return write_workbook(path, sample_frames(kind, rows, sheets, extra_columns, seed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('kind', choices=list(WORKBOOK_KINDS))
+    parser.add_argument('--rows', type=int, default=10000, help='rows per sheet')
+    parser.add_argument('--sheets', type=int, default=1)
+    parser.add_argument('--extra-columns', type=int, default=0, help='filler columns added to every sheet')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--output', help='defaults to <kind>_<rows>.xlsx')
+    args = parser.parse_args()
+
+    path = args.output or f"{args.kind}_{args.rows}.xlsx"
+    generate_workbook(path, args.kind, args.rows, args.sheets, args.extra_columns, args.seed)
+    print(f"Wrote {path} ({os.path.getsize(path) / 1024:.0f} KB)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,37 @@
+import io
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('PREWARM_IMPORTS', '0')
+
+import HRmontlyreport  # noqa: E402
+
+
+@pytest.fixture
+def app_config(tmp_path, monkeypatch):
+    """app.config with the read plan, temp and snapshot folders under tmp_path"""
+    config = HRmontlyreport.app.config
+    for key, name in [('READ_PLAN_FOLDER', 'read_plans'), ('TEMP_FOLDER', 'temp'),
+                      ('SNAPSHOT_FOLDER', 'snapshots'), ('CACHE_FOLDER', 'cache')]:
+        folder = tmp_path / name
+        folder.mkdir()
+        monkeypatch.setitem(config, key, str(folder))
+    (tmp_path / 'read_plans' / 'pending').mkdir()
+    monkeypatch.setattr(HRmontlyreport, 'read_plans_cache', {'stamp': None, 'plans': {}})
+    return config
+
+
+def workbook_bytes(sheets):
+    """An .xlsx holding sheets ({name: DataFrame or list of rows})"""
+    buffer = io.BytesIO()
+    with pd.ExcelWriter(buffer, engine='openpyxl') as writer:
+        for name, data in sheets.items():
+            if isinstance(data, pd.DataFrame):
+                data.to_excel(writer, sheet_name=name, index=False)
+            else:
+                pd.DataFrame(data).to_excel(writer, sheet_name=name, index=False, header=False)
+    return buffer.getvalue()
@@ -0,0 +1,177 @@
+import pandas as pd
+import pytest
+
+import HRmontlyreport as m
+import hr_kpis
+
+
+def absences(rows):
+    return pd.DataFrame(rows, columns=['employee', 'start', 'end']).assign(
+        start=lambda df: pd.to_datetime(df['start']), end=lambda df: pd.to_datetime(df['end']))
+
+
+@pytest.mark.parametrize('columns, sheet, dataset', [
+    (['Employee ID', 'Absence Start', 'Absence End'], 'PAGO', 'absence'),
+    (['Employee ID', 'Absence Date', 'Site', 'Collar'], 'Sick leave 2025', 'sick_leave'),
+    (['Employee ID', 'Sick Date', 'Country'], 'PASI', 'sick_leave'),
+    (['Year', 'Month', 'Week', 'Absence Bradford PAGO'], 'PAGO', 'absence_summary'),
+    (['Employee ID', 'Hire Date', 'Termination Date', 'Site'], 'PARA', 'turnover'),
+    (['Site', 'JAN', 'FEB'], 'Totals', None),
+    (['Month', 'WC ST', 'BC ST', 'WC LT', 'BC LT'], 'PAGO sick leave', 'sick_leave_summary'),
+    (['Short term sick leave is a period of 14 days. Sick hours per month / working hours'], 'Definitions', None),
+])
+def test_detect_dataset(columns, sheet, dataset):
+    assert hr_kpis.detect_dataset(columns, sheet)[0] == dataset
+
+
+def test_bradford_scores_by_hand():
+    # A: two spells (2 + 1 days) -> 2² x 3 = 12; B: Fri + Mon is one 2-day spell -> 1² x 2 = 2
+    frame = absences([
+        ('A', '2025-03-03', '2025-03-04'),
+        ('A', '2025-03-12', None),
+        ('B', '2025-03-07', None),
+        ('B', '2025-03-10', None),
+    ])
+    result = hr_kpis.bradford_scores(frame, window_days=364, bands=((0, 'No concern'), (10, 'Review')))
+    assert result['as_of'] == '2025-03-12'
+    assert result['spells'] == 3 and result['employees'] == 2
+    assert [(row['employee'], row['spells'], row['days'], row['score']) for row in result['top']] == \
+        [('A', 2, 3.0, 12.0), ('B', 1, 2.0, 2.0)]
+    assert [band['employees'] for band in result['bands']] == [1, 1]
+    assert result['mean_score'] == 7.0
+
+
+def test_bradford_window_drops_old_spells():
+    frame = absences([('A', '2024-01-08', None), ('A', '2025-03-03', None), ('A', '2025-03-12', None)])
+    result = hr_kpis.bradford_scores(frame, window_days=364)
+    # Only the two 2025 spells are in the window; the peak window also holds just two
+    assert result['top'][0]['score'] == 2 ** 2 * 2
+    assert result['top'][0]['peak_score'] == 8.0
+
+
+def test_bradford_series_by_hand():
+    frame = pd.DataFrame({
+        'year': [2025, 2025, 2025, 2025],
+        'week': [17, 18, 17, 18],
+        'score': ['10.0%', '12.5%', '4%', '3%'],
+        'site': ['PAGO', 'PAGO', 'PASI', 'PASI'],
+    })
+    series = hr_kpis.bradford_series(frame)
+    assert series['periods'] == ['2025 W17', '2025 W18'] and series['month'] == '2025-04'
+    assert series['percent']
+    pago, pasi = series['sites']
+    assert (pago['latest'], pago['previous'], pago['change']) == (0.125, 0.1, pytest.approx(0.025))
+    assert (pasi['low'], pasi['high']) == (0.03, 0.04)
+    assert series['average'] == pytest.approx((0.125 + 0.03) / 2)
+
+
+def test_turnover_by_month_by_hand():
+    frame = pd.DataFrame({
+        'employee': ['A', 'B', 'C'],
+        'hire': pd.to_datetime(['2024-01-15', '2024-02-01', '2023-12-01']),
+        'termination': pd.to_datetime(['2024-03-10', None, '2024-02-28']),
+        'termination_type': ['Voluntary', None, 'Involuntary'],
+        'site': ['X', 'X', 'Y'],
+    })
+    result = hr_kpis.turnover_by_month(frame, months=3, as_of='2024-03-31')
+    assert result['months'] == ['2024-01', '2024-02', '2024-03']
+    total = result['total']
+    # Month-end: X holds A, then A and B, then B; Y holds C until C leaves in February
+    assert total['headcount'] == [2, 2, 1]
+    assert total['joiners'] == [1, 1, 0] and total['leavers'] == [0, 1, 1] and total['voluntary'] == [0, 0, 1]
+    assert total['turnover_rate'] == [0.0, 0.5, 1.0]
+    assert total['annualized_turnover'] == pytest.approx(2 / (5 / 3) * 12 / 3)
+    x, y = result['sites']
+    assert (x['site'], x['headcount'], x['leavers']) == ('X', [1, 2, 1], [0, 0, 1])
+    assert (y['site'], y['headcount'], y['turnover_rate']) == ('Y', [1, 0, 0], [0.0, None, None])
+
+
+def matrix_sheet(rows):
+    """A monthly turnover matrix as a sheet reads: a title header, then a month header row"""
+    return pd.DataFrame([['Column1', 'JAN', 'FEB', 'MAR']] + rows,
+                        columns=['Unnamed: 1', 'Unnamed: 2', 'Unnamed: 3', 'Unnamed: 4'])
+
+
+def test_turnover_matrix_by_hand():
+    sheets = {
+        'EU Totals': matrix_sheet([
+            ['Direct Labour Voluntary Turnover ', 1, 4, 0],
+            ['Total Headcount', 100, 110, 0],
+            ['Total Variance', 2, 11, 5],
+            # The workbook repeats its totals excluding temps; the first label wins
+            ['Total Headcount Exluding Temps', 90, 99, 0],
+            ['Total Variance', 99, 99, 99],
+        ]),
+        'PAGO': matrix_sheet([
+            ['Direct Labour Headcount', 50, 60, None],
+            ['Salaried Headcount', 40, 40, None],
+            ['Direct Labour Total Turnover', 1, 4, None],
+            ['Salaried Total Turnover', 1, 5, None],
+        ]),
+    }
+    sheets['Sheet2'] = sheets['PAGO'].copy()
+    parts = []
+    for name, sheet in sheets.items():
+        dataset, mapping = hr_kpis.detect_dataset(sheet.columns, name, sheet, '2025_EU_Turnover_FY2025.xlsx')
+        assert dataset == 'turnover_summary' and mapping['year'] == 2025
+        parts.append(hr_kpis.project_dataset(sheet, mapping, name))
+    frame = pd.concat(parts, ignore_index=True)
+
+    # March has no headcount anywhere, so the period ends in February
+    result = hr_kpis.turnover_matrix(frame, months=2)
+    assert result['months'] == ['2025-01', '2025-02'] and result['aggregated']
+    total = result['total']
+    assert total['headcount'] == [100, 110] and total['leavers'] == [2, 11] and total['voluntary'] == [1, 4]
+    assert total['joiners'] == [None, None]
+    assert total['turnover_rate'] == [0.02, 0.1]
+    assert total['annualized_turnover'] == pytest.approx(13 / 105 * 12 / 2)
+    # Sheet2 repeats PAGO's cells, so it is dropped; PAGO has no total rows, so its categories are summed
+    [pago] = result['sites']
+    assert (pago['site'], pago['headcount'], pago['leavers']) == ('PAGO', [90, 100], [2, 9])
+    assert pago['annualized_turnover'] == pytest.approx(11 / 95 * 12 / 2)
+
+    # An unreported month in the period: its leavers are ignored and it is left out of the average
+    result = hr_kpis.turnover_matrix(frame, months=3, as_of='2025-03-31')
+    assert result['total']['headcount'] == [100, 110, 0] and result['total']['leavers'] == [2, 11, 0]
+    assert result['total']['turnover_rate'] == [0.02, 0.1, None]
+    assert result['total']['annualized_turnover'] == pytest.approx(13 / 105 * 12 / 2)
+
+
+def test_turnover_matrix_needs_a_year():
+    sheet = matrix_sheet([['Total Headcount', 100, 110, 120], ['Total Variance', 1, 2, 3]])
+    dataset, mapping = hr_kpis.detect_dataset(sheet.columns, 'Turnover', sheet, 'turnover.xlsx')
+    assert dataset == 'turnover_summary' and mapping['year'] is None
+    assert hr_kpis.turnover_matrix(hr_kpis.project_dataset(sheet, mapping, 'Turnover')) is None
+
+
+def test_sick_leave_spells_by_hand():
+    frame = pd.DataFrame({
+        'employee': ['A', 'A', 'A', 'A', 'B', 'B'],
+        'date': pd.to_datetime(['2025-03-06', '2025-03-07', '2025-03-10', '2025-03-12', '2025-03-04', '2025-03-06']),
+        'site': ['X', 'X', 'X', 'X', 'Y', 'Y'],
+    })
+    # Y has a holiday on Wednesday 5 March; X's headcount is known, Y is rated against its one sick employee
+    result = hr_kpis.sick_leave_spells(frame, holidays={'Y': ['2025-03-05']}, short_term_days={'default': 3},
+                                       headcount={'X': 10})
+    # A: Thu-Mon across the weekend (5 calendar days, 3 working: long-term), then Wed 12 after a working
+    # Tuesday; B: Tue-Thu across the holiday (3 calendar days, 2 working: short-term)
+    assert (result['first'], result['last'], result['rows']) == ('2025-03-04', '2025-03-12', 6)
+    assert (result['spells'], result['employees'], result['rate_basis']) == (3, 2, 'headcount')
+    total = result['total']
+    assert (total['spells'], total['days'], total['average_length']) == (3, 6.0, 2.0)
+    assert (total['short_term_spells'], total['long_term_spells']) == (2, 1)
+    assert (total['short_term_days'], total['long_term_days']) == (3.0, 3.0)
+    # 4 to 12 March: 7 working days at X, 6 at Y
+    assert total['absence_rate'] == pytest.approx(6 / (10 * 7 + 1 * 6))
+    x, y = result['sites']
+    assert (x['site'], x['spells'], x['days'], x['absence_rate']) == ('X', 2, 4.0, pytest.approx(4 / 70))
+    assert (y['site'], y['spells'], y['days'], y['absence_rate']) == ('Y', 1, 2.0, pytest.approx(2 / 6))
+
+
+def test_aggregated_sick_leave_gets_a_note(app_config):
+    rates = pd.DataFrame({'Month': pd.to_datetime(['2025-01-01', '2025-02-01']),
+                          'WC ST': [0.01, 0.02], 'BC ST': [0.03, 0.04]})
+    analysis = m.analyze_excel_data({'stats.xlsx': {'PAGO sick leave': rates}})
+    assert 'sick_leave' not in analysis['hr_kpis']
+    assert analysis['notes']['sick_leave'].startswith('Not available for aggregated input')
+    assert 'PAGO sick leave' in analysis['notes']['sick_leave']
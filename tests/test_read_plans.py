@@ -0,0 +1,68 @@
+import io
+import json
+import os
+
+import pandas as pd
+
+import HRmontlyreport as m
+from conftest import workbook_bytes
+
+TITLE = ['Monthly turnover', None, None]
+HEADER = ['Site', 'JUN', 'JUL']
+
+
+def propose_and_register(rows):
+    """Propose a plan from rows' only sheet, register it and return it"""
+    excel_file = pd.ExcelFile(io.BytesIO(workbook_bytes({'PAGO': rows})))
+    _, layout = m.read_sheet(excel_file, 'PAGO')
+    assert layout['plan'] == 'proposed'
+    assert m.register_read_plan(layout['fingerprint'])
+    return m.load_read_plans()[layout['fingerprint']]
+
+
+def test_proposed_numeric_columns_are_float64(app_config):
+    plan = propose_and_register([TITLE, HEADER, ['PAGO', 12, 14], ['PASI', 8, 9]])
+    assert plan['header'] == 1
+    assert plan['dtypes'] == {'JUN': 'float64', 'JUL': 'float64'}
+
+
+def test_plan_keeps_sheet_with_fractional_value(app_config):
+    propose_and_register([TITLE, HEADER, ['PAGO', 12, 14], ['PASI', 8, 9]])
+    sheets, timings = m.load_workbook_sheets(workbook_bytes({'PAGO': [TITLE, HEADER, ['PAGO', 12, 0.0123]]}))
+    assert timings['layouts']['PAGO']['plan'] == 'applied'
+    assert sheets['PAGO']['JUL'].tolist() == [0.0123]
+
+
+def test_legacy_int64_plan_keeps_fractions(app_config):
+    plan = propose_and_register([TITLE, HEADER, ['PAGO', 12, 14]])
+    plan['dtypes'] = {'JUN': 'Int64', 'JUL': 'Int64'}
+    path = os.path.join(app_config['READ_PLAN_FOLDER'], f"{plan['fingerprint']}.json")
+    with open(path, 'w') as f:
+        json.dump(plan, f)
+    m.read_plans_cache['stamp'] = None
+    
+    sheets, _ = m.load_workbook_sheets(workbook_bytes({'PAGO': [TITLE, HEADER, ['PAGO', 12, 0.0123], ['PASI', 'n/a', 9]]}))
+    df = sheets['PAGO']
+    assert str(df['JUN'].dtype) == 'Int64' and df['JUN'].isna().tolist() == [False, True]
+    assert df['JUL'].dtype == 'float64' and df['JUL'].tolist() == [0.0123, 9.0]
+
+
+def test_plan_that_does_not_fit_reads_sheet_untyped(app_config):
+    plan = propose_and_register([TITLE, HEADER, ['PAGO', 12, 14]])
+    plan['dtypes']['Site'] = 'int8'
+    path = os.path.join(app_config['READ_PLAN_FOLDER'], f"{plan['fingerprint']}.json")
+    with open(path, 'w') as f:
+        json.dump(plan, f)
+    m.read_plans_cache['stamp'] = None
+    
+    sheets, timings = m.load_workbook_sheets(workbook_bytes({'PAGO': [TITLE, HEADER, ['PAGO', 12, 14]]}))
+    assert timings['layouts']['PAGO']['plan'] == 'mismatch'
+    assert sheets['PAGO'].to_dict('list') == {'Site': ['PAGO'], 'JUN': [12], 'JUL': [14]}
+
+
+def test_frame_rows_matches_read_excel(app_config):
+    content = workbook_bytes({'Data': pd.DataFrame({'Employee': ['A1', 'B2', None], 'Days': [1, 2.5, None],
+                                                     'Start': pd.to_datetime(['2025-01-02', None, '2025-03-04'])})})
+    excel_file = pd.ExcelFile(io.BytesIO(content))
+    rows = excel_file.parse('Data', header=None, dtype=object, na_filter=False).values.tolist()
+    pd.testing.assert_frame_equal(m.frame_rows(rows, 0), excel_file.parse('Data'))
@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+
+import HRmontlyreport as m
+
+
+def merged_quantile_sketch(chunks, capacity):
+    sketch = m.QuantileSketch(capacity)
+    for chunk in chunks:
+        part = m.QuantileSketch(capacity)
+        part.update(chunk)
+        sketch.merge(part)
+    return sketch
+
+
+def test_quantile_merge_is_close_to_exact():
+    rng = np.random.default_rng(7)
+    values = rng.lognormal(2, 0.8, 40000)
+    sketch = merged_quantile_sketch(np.array_split(values, 9), capacity=200)
+    assert sketch.count == len(values)
+    assert sketch.min == values.min() and sketch.max == values.max()
+    assert np.isclose(sketch.total, values.sum())
+    for q in (0.1, 0.25, 0.5, 0.75, 0.9):
+        # Within one percentile point of the exact rank
+        rank = np.searchsorted(np.sort(values), sketch.quantile(q)) / len(values)
+        assert abs(rank - q) < 0.01
+
+
+def test_small_sketch_is_exact():
+    sketch = merged_quantile_sketch([[1.0, 2.0], [3.0, 4.0, 5.0]], capacity=100)
+    assert sketch.quantile(0.5) == np.quantile([1, 2, 3, 4, 5], 0.5)
+    counts, edges = sketch.histogram(5)
+    assert counts == list(np.histogram([1, 2, 3, 4, 5], bins=5, range=(1, 5))[0])
+
+
+def test_histogram_keeps_every_row():
+    rng = np.random.default_rng(3)
+    continuous = rng.normal(50, 10, 25000)
+    sketch = merged_quantile_sketch(np.array_split(continuous, 5), capacity=100)
+    counts, edges = sketch.histogram(15)
+    assert sum(counts) == len(continuous) and len(edges) == 16
+    exact, _ = np.histogram(continuous, bins=edges)
+    assert np.abs(np.array(counts) - exact).max() <= 0.02 * len(continuous)
+
+
+def test_discrete_histogram_is_exact():
+    rng = np.random.default_rng(5)
+    days = rng.integers(0, 31, 30000).astype(float)
+    sketch = merged_quantile_sketch(np.array_split(days, 6), capacity=100)
+    counts, edges = sketch.histogram(10)
+    assert counts == np.histogram(days, bins=edges)[0].tolist()
+
+
+def test_topk_merge_is_exact_while_within_capacity():
+    chunks = [pd.Series(['PAGO', 'PASI', 'PAGO']), pd.Series(['PARA', 'PAGO ']), pd.Series(['PASI'])]
+    sketch = m.TopKSketch(10)
+    for chunk in chunks:
+        part = m.TopKSketch(10)
+        part.update(chunk)
+        sketch.merge(part)
+    assert sketch.exact and sketch.total == 6
+    assert sketch.top(2) == {'PAGO': 3, 'PASI': 2}
+
+
+def test_topk_merge_respects_error_bound():
+    rng = np.random.default_rng(11)
+    values = pd.Series(rng.zipf(1.6, 20000) % 500).astype(str)
+    true_counts = values.value_counts()
+    sketch = m.TopKSketch(20)
+    for chunk in np.array_split(values, 8):
+        part = m.TopKSketch(20)
+        part.update(chunk)
+        sketch.merge(part)
+    assert sketch.total == len(values)
+    assert 0 < sketch.error_bound <= len(values) / 21
+    for key, count in sketch.counts.items():
+        assert count <= true_counts[key] <= count + sketch.error_bound
+    # Every value more frequent than the bound is still counted
+    assert set(true_counts[true_counts > sketch.error_bound].index) <= set(sketch.counts)